@@ -0,0 +1,104 @@
+"""
+Peak memory (RSS) of loading the upload plan, by plan size.
+
+Each measure runs in a fresh process, so ru_maxrss is the peak of that
+loading method alone. Usage:
+
+    python benchmarks/bench_plan_memory.py [size ...]
+"""
+
+import csv
+import resource
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+LIST_SIZE_DEFAULT = [10_000, 100_000, 1_000_000]
+LIST_METHOD = [
+    "baseline",
+    "to_dict",
+    "iter_upload_plan",
+    "UploadPlan",
+    "SqliteUploadPlan",
+]
+
+
+def create_plan(file_path_upload_plan: Path, size: int):
+
+    with open(file_path_upload_plan, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["file_output", "description", "sent"])
+        for n in range(size):
+            file_name = f"lesson_{n:07d}.mp4"
+            file_output = f"/mnt/archive/course_{n // 1000:04d}/{file_name}"
+            writer.writerow([file_output, file_name, n % 2])
+
+
+def get_peak_rss_mib():
+
+    # ru_maxrss is in KiB on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_method(method: str, file_path_upload_plan: Path):
+
+    import pandas as pd
+
+    from tgsender import plan
+
+    if method == "to_dict":
+        data = pd.read_csv(file_path_upload_plan).to_dict("records")
+        count = len(data)
+    elif method == "iter_upload_plan":
+        count = sum(1 for _ in plan.iter_upload_plan(file_path_upload_plan))
+    elif method == "UploadPlan":
+        count = len(plan.UploadPlan(file_path_upload_plan, compact_every=0))
+    elif method == "SqliteUploadPlan":
+        upload_plan = plan.SqliteUploadPlan(file_path_upload_plan)
+        count = sum(1 for _ in upload_plan.iter_records())
+        upload_plan.close()
+    else:
+        count = 0
+    print(f"{get_peak_rss_mib():.1f} {count}")
+
+
+def measure(method: str, file_path_upload_plan: Path) -> float:
+
+    output = subprocess.run(
+        [
+            sys.executable,
+            __file__,
+            "--run",
+            method,
+            str(file_path_upload_plan),
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return float(output.split()[0])
+
+
+def main(list_size):
+
+    print(f"{'rows':>10}" + "".join(f"{m:>20}" for m in LIST_METHOD))
+    with tempfile.TemporaryDirectory() as folder_path:
+        for size in list_size:
+            file_path_upload_plan = Path(folder_path) / "upload_plan.csv"
+            create_plan(file_path_upload_plan, size)
+            list_peak = [
+                measure(method, file_path_upload_plan)
+                for method in LIST_METHOD
+            ]
+            print(
+                f"{size:>10}"
+                + "".join(f"{peak:>16.1f} MiB" for peak in list_peak)
+            )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--run":
+        run_method(sys.argv[2], Path(sys.argv[3]))
+    else:
+        main([int(arg) for arg in sys.argv[1:]] or LIST_SIZE_DEFAULT)
@@ -0,0 +1,72 @@
+"""Tests for `tgsender.api_async.album` module."""
+
+import asyncio
+from types import SimpleNamespace
+
+from pyrogram import errors
+
+from tgsender.api_async.album import iter_albums, send_album
+from tgsender.plan import PlanRow
+
+
+def make_item(index, file_output, album=None):
+
+    extra = None if album is None else {"album": album}
+    return index, PlanRow(file_output, f"caption {index}", extra=extra)
+
+
+def test_albums_group_consecutive_compatible_items():
+
+    list_item = [
+        make_item(0, "0.jpg", "a"),
+        make_item(1, "1.mp4", "a"),
+        make_item(2, "2.mp3", "a"),
+        make_item(3, "3.mp3", "a"),
+        make_item(4, "4.jpg"),
+        make_item(5, "5.jpg", ""),
+        make_item(6, "6.jpg", "b"),
+        make_item(7, "7.jpg", "c"),
+    ]
+    list_album = [
+        [index for index, _ in list_album_item]
+        for list_album_item in iter_albums(list_item)
+    ]
+    # photos and videos share albums, audio only with audio
+    assert list_album == [[0, 1], [2, 3], [4], [5], [6], [7]]
+
+
+def test_albums_are_split_by_max_items():
+
+    list_item = [make_item(n, f"{n}.jpg", "a") for n in range(23)]
+    list_size = [len(album) for album in iter_albums(list_item)]
+    assert list_size == [10, 10, 3]
+    list_size = [len(album) for album in iter_albums(list_item, max_items=1)]
+    assert list_size == [1] * 23
+
+
+def test_album_deadline_leaves_out_flood_wait(tmp_path):
+
+    list_dict_file_data = []
+    for index in range(2):
+        file_path = tmp_path / f"{index}.txt"
+        file_path.write_text("content")
+        list_dict_file_data.append(
+            {"file_output": str(file_path), "description": f"caption {index}"}
+        )
+    list_call = []
+
+    async def send_media_group(chat_id, media):
+
+        list_call.append(media)
+        if len(list_call) == 1:
+            raise errors.FloodWait(value=1)
+        return [f"message {index}" for index in range(len(media))]
+
+    app = SimpleNamespace(
+        name="test-album-flood-wait", send_media_group=send_media_group
+    )
+    list_message = asyncio.run(
+        send_album(app, list_dict_file_data, "me", min_deadline=0.3)
+    )
+    assert list_message == ["message 0", "message 1"]
+    assert len(list_call) == 2
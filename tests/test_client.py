@@ -0,0 +1,87 @@
+"""Tests for `tgsender.client` package."""
+
+import asyncio
+
+import pytest
+from pyrogram.sync import async_to_sync
+
+from tgsender import client
+
+
+class FakeClient:
+    """Stand-in of pyrogram.Client, counting connections"""
+
+    count_start = 0
+
+    def __init__(self, *args, **kwargs):
+
+        self.loop = asyncio.get_event_loop()
+        self.is_connected = False
+
+    async def start(self):
+
+        FakeClient.count_start += 1
+        self.loop = asyncio.get_running_loop()
+        self.is_connected = True
+        return self
+
+    async def stop(self):
+
+        self.is_connected = False
+        return self
+
+    async def send_message(self, chat_id, text):
+
+        assert asyncio.get_running_loop() is self.loop
+        return text
+
+
+# same sync wrapping pyrogram applies to its Client methods
+for name in ["start", "stop", "send_message"]:
+    async_to_sync(FakeClient, name)
+
+
+@pytest.fixture
+def session(monkeypatch):
+
+    FakeClient.count_start = 0
+    monkeypatch.setattr(
+        client.session, "create_client", lambda *a, **k: FakeClient()
+    )
+    client_session = client.ClientSession()
+    yield client_session
+    client_session.stop()
+
+
+def test_sync_calls_share_client(session):
+
+    app = session.get()
+    assert app.send_message("me", "a") == "a"
+    assert session.get() is app
+    assert FakeClient.count_start == 1
+
+
+def test_async_api_reuse_sync_client(session):
+
+    app = session.get()
+
+    async def setup_channel():
+        app_async = await session.get_async()
+        return app_async, await app_async.send_message("me", "b")
+
+    # asyncio.run elsewhere does not break the shared client
+    asyncio.run(asyncio.sleep(0))
+    app_async, text = session.run(setup_channel())
+    assert app_async is app
+    assert text == "b"
+    assert session.get().send_message("me", "c") == "c"
+    assert FakeClient.count_start == 1
+
+
+def test_reconnect_disconnected_client(session):
+
+    app = session.get()
+    app.is_connected = False
+    assert session.get() is app
+    assert app.is_connected
+    assert FakeClient.count_start == 2
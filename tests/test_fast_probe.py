@@ -0,0 +1,102 @@
+"""Tests for `tgsender.mediainfo.fast_probe` module."""
+
+import struct
+
+from tgsender import mediainfo
+
+
+def make_box(box_type, payload):
+
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def make_mp4(width, height, timescale, duration, fragmented=False):
+
+    mvhd = bytes(12) + struct.pack(">II", timescale, duration) + bytes(80)
+    tkhd = bytes(76) + struct.pack(">II", width << 16, height << 16)
+    hdlr = bytes(8) + b"vide" + bytes(12)
+    trak = make_box(b"tkhd", tkhd) + make_box(b"mdia", make_box(b"hdlr", hdlr))
+    moov = make_box(b"mvhd", mvhd) + make_box(b"trak", trak)
+    if fragmented:
+        moov += make_box(b"mvex", bytes(8))
+    # moov after the media data, as in files without faststart
+    return (
+        make_box(b"ftyp", b"isom" + bytes(4))
+        + make_box(b"mdat", bytes(5000))
+        + make_box(b"moov", moov)
+    )
+
+
+def make_id3_frame(frame_id, text):
+
+    data = b"\x03" + text.encode("utf-8")
+    return frame_id + struct.pack(">I", len(data)) + bytes(2) + data
+
+
+def test_mp4_dimensions_and_duration(tmp_path):
+
+    file_path = tmp_path / "video.mp4"
+    file_path.write_bytes(make_mp4(1280, 720, 1000, 12500))
+
+    assert mediainfo.fast_probe(file_path) == {
+        "width": 1280,
+        "height": 720,
+        "duration_us": 12_500_000,
+    }
+    assert mediainfo.get_video_metadata(file_path) == {
+        "width": 1280,
+        "height": 720,
+        "duration": 12,
+    }
+
+
+def test_mp4_unknown_duration_is_left_to_ffprobe(tmp_path):
+
+    file_path = tmp_path / "video.mp4"
+    for data in [
+        make_mp4(1280, 720, 1000, 0),
+        make_mp4(1280, 720, 1000, 0xFFFFFFFF),
+        make_mp4(1280, 720, 1000, 12500, fragmented=True),
+    ]:
+        file_path.write_bytes(data)
+        assert mediainfo.fast_probe(file_path) is None
+
+
+def test_mp3_tags_and_vbr_duration(tmp_path):
+
+    tag = make_id3_frame(b"TPE1", "Artist") + make_id3_frame(b"TIT2", "Song")
+    tag_size = bytes([(len(tag) >> shift) & 0x7F for shift in [21, 14, 7, 0]])
+    # MPEG 1 layer III, 128 kbps, 44100 Hz, stereo, with Xing header
+    frame = b"\xff\xfb\x90\x00" + bytes(32)
+    frame += b"Xing" + struct.pack(">II", 1, 100) + bytes(400)
+    file_path = tmp_path / "audio.mp3"
+    file_path.write_bytes(b"ID3\x03\x00\x00" + tag_size + tag + frame)
+
+    assert mediainfo.fast_probe(file_path) == {
+        "performer": "Artist",
+        "title": "Song",
+        "duration_us": 100 * 1152 * 1_000_000 // 44100,
+    }
+    assert mediainfo.get_audio_metadata(file_path) == {
+        "performer": "Artist",
+        "title": "Song",
+        "duration": 2,
+    }
+
+
+def test_mp3_cbr_duration_without_id3v1_tag(tmp_path):
+
+    # MPEG 1 layer III, 128 kbps, 44100 Hz, stereo, without Xing header
+    audio = b"\xff\xfb\x90\x00" + bytes(16000 - 4)
+    tag = b"TAG" + b"Song".ljust(30, b"\x00") + bytes(95)
+    file_path = tmp_path / "audio.mp3"
+    file_path.write_bytes(audio + tag)
+
+    assert mediainfo.fast_probe(file_path) == {"duration_us": 1_000_000}
+
+
+def test_unknown_container_is_left_to_ffprobe(tmp_path):
+
+    file_path = tmp_path / "video.mkv"
+    file_path.write_bytes(bytes(100))
+    assert mediainfo.fast_probe(file_path) is None
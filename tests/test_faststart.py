@@ -0,0 +1,50 @@
+"""Tests for `tgsender.mediainfo.faststart` module."""
+
+import shutil
+
+from tgsender import mediainfo
+from tgsender.mediainfo import faststart
+
+from .test_fast_probe import make_box, make_mp4
+
+
+def test_is_faststart(tmp_path):
+
+    file_path = tmp_path / "video.mp4"
+    file_path.write_bytes(make_mp4(640, 360, 1000, 5000))
+    assert mediainfo.is_faststart(file_path) is False
+
+    file_path.write_bytes(
+        make_box(b"ftyp", bytes(8))
+        + make_box(b"moov", bytes(8))
+        + make_box(b"mdat", bytes(8))
+    )
+    assert mediainfo.is_faststart(file_path) is True
+    assert mediainfo.is_faststart(tmp_path / "video.mkv") is None
+
+
+def test_remux_copy_is_discarded(tmp_path, monkeypatch):
+
+    list_remux = []
+
+    def fake_remux_faststart(file_path, file_path_output):
+        list_remux.append(file_path)
+        file_path_output.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy(file_path, file_path_output)
+        return file_path_output
+
+    monkeypatch.setattr(faststart, "remux_faststart", fake_remux_faststart)
+    file_path = tmp_path / "video.mp4"
+    file_path.write_bytes(make_mp4(640, 360, 1000, 5000))
+
+    assert mediainfo.get_faststart_file(file_path) is None
+    faststart.configure_faststart(True, tmp_path / "faststart")
+    try:
+        file_path_output = mediainfo.get_faststart_file(file_path)
+        assert file_path_output.endswith("video.mp4")
+        assert list_remux == [file_path]
+
+        mediainfo.discard_faststart_file(file_path_output)
+        assert list((tmp_path / "faststart").iterdir()) == []
+    finally:
+        faststart.configure_faststart()
@@ -0,0 +1,134 @@
+"""Tests for `tgsender.client.file_index` module."""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+from pyrogram import errors
+
+from tgsender import client, utils
+from tgsender.api_async import api_telegram
+
+
+def test_duplicate_found_by_content(tmp_path):
+
+    file_index = client.FileIndex(tmp_path / "file_index.sqlite")
+    content = bytes(range(256)) * 1024
+    file_path_sent = tmp_path / "a" / "lesson.mp4"
+    file_path_sent.parent.mkdir()
+    file_path_sent.write_bytes(content)
+    file_index.add(file_path_sent, "file_id_a", "user")
+
+    # same content under another name
+    file_path_copy = tmp_path / "b" / "copy.mp4"
+    file_path_copy.parent.mkdir()
+    file_path_copy.write_bytes(content)
+    content_hash = file_index.get_content_hash(file_path_copy)
+    assert content_hash == client.get_content_hash(file_path_sent)
+    assert file_index.find_file_id(content_hash, "user") == "file_id_a"
+    # file_ids are valid only for the account that uploaded the file
+    assert file_index.find_file_id(content_hash, "other") is None
+
+    # same size, other content in the middle
+    file_path_other = tmp_path / "b" / "other.mp4"
+    file_path_other.write_bytes(content[:100000] + b"x" + content[100001:])
+    assert file_index.get_content_hash(file_path_other) is None
+    file_path_other.write_bytes(content[:1000])
+    assert file_index.get_content_hash(file_path_other) is None
+
+    file_index.forget_file_id("file_id_a", "other")
+    assert file_index.find_file_id(content_hash, "user") == "file_id_a"
+    file_index.forget_file_id("file_id_a", "user")
+    assert file_index.find_file_id(content_hash, "user") is None
+    file_index.close()
+
+
+def test_file_sent_before_is_hashed_once(tmp_path, monkeypatch):
+
+    from tgsender.client import file_index as module_file_index
+
+    file_index = client.FileIndex(tmp_path / "file_index.sqlite")
+    file_path = tmp_path / "lesson.mp4"
+    file_path.write_bytes(bytes(range(256)) * 1024)
+    file_index.add(file_path, "file_id_a", "user")
+    list_hashed = []
+    get_content_hash = module_file_index.get_content_hash
+
+    def counted_get_content_hash(file_path):
+        list_hashed.append(file_path)
+        return get_content_hash(file_path)
+
+    monkeypatch.setattr(
+        module_file_index, "get_content_hash", counted_get_content_hash
+    )
+    content_hash = file_index.get_content_hash(file_path)
+    assert content_hash == get_content_hash(file_path)
+    assert file_index.get_content_hash(file_path) == content_hash
+    assert len(list_hashed) == 1
+    file_index.close()
+
+
+def test_message_file_id():
+
+    message = SimpleNamespace(video=None, photo=SimpleNamespace(file_id="p"))
+    assert client.get_message_file_id(message) == "p"
+    assert client.get_message_file_id(SimpleNamespace()) is None
+
+
+def test_index_log_sent(tmp_path):
+
+    folder_path_log_sent = tmp_path / "log_sent"
+    folder_path_log_sent.mkdir()
+    file_path = tmp_path / "lesson.mp4"
+    message = {
+        "_": "Message",
+        "id": 7,
+        "chat": {"_": "Chat", "id": -1001},
+        "date": "2024-01-01 10:00:00",
+        "video": {"_": "Video", "file_id": "file_id_7"},
+    }
+    utils.log_send_return(
+        json.dumps(message), file_path, folder_path_log_sent / "0-lesson.json"
+    )
+
+    file_index = client.FileIndex(tmp_path / "file_index.sqlite")
+    assert file_index.index_log_sent(folder_path_log_sent) == 1
+    # files already indexed are skipped
+    assert file_index.index_log_sent(folder_path_log_sent) == 0
+
+    assert file_index.find_sent_file_id(file_path) == "file_id_7"
+    list_sent = file_index.find_sent(chat_id=-1001, message_id=7)
+    assert list_sent[0]["file_path"] == str(file_path)
+    assert file_index.find_sent(file_path=file_path, chat_id=-1002) == []
+    file_index.close()
+
+
+def test_duplicate_not_sent_by_file_id_is_uploaded(tmp_path):
+
+    file_index = client.FileIndex(tmp_path / "file_index.sqlite")
+    file_path = tmp_path / "lesson.mp4"
+    file_path.write_bytes(bytes(range(256)) * 1024)
+    file_index.add(file_path, "file_id_a", "user")
+    content_hash = file_index.get_content_hash(file_path)
+    list_error = [errors.MediaEmpty(), errors.FileReferenceExpired()]
+
+    async def send_cached_media(*args, **kwargs):
+        raise list_error.pop(0)
+
+    app = SimpleNamespace(name="user", send_cached_media=send_cached_media)
+    dict_file_data = {"file_output": str(file_path), "description": ""}
+
+    def send_file_by_file_id():
+        return asyncio.run(
+            api_telegram.send_file_by_file_id(
+                app, dict_file_data, "me", file_index
+            )
+        )
+
+    # not about the file_id. Uploaded, and the file_id is kept
+    assert send_file_by_file_id() is None
+    assert file_index.find_file_id(content_hash, "user") == "file_id_a"
+    # file_id refused. Uploaded, and the file_id is forgotten
+    assert send_file_by_file_id() is None
+    assert file_index.find_file_id(content_hash, "user") is None
+    file_index.close()
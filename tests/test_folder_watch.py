@@ -0,0 +1,26 @@
+"""Tests for `tgsender.utils.folder_watch` module."""
+
+from tgsender.utils import FolderWatcher
+
+
+def test_files_are_reported_once_stable(tmp_path):
+
+    (tmp_path / "sent.txt").write_text("content")
+    (tmp_path / "download.part").write_text("content")
+    watcher = FolderWatcher(
+        tmp_path,
+        stable_seconds=0,
+        set_known={str(tmp_path / "sent.txt")},
+        use_events=False,
+    )
+    with watcher:
+        (tmp_path / "sub").mkdir()
+        file_path = tmp_path / "sub" / "new.txt"
+        file_path.write_text("con")
+        # first seen, not stable yet
+        assert watcher.poll() == []
+        file_path.write_text("content")
+        assert watcher.poll() == []
+        assert watcher.poll() == [file_path]
+        # reported only once
+        assert watcher.poll() == []
@@ -0,0 +1,49 @@
+"""Import time guard: `import tgsender` must not load heavy dependencies."""
+
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ["pandas", "pyrogram", "pyautogui", "pyperclip", "numpy"]
+# microseconds. Generous limit, to catch only real regressions
+IMPORT_TIME_LIMIT = 1_000_000
+
+
+def get_import_times(statement):
+    """Run statement with `python -X importtime`
+
+    Returns:
+        dict[str, int]: module name: cumulative import time in microseconds
+    """
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    dict_import_time = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        dict_import_time[name.strip()] = int(cumulative)
+    return dict_import_time
+
+
+@pytest.mark.parametrize(
+    "statement", ["import tgsender", "import tgsender.cli"]
+)
+def test_import_without_heavy_dependencies(statement):
+
+    dict_import_time = get_import_times(statement)
+    set_top_module = {name.split(".")[0] for name in dict_import_time}
+    for module in HEAVY_MODULES:
+        assert module not in set_top_module
+
+
+def test_import_time():
+
+    dict_import_time = get_import_times("import tgsender.cli")
+    assert dict_import_time["tgsender.cli"] < IMPORT_TIME_LIMIT
@@ -0,0 +1,185 @@
+"""Tests for `tgsender.plan` package."""
+
+import pandas as pd
+import pytest
+
+from tgsender import plan
+
+
+@pytest.fixture
+def upload_plan_path(tmp_path):
+
+    file_path_upload_plan = tmp_path / "upload_plan.csv"
+    df = pd.DataFrame(
+        {
+            "file_output": [str(tmp_path / f"{n}.txt") for n in range(5)],
+            "description": [f"{n}.txt" for n in range(5)],
+            "sent": [0] * 5,
+        }
+    )
+    df.to_csv(file_path_upload_plan, index=False)
+    return file_path_upload_plan
+
+
+def test_journal_replay(upload_plan_path, tmp_path):
+
+    journal = plan.SentJournal(upload_plan_path, compact_every=0)
+    journal.append(tmp_path / "1.txt")
+    journal.append(tmp_path / "3.txt")
+
+    # the csv itself is untouched until compaction
+    df = pd.read_csv(upload_plan_path)
+    assert df["sent"].sum() == 0
+
+    df = journal.replay(df)
+    assert df["sent"].tolist() == [0, 1, 0, 1, 0]
+
+
+def test_journal_ignore_torn_line(upload_plan_path, tmp_path):
+
+    journal = plan.SentJournal(upload_plan_path, compact_every=0)
+    journal.append(tmp_path / "0.txt")
+    with open(journal.journal_path, "a", encoding="utf-8") as file:
+        file.write('{"file_output": "')
+
+    assert len(journal.read()) == 1
+
+
+def test_journal_compact(upload_plan_path, tmp_path):
+
+    journal = plan.SentJournal(upload_plan_path, compact_every=2)
+    journal.append(tmp_path / "0.txt")
+    assert journal.journal_path.exists()
+    journal.append(tmp_path / "4.txt")
+
+    assert not journal.journal_path.exists()
+    df = pd.read_csv(upload_plan_path)
+    assert df["sent"].tolist() == [1, 0, 0, 0, 1]
+
+
+def test_upload_plan_cursor(upload_plan_path, tmp_path):
+
+    upload_plan = plan.UploadPlan(upload_plan_path, compact_every=0)
+    index, dict_file_data = upload_plan.get_next()
+    assert index == 0
+
+    upload_plan.mark_sent(dict_file_data["file_output"])
+    upload_plan.mark_sent(str(tmp_path / "1.txt"))
+    index, dict_file_data = upload_plan.get_next()
+    assert index == 2
+    assert dict_file_data["file_output"] == str(tmp_path / "2.txt")
+
+    # marks survive a restart through the journal
+    upload_plan = plan.UploadPlan(upload_plan_path, compact_every=0)
+    assert upload_plan.get_next()[0] == 2
+
+
+def test_upload_plan_reload_manual_edit(upload_plan_path):
+
+    upload_plan = plan.UploadPlan(upload_plan_path, compact_every=0)
+    df = pd.read_csv(upload_plan_path)
+    df.loc[[0, 1, 2], "sent"] = 1
+    df.to_csv(upload_plan_path, index=False)
+    upload_plan.mtime_ns = 0
+
+    assert upload_plan.get_next()[0] == 3
+
+
+def test_upload_plan_all_sent(upload_plan_path, tmp_path):
+
+    upload_plan = plan.UploadPlan(upload_plan_path, compact_every=3)
+    for n in range(5):
+        upload_plan.mark_sent(str(tmp_path / f"{n}.txt"))
+
+    assert upload_plan.get_next() == (0, False)
+    upload_plan.compact()
+    assert pd.read_csv(upload_plan_path)["sent"].tolist() == [1] * 5
+
+
+def test_sqlite_plan_status(upload_plan_path, tmp_path):
+
+    upload_plan = plan.open_upload_plan(upload_plan_path, backend="sqlite")
+    assert len(upload_plan) == 5
+
+    file_output = str(tmp_path / "0.txt")
+    upload_plan.mark_in_flight(file_output)
+    # items left in flight are sent again
+    assert upload_plan.get_next()[0] == 0
+    upload_plan.mark_sent(file_output, message_id=10)
+    upload_plan.mark_failed(str(tmp_path / "1.txt"), error="caption too long")
+
+    index, dict_file_data = upload_plan.get_next()
+    assert index == 2
+    record = upload_plan.get_record(file_output)
+    assert record["attempts"] == 1
+    assert record["message_id"] == 10
+    assert record["sent"] == 1
+    # failed items are kept as dead letters
+    list_failed = upload_plan.get_failed()
+    assert [d["file_output"] for d in list_failed] == [str(tmp_path / "1.txt")]
+    upload_plan.close()
+
+
+def test_sqlite_plan_export_import(upload_plan_path, tmp_path):
+
+    upload_plan = plan.SqliteUploadPlan(upload_plan_path)
+    upload_plan.mark_sent(str(tmp_path / "4.txt"))
+    upload_plan.export_csv()
+
+    df = pd.read_csv(upload_plan_path)
+    assert df["sent"].tolist() == [0, 0, 0, 0, 1]
+    assert df["status"].tolist()[-1] == "sent"
+
+    # a new item added by hand keeps the state of the others
+    df.loc[len(df)] = [str(tmp_path / "5.txt"), "5.txt", 0] + [None] * 5
+    df.to_csv(upload_plan_path, index=False)
+    upload_plan.reload_if_changed()
+    assert len(upload_plan) == 6
+    assert upload_plan.get_record(str(tmp_path / "4.txt"))["sent"] == 1
+    upload_plan.close()
+
+
+def test_write_and_iter_upload_plan(tmp_path):
+
+    file_path_upload_plan = tmp_path / "upload_plan.csv"
+    list_file_path = [tmp_path / "a" / f"{n}.mp4" for n in range(3)]
+    plan.write_upload_plan(file_path_upload_plan, iter(list_file_path))
+
+    list_row = list(plan.iter_upload_plan(file_path_upload_plan, chunksize=2))
+    assert [row.path for row in list_row] == list_file_path
+    assert list_row[1]["description"] == "1.mp4"
+    assert list_row[1].get("sent") == 0
+    assert list_row[1].get("group") is None
+
+
+@pytest.mark.parametrize("backend", plan.PLAN_BACKENDS)
+def test_append_files(upload_plan_path, tmp_path, backend):
+
+    upload_plan = plan.open_upload_plan(upload_plan_path, backend=backend)
+    upload_plan.mark_sent(str(tmp_path / "0.txt"))
+    list_file_path = [tmp_path / "1.txt", tmp_path / "5.txt"]
+    list_record = upload_plan.append_files(list_file_path)
+    assert [record["file_output"] for record in list_record] == [
+        str(tmp_path / "5.txt")
+    ]
+    list_index = [index for index, _ in upload_plan.iter_pending()]
+    assert list_index == [1, 2, 3, 4, 5]
+
+    # the csv has the new item, and was not reloaded over the journal
+    assert upload_plan.reload_if_changed() is False
+    df = pd.read_csv(upload_plan_path)
+    assert df["file_output"].tolist()[-1] == str(tmp_path / "5.txt")
+
+
+def test_failed_item_is_not_sent_after_reload(upload_plan_path, tmp_path):
+
+    upload_plan = plan.UploadPlan(upload_plan_path)
+    upload_plan.mark_failed(str(tmp_path / "1.txt"), "Upload failed")
+
+    upload_plan = plan.UploadPlan(upload_plan_path)
+    record = upload_plan.get_record(str(tmp_path / "1.txt"))
+    assert record.sent == 0
+    assert record["status"] == "failed"
+    assert [record["file_output"] for record in upload_plan.get_failed()] == [
+        str(tmp_path / "1.txt")
+    ]
@@ -0,0 +1,48 @@
+"""Tests for `tgsender.api_async.prefetch` module."""
+
+import asyncio
+import threading
+import time
+
+from tgsender.api_async.prefetch import Prefetcher
+
+
+def make_prepare(list_prepared):
+    lock = threading.Lock()
+
+    def prepare(dict_file_data):
+        # later items are faster, so they finish out of order
+        time.sleep(0.05 / (1 + dict_file_data["n"]))
+        with lock:
+            list_prepared.append(dict_file_data["n"])
+        return dict(dict_file_data, ready=True)
+
+    return prepare
+
+
+def test_items_come_in_order_and_prepared_ahead():
+
+    list_prepared = []
+    list_item = [(n, {"file_output": f"{n}.mp4", "n": n}) for n in range(6)]
+    prefetcher = Prefetcher(
+        list_item, workers=3, lookahead=2, prepare=make_prepare(list_prepared)
+    )
+    with prefetcher:
+        index, dict_file_data = next(prefetcher)
+        assert index == 0 and dict_file_data["ready"]
+        # while item 0 is consumed, the next ones are already submitted
+        assert len(prefetcher.deque_future) == 2
+        list_index = [index for index, _ in prefetcher]
+    assert list_index == [1, 2, 3, 4, 5]
+    assert sorted(list_prepared) == list(range(6))
+
+
+def test_async_iteration():
+
+    list_item = [(n, {"file_output": f"{n}.mp4", "n": n}) for n in range(4)]
+    prefetcher = Prefetcher(list_item, prepare=make_prepare([]))
+
+    async def consume():
+        return [index async for index, _ in prefetcher]
+
+    assert asyncio.run(consume()) == [0, 1, 2, 3]
@@ -0,0 +1,101 @@
+"""Tests for `tgsender.mediainfo.preflight` module."""
+
+import pytest
+
+from tgsender import mediainfo, plan
+from tgsender.tgsender import iter_pending_valid, open_checked_upload_plan
+
+
+def test_preflight_marks_invalid_files(tmp_path):
+
+    (tmp_path / "0.txt").write_text("content")
+    (tmp_path / "2.txt").write_text("")
+    file_path_upload_plan = tmp_path / "upload_plan.csv"
+    plan.write_upload_plan(
+        file_path_upload_plan, [tmp_path / f"{n}.txt" for n in range(3)]
+    )
+
+    count_invalid = mediainfo.preflight_upload_plan(
+        file_path_upload_plan, workers=1
+    )
+    assert count_invalid == 2
+
+    upload_plan = plan.open_upload_plan(file_path_upload_plan)
+    record = upload_plan.get_record(str(tmp_path / "0.txt"))
+    assert record["type"] == "document"
+    assert int(record["size"]) == 7
+    assert int(record["valid"]) == 1
+
+    list_index = [index for index, _ in iter_pending_valid(upload_plan)]
+    assert list_index == [0]
+    list_failed = upload_plan.get_failed()
+    assert [record["error"] for record in list_failed] == [
+        list_failed[0]["preflight_error"],
+        "Empty file",
+    ]
+
+
+def test_plan_video_metadata():
+
+    record = {"width": 640.0, "height": "360", "duration": 12}
+    assert mediainfo.get_plan_video_metadata(record) == {
+        "width": 640,
+        "height": 360,
+        "duration": 12,
+    }
+    assert mediainfo.get_plan_video_metadata({"width": 640}) is None
+
+
+def test_preflight_checks_again_fixed_and_changed_files(tmp_path):
+
+    file_path_upload_plan = tmp_path / "upload_plan.csv"
+    plan.write_upload_plan(
+        file_path_upload_plan, [tmp_path / f"{n}.txt" for n in range(2)]
+    )
+    (tmp_path / "0.txt").write_text("content")
+    assert mediainfo.preflight_upload_plan(file_path_upload_plan, 1) == 1
+
+    # missing file restored
+    (tmp_path / "1.txt").write_text("content")
+    assert mediainfo.preflight_upload_plan(file_path_upload_plan, 1) == 0
+
+    # nothing to check. The plan is not rewritten
+    mtime_ns = file_path_upload_plan.stat().st_mtime_ns
+    assert mediainfo.preflight_upload_plan(file_path_upload_plan, 1) == 0
+    assert file_path_upload_plan.stat().st_mtime_ns == mtime_ns
+
+    # file replaced
+    (tmp_path / "0.txt").write_text("new content")
+    assert mediainfo.preflight_upload_plan(file_path_upload_plan, 1) == 0
+    upload_plan = plan.open_upload_plan(file_path_upload_plan)
+    assert int(upload_plan.get_record(str(tmp_path / "0.txt"))["size"]) == 11
+
+
+@pytest.mark.parametrize("backend", plan.PLAN_BACKENDS)
+def test_fixed_file_is_sent_by_next_run(tmp_path, backend):
+
+    file_path_upload_plan = tmp_path / "upload_plan.csv"
+    plan.write_upload_plan(
+        file_path_upload_plan, [tmp_path / f"{n}.txt" for n in range(2)]
+    )
+    (tmp_path / "0.txt").write_text("content")
+    dict_config = {"plan_backend": backend, "preflight_workers": 1}
+
+    def run():
+        upload_plan = open_checked_upload_plan(tmp_path, dict_config)
+        list_index = []
+        for index, dict_file_data in iter_pending_valid(upload_plan):
+            list_index.append(index)
+            upload_plan.mark_sent(dict_file_data["file_output"])
+        if backend == "sqlite":
+            upload_plan.close()
+        return list_index
+
+    # missing file marked as failed
+    assert run() == [0]
+    assert run() == []
+
+    (tmp_path / "1.txt").write_text("content")
+    assert run() == [1]
+    upload_plan = plan.open_upload_plan(file_path_upload_plan, backend)
+    assert upload_plan.get_failed() == []
@@ -0,0 +1,56 @@
+"""Tests for `tgsender.mediainfo.probe_cache` module."""
+
+import os
+
+from tgsender.mediainfo import probe_cache
+from tgsender.mediainfo.ffprobe_micro import FFProbeResult
+
+OUTPUT = (
+    '{"streams": [{"codec_type": "audio"}, '
+    '{"width": 640, "height": 360}], "format": {"duration": "12.5"}}'
+)
+
+
+def test_probe_once_and_invalidate_on_change(tmp_path, monkeypatch):
+
+    list_call = []
+
+    def fake_ffprobe(file_path, ffprobe_format="json"):
+        list_call.append(file_path)
+        return FFProbeResult(0, OUTPUT, "", ffprobe_format)
+
+    monkeypatch.setattr(probe_cache, "ffprobe", fake_ffprobe)
+    probe_cache.configure_probe_cache(True, tmp_path / "cache.sqlite")
+    file_path = tmp_path / "video.mp4"
+    file_path.write_bytes(b"0" * 10)
+    try:
+        dict_metadata = probe_cache.get_video_metadata(file_path)
+        assert dict_metadata == {"width": 640, "height": 360, "duration": 12}
+        probe_cache.get_video_metadata(file_path)
+        assert len(list_call) == 1
+
+        # a file changed since probed is probed again
+        file_path.write_bytes(b"0" * 20)
+        probe_cache.get_video_metadata(file_path)
+        assert len(list_call) == 2
+    finally:
+        probe_cache.configure_probe_cache()
+
+
+def test_prune_keeps_recently_used(tmp_path):
+
+    cache = probe_cache.ProbeCache(tmp_path / "cache.sqlite", max_entries=2)
+    list_file_path = []
+    for n in range(3):
+        file_path = tmp_path / f"{n}.mp4"
+        file_path.write_bytes(b"0")
+        os.utime(file_path, (n, n))
+        cache.put(file_path, "json", OUTPUT)
+        list_file_path.append(file_path)
+    cache.get(list_file_path[0])
+    cache.prune()
+
+    assert cache.get(list_file_path[0]) == OUTPUT
+    assert cache.get(list_file_path[1]) is None
+    assert cache.get(list_file_path[2]) == OUTPUT
+    cache.close()
@@ -0,0 +1,44 @@
+"""Tests for `tgsender.utils.rate_limit` module."""
+
+import asyncio
+import time
+
+from pyrogram.errors import FloodWait
+
+from tgsender.utils.rate_limit import RateLimiter, TokenBucket
+
+
+def test_bucket_paces_after_burst():
+
+    bucket = TokenBucket(rate_per_minute=600, burst=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    # 10 tokens by second. Third request waits about 0.1s
+    assert 0.05 < bucket.reserve() <= 0.1
+
+
+def test_flood_wait_is_honoured_and_retried(monkeypatch):
+
+    rate_limiter = RateLimiter({"upload": (6000, 10)})
+    list_sleep = []
+
+    async def fake_sleep(seconds):
+        list_sleep.append(seconds)
+        # move the clock, as a real sleep would
+        monkeypatch.setattr(time, "monotonic", lambda: now + sum(list_sleep))
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    monkeypatch.setattr(asyncio, "sleep", fake_sleep)
+    list_call = []
+
+    async def request():
+        list_call.append(1)
+        if len(list_call) == 1:
+            raise FloodWait(value=7)
+        return "sent"
+
+    result = asyncio.run(rate_limiter.call_async("upload", request))
+    assert result == "sent"
+    assert len(list_call) == 2
+    assert list_sleep == [7]
@@ -0,0 +1,62 @@
+"""Tests for `tgsender.utils.retry` module."""
+
+import pytest
+from pyrogram.errors import FloodWait, MediaCaptionTooLong, Unauthorized
+
+from tgsender.utils import retry
+
+
+@pytest.fixture
+def list_sleep(monkeypatch):
+
+    list_sleep = []
+    monkeypatch.setattr(retry.time, "sleep", list_sleep.append)
+    return list_sleep
+
+
+def make_request(list_error):
+    def request():
+        if list_error:
+            raise list_error.pop(0)
+        return "sent"
+
+    return request
+
+
+def test_classify_error():
+
+    assert retry.classify_error(FloodWait(value=3)) == "rate_limit"
+    assert retry.classify_error(MediaCaptionTooLong()) == "permanent"
+    assert retry.classify_error(Unauthorized()) == "fatal"
+    assert retry.classify_error(ConnectionError()) == "transient"
+
+
+def test_transient_errors_back_off_until_success(list_sleep):
+
+    retry_policy = retry.RetryPolicy(max_attempts=3, base_delay=2, jitter=0)
+    request = make_request([OSError(), OSError()])
+    assert retry_policy.call(request) == "sent"
+    assert list_sleep == [2, 4]
+
+
+def test_flood_wait_does_not_count_in_budget(list_sleep):
+
+    retry_policy = retry.RetryPolicy(max_attempts=2, jitter=0)
+    request = make_request([FloodWait(value=7), FloodWait(value=7), OSError()])
+    assert retry_policy.call(request) == "sent"
+    assert list_sleep == [7, 7, 5]
+
+
+def test_permanent_and_exhausted_errors_raise(list_sleep):
+
+    retry_policy = retry.RetryPolicy(max_attempts=2, jitter=0)
+    with pytest.raises(retry.RetryError) as e:
+        retry_policy.call(make_request([MediaCaptionTooLong(), OSError()]))
+    assert e.value.error_class == "permanent"
+    assert e.value.attempts == 1
+
+    with pytest.raises(retry.RetryError) as e:
+        retry_policy.call(make_request([OSError(), OSError(), OSError()]))
+    assert e.value.error_class == "transient"
+    assert e.value.attempts == 2
+    assert list_sleep == [5]
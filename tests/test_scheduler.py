@@ -0,0 +1,57 @@
+"""Tests for `tgsender.api_async.scheduler` module."""
+
+import asyncio
+
+import pytest
+
+from tgsender.api_async.scheduler import UploadScheduler, parse_type_limit
+
+
+def make_job(type_file, seconds, log):
+    async def func_():
+        log.append(("start", type_file, seconds))
+        await asyncio.sleep(seconds)
+        log.append(("end", type_file, seconds))
+        return f"{type_file}-{seconds}"
+
+    return type_file, func_
+
+
+def test_results_in_plan_order():
+
+    log = []
+    list_job = [
+        make_job("document", 0.03, log),
+        make_job("document", 0.01, log),
+        make_job("photo", 0.02, log),
+    ]
+    scheduler = UploadScheduler(max_concurrent=3)
+    list_result = asyncio.run(scheduler.run(list_job))
+    assert list_result == ["document-0.03", "document-0.01", "photo-0.02"]
+    # all started before the first one finished
+    assert [entry[0] for entry in log[:3]] == ["start"] * 3
+
+
+def test_type_limit_does_not_block_small_files():
+
+    log = []
+    list_job = [
+        make_job("video", 0.05, log),
+        make_job("video", 0.05, log),
+        make_job("document", 0.01, log),
+    ]
+    scheduler = UploadScheduler(max_concurrent=2, dict_type_limit={"video": 1})
+    asyncio.run(scheduler.run(list_job))
+    # the document starts while the first video is still in flight
+    assert log[1] == ("start", "document", 0.01)
+    assert log.index(("start", "document", 0.01)) < log.index(
+        ("end", "video", 0.05)
+    )
+
+
+def test_type_limit_below_one_is_rejected():
+
+    with pytest.raises(ValueError):
+        UploadScheduler(max_concurrent=2, dict_type_limit={"video": 0})
+    assert parse_type_limit(" video:1, photo:4 ") == {"video": 1, "photo": 4}
+    assert parse_type_limit("") == {}
@@ -0,0 +1,136 @@
+"""Tests for `tgsender.api_async.sharding` module."""
+
+import asyncio
+
+import pytest
+from pyrogram import errors
+
+from tgsender import utils
+from tgsender.api_async import sharding
+from tgsender.utils import rate_limit
+
+
+class FakeMessage:
+    def __init__(self, file_path, session_name):
+        self.file_path = file_path
+        self.session_name = session_name
+        self.deleted = False
+
+    async def copy(self, chat_id):
+        return ("copy", chat_id, self.file_path, self.session_name)
+
+    async def delete(self):
+        self.deleted = True
+
+
+def test_sharded_upload_is_published_in_plan_order(tmp_path, monkeypatch):
+
+    # first files are slow, so uploads finish out of plan order
+    dict_delay = {"0.txt": 0.05, "1.txt": 0.03}
+
+    async def fake_send_file_until_success(
+        app, dict_file_data, chat_id, *_, index_sent=True
+    ):
+        file_path = dict_file_data["file_output"]
+        assert chat_id == "me"
+        # staged messages are deleted. Only published ones are indexed
+        assert not index_sent
+        await asyncio.sleep(dict_delay.get(file_path.rsplit("/")[-1], 0))
+        return FakeMessage(file_path, app)
+
+    monkeypatch.setattr(
+        sharding, "send_file_until_success", fake_send_file_until_success
+    )
+    # do not pace the copies to the channel
+    monkeypatch.setattr(
+        rate_limit, "_dict_rate_limit", {"message": (60000, 100)}
+    )
+    monkeypatch.setattr(rate_limit, "_dict_rate_limiter", {})
+    list_item = []
+    for index in range(6):
+        file_path = tmp_path / f"{index}.txt"
+        file_path.write_text("data")
+        list_item.append((index, {"file_output": str(file_path)}))
+
+    list_published = []
+
+    def on_published(index, dict_file_data, message, session_name):
+        list_published.append((index, message[2], session_name))
+
+    count_published = asyncio.run(
+        sharding.send_files_sharded(
+            list_item,
+            -100,
+            {"user": "user", "account2": "account2"},
+            on_published=on_published,
+        )
+    )
+    assert count_published == 6
+    assert [entry[0] for entry in list_published] == list(range(6))
+    assert [entry[1] for entry in list_published] == [
+        d["file_output"] for _, d in list_item
+    ]
+    # both accounts took part of the upload
+    assert {entry[2] for entry in list_published} == {"user", "account2"}
+
+
+def test_publish_errors_are_retried_or_failed(tmp_path, monkeypatch):
+
+    dict_copy_error = {"1.txt": [ConnectionError("connection lost")]}
+
+    class FlakyMessage(FakeMessage):
+        async def copy(self, chat_id):
+            list_error = dict_copy_error.get(self.file_path.rsplit("/")[-1])
+            if list_error:
+                raise list_error.pop(0)
+            return await super().copy(chat_id)
+
+    async def fake_send_file_until_success(
+        app, dict_file_data, chat_id, *_, index_sent=True
+    ):
+        return FlakyMessage(dict_file_data["file_output"], app)
+
+    monkeypatch.setattr(
+        sharding, "send_file_until_success", fake_send_file_until_success
+    )
+    monkeypatch.setattr(
+        rate_limit, "_dict_rate_limit", {"message": (60000, 100)}
+    )
+    monkeypatch.setattr(rate_limit, "_dict_rate_limiter", {})
+    list_item = []
+    for index in range(4):
+        file_path = tmp_path / f"{index}.txt"
+        file_path.write_text("data")
+        list_item.append((index, {"file_output": str(file_path)}))
+
+    def send_files_sharded(on_failed=None):
+        return asyncio.run(
+            asyncio.wait_for(
+                sharding.send_files_sharded(
+                    list_item,
+                    -100,
+                    {"user": "user"},
+                    on_failed=on_failed,
+                    retry_policy=utils.RetryPolicy(2, 0.01, 0.01),
+                ),
+                timeout=5,
+            )
+        )
+
+    # transient error of the copy, retried
+    assert send_files_sharded() == 4
+
+    # copy failed by the retry policy
+    dict_copy_error["2.txt"] = [ConnectionError("connection lost")] * 2
+    list_failed = []
+
+    def on_failed(index, dict_file_data, error):
+        list_failed.append(index)
+
+    assert send_files_sharded(on_failed) == 3
+    assert list_failed == [2]
+
+    # fatal error of the publisher stops the uploads, without hanging
+    dict_copy_error["0.txt"] = [errors.AuthKeyUnregistered()]
+    with pytest.raises(errors.AuthKeyUnregistered):
+        send_files_sharded()
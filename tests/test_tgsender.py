@@ -2,12 +2,19 @@
 
 """Tests for `tgsender` package."""
 
+import asyncio
+import json
+from types import SimpleNamespace
+
 import pytest
 
 from click.testing import CliRunner
 
 from tgsender import tgsender
 from tgsender import cli
+from tgsender import client, plan
+from tgsender.api_async import Prefetcher, api_telegram
+from tgsender.utils import rate_limit
 
 
 @pytest.fixture
@@ -35,3 +42,72 @@ def test_command_line_interface():
     help_result = runner.invoke(cli.main, ['--help'])
     assert help_result.exit_code == 0
     assert '--help  Show this message and exit.' in help_result.output
+
+
+def test_concurrent_send_keeps_plan_rows_and_order(tmp_path, monkeypatch):
+
+    list_copy = []
+
+    class FakePublished(SimpleNamespace):
+        # pyrogram messages print as json
+        def __str__(self):
+            return json.dumps(vars(self))
+
+    class FakeMessage:
+        def __init__(self, file_path):
+            self.file_path = file_path
+
+        async def copy(self, chat_id):
+            list_copy.append(self.file_path)
+            return FakePublished(id=len(list_copy), chat_id=chat_id)
+
+        async def delete(self):
+            pass
+
+    async def fake_send_file_or_none(app, dict_file_data, chat_id, *_, **__):
+        file_path = dict_file_data["file_output"]
+        assert chat_id == "me"
+        # first files are slow, so uploads finish out of plan order
+        await asyncio.sleep(0.04 if file_path.endswith("0.txt") else 0)
+        return FakeMessage(file_path)
+
+    async def fake_get_async_client(app=None):
+        return SimpleNamespace(name="test-concurrent-send")
+
+    monkeypatch.setattr(
+        api_telegram, "send_file_or_none", fake_send_file_or_none
+    )
+    monkeypatch.setattr(client, "get_async_client", fake_get_async_client)
+    monkeypatch.setattr(client, "run_in_client_loop", asyncio.run)
+    # do not pace the copies to the chat
+    monkeypatch.setattr(
+        rate_limit, "_dict_rate_limit", {"message": (60000, 100)}
+    )
+    monkeypatch.setattr(rate_limit, "_dict_rate_limiter", {})
+
+    list_file_path = [tmp_path / f"{index}.txt" for index in range(4)]
+    for file_path in list_file_path:
+        if file_path.name != "1.txt":
+            file_path.write_text("content")
+    file_path_upload_plan = tmp_path / "upload_plan.csv"
+    plan.write_upload_plan(file_path_upload_plan, list_file_path)
+    upload_plan = plan.open_upload_plan(file_path_upload_plan)
+
+    with Prefetcher(upload_plan.iter_pending(), workers=1) as prefetcher:
+        tgsender.send_concurrent_via_telegram_api(
+            tmp_path,
+            upload_plan,
+            prefetcher,
+            -100,
+            {"time_limit": "20"},
+            concurrent_files=3,
+        )
+    list_sent = [str(list_file_path[index]) for index in [0, 2, 3]]
+    assert list_copy == list_sent
+    for message_id, file_path in enumerate(list_sent, 1):
+        record = upload_plan.get_record(file_path)
+        assert int(record["sent"]) == 1
+        assert int(record["message_id"]) == message_id
+    record = upload_plan.get_record(str(list_file_path[1]))
+    assert int(record["sent"]) == 0
+    assert record["error"] == "File not found"
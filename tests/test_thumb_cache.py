@@ -0,0 +1,50 @@
+"""Tests for `tgsender.mediainfo.thumb_cache` module."""
+
+import os
+
+from tgsender.mediainfo import thumb_cache
+
+
+def test_thumb_made_once_and_not_next_to_video(tmp_path, monkeypatch):
+
+    list_seek = []
+
+    def fake_render_thumb(file_path, seek_seconds=0):
+        list_seek.append(seek_seconds)
+        return b"jpeg"
+
+    monkeypatch.setattr(thumb_cache, "render_thumb", fake_render_thumb)
+    folder_path_video = tmp_path / "videos"
+    folder_path_video.mkdir()
+    file_path = folder_path_video / "video.mp4"
+    file_path.write_bytes(b"0" * 1000)
+    thumb_cache.configure_thumb_cache(True, tmp_path / "thumb")
+    try:
+        thumb = thumb_cache.get_thumb(file_path, duration=100)
+        assert open(thumb, "rb").read() == b"jpeg"
+        assert thumb_cache.get_thumb(file_path, duration=100) == thumb
+        assert list_seek == [10]
+        assert list(folder_path_video.iterdir()) == [file_path]
+
+        # without cache, the thumbnail is kept in memory
+        thumb_cache.configure_thumb_cache(False)
+        thumb = thumb_cache.get_thumb(file_path)
+        assert thumb.read() == b"jpeg"
+        assert list_seek == [10, 0]
+    finally:
+        thumb_cache.configure_thumb_cache()
+
+
+def test_prune_keeps_recent_thumbs(tmp_path):
+
+    cache = thumb_cache.ThumbCache(tmp_path, max_bytes=10)
+    list_thumb_path = [cache.put(f"{n:040d}", b"0" * 4) for n in range(3)]
+    for age, thumb_path in enumerate(reversed(list_thumb_path)):
+        os.utime(thumb_path, (1000 - age, 1000 - age))
+    cache.prune()
+
+    assert [thumb_path.exists() for thumb_path in list_thumb_path] == [
+        False,
+        True,
+        True,
+    ]
@@ -0,0 +1,151 @@
+"""Tests for `tgsender.client.upload` module."""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from pyrogram import errors
+
+from tgsender.api_async import api_telegram
+from tgsender.client import checkpoint, upload
+
+
+class FakeStorage:
+    async def dc_id(self):
+        return 2
+
+    async def auth_key(self):
+        return b"key"
+
+    async def test_mode(self):
+        return False
+
+
+class FakeSession:
+    list_part = []
+    fail_part = None
+    in_flight = 0
+    max_in_flight = 0
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def invoke(self, rpc):
+        if rpc.file_part == FakeSession.fail_part:
+            FakeSession.fail_part = None
+            raise ConnectionError("connection lost")
+        FakeSession.in_flight += 1
+        FakeSession.max_in_flight = max(
+            FakeSession.max_in_flight, FakeSession.in_flight
+        )
+        try:
+            await asyncio.sleep(0.001)
+        finally:
+            FakeSession.in_flight -= 1
+        FakeSession.list_part.append((rpc.file_id, rpc.file_part))
+
+
+class FakeApp:
+    get_media_sessions = upload.UploadClient.get_media_sessions
+    stop_media_sessions = upload.UploadClient.stop_media_sessions
+    get_bytes_budget = upload.UploadClient.get_bytes_budget
+
+    def __init__(self):
+        self.name = "user"
+        self.me = SimpleNamespace(is_premium=False)
+        self.storage = FakeStorage()
+        self.rnd_id = lambda: 1234
+        self.list_media_session = []
+        self.lock_media_session = None
+        self.bytes_budget = None
+
+
+def test_failed_upload_resumes_missing_parts(tmp_path, monkeypatch):
+
+    file_path = tmp_path / "video.mp4"
+    file_path.write_bytes(b"0" * (upload.PART_SIZE * 30 + 10))
+    monkeypatch.setattr(upload, "Session", FakeSession)
+    monkeypatch.setattr(
+        checkpoint, "upload_settings", checkpoint.UploadSettings(tmp_path)
+    )
+    app = FakeApp()
+    FakeSession.list_part = []
+    FakeSession.fail_part = 20
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(upload.save_big_file(app, str(file_path)))
+    count_sent = len(FakeSession.list_part)
+    assert 0 < count_sent < 31
+
+    app.rnd_id = lambda: 9999
+    input_file = asyncio.run(upload.save_big_file(app, str(file_path)))
+    assert input_file.id == 1234
+    assert input_file.parts == 31
+    list_part = [part for _, part in FakeSession.list_part]
+    # each part sent only once, over the two attempts
+    assert sorted(list_part) == list(range(31))
+    assert {file_id for file_id, _ in FakeSession.list_part} == {1234}
+
+    checkpoint.remove_checkpoint(file_path, "user")
+    assert list(tmp_path.glob("*.checkpoint")) == []
+
+
+def test_lost_parts_are_uploaded_again(tmp_path, monkeypatch):
+
+    file_path = tmp_path / "archive.bin"
+    file_path.write_bytes(b"0" * (upload.PART_SIZE * 30 + 10))
+    monkeypatch.setattr(upload, "Session", FakeSession)
+    monkeypatch.setattr(
+        checkpoint, "upload_settings", checkpoint.UploadSettings(tmp_path)
+    )
+    app = FakeApp()
+    FakeSession.list_part = []
+    asyncio.run(upload.save_big_file(app, str(file_path)))
+    assert len(list(tmp_path.glob("*.checkpoint"))) == 1
+
+    async def send_document(*args, **kwargs):
+        # telegram finalizes the upload and misses a part
+        raise errors.FilePartMissing(value=3)
+
+    app.send_document = send_document
+    with pytest.raises(errors.FilePartMissing):
+        asyncio.run(
+            api_telegram.send_file_watched(
+                app, {"file_output": str(file_path), "description": ""}, "me"
+            )
+        )
+    # not resumed by the retry, that would skip the missing part again
+    assert list(tmp_path.glob("*.checkpoint")) == []
+
+
+def test_parts_in_flight_are_bounded(tmp_path, monkeypatch):
+
+    file_path = tmp_path / "video.mp4"
+    file_path.write_bytes(b"0" * (upload.PART_SIZE * 40))
+    monkeypatch.setattr(upload, "Session", FakeSession)
+    # 8 workers over 2 connections, at most 3 parts in flight
+    monkeypatch.setattr(
+        checkpoint,
+        "upload_settings",
+        checkpoint.UploadSettings(
+            part_workers=8,
+            media_sessions=2,
+            max_bytes_in_flight=3 * upload.PART_SIZE,
+        ),
+    )
+    app = FakeApp()
+    FakeSession.list_part = []
+    FakeSession.max_in_flight = 0
+
+    input_file = asyncio.run(upload.save_big_file(app, str(file_path)))
+    assert input_file.parts == 40
+    assert len(app.list_media_session) == 2
+    assert FakeSession.max_in_flight == 3
+    # no checkpoint file without a checkpoint folder
+    assert list(tmp_path.glob("*.checkpoint")) == []
@@ -0,0 +1,38 @@
+"""Tests for `tgsender.utils.utils` module."""
+
+import os
+
+from tgsender import utils
+
+
+def make_tree(folder_path):
+
+    for relative_path in ["b/2.txt", "b/10.txt", "a/c/1.txt", "É.txt"]:
+        file_path = folder_path / relative_path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_text("content")
+
+
+def test_all_file_path_sorted_naturally(tmp_path):
+
+    make_tree(tmp_path)
+    os.symlink(tmp_path / "missing.txt", tmp_path / "broken.txt")
+
+    all_file_path = utils.get_all_file_path(tmp_path)
+    assert [
+        path.relative_to(tmp_path).as_posix()
+        for path in all_file_path["content"]
+    ] == ["a/c/1.txt", "b/2.txt", "b/10.txt", "É.txt"]
+    assert all_file_path["errors"] == [tmp_path / "broken.txt"]
+
+    # results do not accumulate across calls
+    assert utils.get_all_file_path(tmp_path) == all_file_path
+
+
+def test_all_file_path_parallel(tmp_path):
+
+    make_tree(tmp_path)
+    assert utils.get_all_file_path(
+        tmp_path, workers=4
+    ) == utils.get_all_file_path(tmp_path)
+    assert len(list(utils.iter_file_path(tmp_path, workers=4))) == 4
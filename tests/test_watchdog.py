@@ -0,0 +1,85 @@
+"""Tests for `tgsender.utils.watchdog` module."""
+
+import asyncio
+
+import pytest
+
+from tgsender.utils.watchdog import (
+    ThroughputMeter,
+    UploadStalled,
+    UploadWatchdog,
+)
+
+
+async def fake_upload(progress, list_delay, total=100):
+    current = 0
+    for delay in list_delay:
+        await asyncio.sleep(delay)
+        current += total // len(list_delay)
+        progress(current, total)
+    return "sent"
+
+
+def test_upload_with_progress_is_not_aborted():
+
+    meter = ThroughputMeter()
+    watchdog = UploadWatchdog(stall_seconds=0.2, meter=meter)
+    coroutine = fake_upload(watchdog.wrap_progress(), [0.1] * 5)
+    result = asyncio.run(watchdog.run(coroutine, 100, check_interval=0.02))
+    # takes longer than the stall window, but always moving
+    assert result == "sent"
+    assert meter.bytes_per_second is not None
+
+
+def test_stalled_upload_is_aborted_and_cancelled():
+
+    watchdog = UploadWatchdog(stall_seconds=0.1, meter=ThroughputMeter())
+    list_cancelled = []
+
+    async def stalled_upload():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            list_cancelled.append(True)
+            raise
+
+    with pytest.raises(UploadStalled):
+        asyncio.run(watchdog.run(stalled_upload(), 100, check_interval=0.02))
+    assert list_cancelled == [True]
+
+
+def test_deadline_is_sized_by_measured_throughput():
+
+    meter = ThroughputMeter()
+    meter.add(1000, 1)
+    watchdog = UploadWatchdog(min_deadline=5, deadline_factor=3, meter=meter)
+    assert watchdog.get_deadline_seconds(1000) == 5
+    assert watchdog.get_deadline_seconds(10000) == 30
+    # no deadline before the first measure
+    watchdog = UploadWatchdog(min_deadline=5, meter=ThroughputMeter())
+    assert watchdog.get_deadline_seconds(10000) is None
+
+
+def test_flood_wait_longer_than_stall_is_not_a_stall():
+
+    from pyrogram import errors
+
+    from tgsender.utils.rate_limit import RateLimiter
+
+    watchdog = UploadWatchdog(stall_seconds=0.3, meter=ThroughputMeter())
+    list_call = []
+
+    async def send(progress):
+        list_call.append(True)
+        if len(list_call) == 1:
+            raise errors.FloodWait(value=1)
+        await asyncio.sleep(0.1)
+        progress(100, 100)
+        return "sent"
+
+    coroutine = RateLimiter({"upload": (6000, 10)}).call_async(
+        "upload", send, watchdog.wrap_progress()
+    )
+    result = asyncio.run(watchdog.run(coroutine, 100, check_interval=0.02))
+    assert result == "sent"
+    assert len(list_call) == 2
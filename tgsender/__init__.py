@@ -1,8 +1,30 @@
 """Top-level package for tgsender."""
 
-from . import api_async
-from .tgsender import get_data_upload_plan, main
+import importlib
 
 __author__ = """apenasrr"""
 __email__ = "apenasrr@gmail.com"
 __version__ = "0.1.12"
+
+# Heavy dependencies (pandas, pyrogram, pyautogui) are only imported
+# on first access of the attributes that need them
+_LAZY_SUBMODULES = ["api", "api_async"]
+_LAZY_ATTRIBUTES = {
+    "get_data_upload_plan": ".tgsender",
+    "main": ".tgsender",
+}
+
+
+def __getattr__(name):
+
+    if name in _LAZY_SUBMODULES:
+        return importlib.import_module("." + name, __name__)
+    if name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module(_LAZY_ATTRIBUTES[name], __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+
+    return sorted(list(globals()) + _LAZY_SUBMODULES + list(_LAZY_ATTRIBUTES))
@@ -1,17 +1,15 @@
 from __future__ import annotations
 
 import logging
-import os
 import sys
-import time
 from ctypes import util
 from datetime import datetime
 from pathlib import Path
 
-from pyrogram import Client, types
+from pyrogram import types
 
-from .. import utils
-from ..mediainfo import ffprobe
+from .. import client, utils
+from ..mediainfo import get_audio_metadata, get_thumb, get_video_metadata
 
 
 def logging_config():
@@ -37,13 +35,11 @@ def ensure_connection():
     logging.warning("Ensuring connection...")
     if Path("user.session").exists():
         try:
-            with Client(
-                "user", workdir=Path("user.session").absolute().parent
-            ) as app:
-                message = app.send_message(
-                    "me", text="telegram filesender-Connected..."
-                )
-                message.delete()
+            app = client.get_client()
+            message = app.send_message(
+                "me", text="telegram filesender-Connected..."
+            )
+            message.delete()
             return
         except:
             print("Delete Session file and try again.")
@@ -53,12 +49,7 @@ def ensure_connection():
             api_id = int(input("Enter your api_id: "))
             api_hash = input("Enter your api_hash: ")
 
-            with Client(
-                "user",
-                api_id,
-                api_hash,
-                workdir=Path("user.session").absolute().parent,
-            ) as app:
+            with client.create_client(api_id=api_id, api_hash=api_hash) as app:
                 message = app.send_message(
                     "me", text="telegram filesender-Connected..."
                 )
@@ -79,71 +70,86 @@ def progress(current, total):
     sys.stdout.flush()
 
 
-def get_video_metadata(file_path):
-
-    try:
-        metadata = ffprobe(file_path).get_output_as_dict()
-        metadata_streams = metadata["streams"]
-        video_metadata = metadata_streams[0]
-    except:
-        # case of error, show all file metadata
-        print(file_path)
-        print(ffprobe(file_path).get_output_as_dict())
-        metadata = ffprobe(file_path).get_output_as_dict()
-        metadata_streams = metadata["streams"]
-        video_metadata = metadata_streams[0]
-    try:
-        width = video_metadata["width"]
-    except:
-        video_metadata = metadata_streams[1]
-    try:
-        width = video_metadata["width"]
-        height = video_metadata["height"]
-        duration = int(float(metadata["format"]["duration"]))
-        return {"width": width, "height": height, "duration": duration}
-    except Exception as e:
-        logging.error(f"File Error: {file_path}.\napi_telegram.py line 63")
-        raise ValueError(e)
-
-
 def send_sticker(chat_id, sticker):
 
     logging.warning("Sending sticker...")
-    with Client("user", workdir=Path("user.session").absolute().parent) as app:
-        return_ = app.send_sticker(chat_id, sticker)
-        return return_
+    app = client.get_client()
+    return_ = utils.get_rate_limiter(app.name).call(
+        "message", app.send_sticker, chat_id, sticker
+    )
+    return return_
 
 
 def send_video(chat_id, file_path, caption, log_file_path=None):
 
     logging.warning("Sending video...")
     video_metadata = get_video_metadata(file_path)
-    thumb = utils.create_thumb(file_path)
-    with Client("user", workdir=Path("user.session").absolute().parent) as app:
-        return_ = app.send_video(
-            chat_id,
-            file_path,
-            caption=caption,
-            progress=progress,
-            supports_streaming=True,
-            width=video_metadata["width"],
-            height=video_metadata["height"],
-            duration=video_metadata["duration"],
-            thumb=thumb,
-        )
-        os.remove(thumb)
+    thumb = get_thumb(file_path, video_metadata["duration"])
+    app = client.get_client()
+    return_ = utils.get_rate_limiter(app.name).call(
+        "upload",
+        app.send_video,
+        chat_id,
+        file_path,
+        caption=caption,
+        progress=progress,
+        supports_streaming=True,
+        width=video_metadata["width"],
+        height=video_metadata["height"],
+        duration=video_metadata["duration"],
+        thumb=thumb,
+    )
 
     if log_file_path:
         utils.log_send_return(str(return_), file_path, Path(log_file_path))
 
 
+def send_cached_file(chat_id, file_id, caption):
+    """Post a file already uploaded, by its file_id, without upload
+
+    Args:
+        chat_id (int | str): destination chat
+        file_id (str): telegram file_id of the media
+        caption (str): message caption
+
+    Returns:
+        pyrogram.types.Message: message sent
+    """
+
+    app = client.get_client()
+    return_ = utils.get_rate_limiter(app.name).call(
+        "message", app.send_cached_media, chat_id, file_id, caption=caption
+    )
+    return return_
+
+
+def get_message_file_id(chat_id, message_id):
+    """Returns a fresh file_id of the media of a message.
+    None if the message is gone or has no media"""
+
+    app = client.get_client()
+    message = utils.get_rate_limiter(app.name).call(
+        "message", app.get_messages, chat_id, message_id
+    )
+    if message is None or getattr(message, "empty", False):
+        return None
+    return client.get_message_file_id(message)
+
+
 def send_audio(chat_id, file_path, caption, log_file_path=None):
 
-    with Client("user", workdir=Path("user.session").absolute().parent) as app:
-        logging.warning("Sending audio...")
-        return_ = app.send_audio(
-            chat_id, file_path, caption=caption, progress=progress
-        )
+    app = client.get_client()
+    logging.warning("Sending audio...")
+    audio_metadata = get_audio_metadata(file_path)
+    return_ = utils.get_rate_limiter(app.name).call(
+        "upload",
+        app.send_audio,
+        chat_id,
+        file_path,
+        caption=caption,
+        progress=progress,
+        **audio_metadata,
+    )
     if log_file_path:
         utils.log_send_return(str(return_), file_path, log_file_path)
 
@@ -151,10 +157,15 @@ def send_audio(chat_id, file_path, caption, log_file_path=None):
 def send_document(chat_id, file_path, caption, log_file_path=None):
 
     logging.warning("Sending document...")
-    with Client("user", workdir=Path("user.session").absolute().parent) as app:
-        return_ = app.send_document(
-            chat_id, file_path, caption=caption, progress=progress
-        )
+    app = client.get_client()
+    return_ = utils.get_rate_limiter(app.name).call(
+        "upload",
+        app.send_document,
+        chat_id,
+        file_path,
+        caption=caption,
+        progress=progress,
+    )
 
     if log_file_path:
         utils.log_send_return(str(return_), file_path, Path(log_file_path))
@@ -163,10 +174,15 @@ def send_document(chat_id, file_path, caption, log_file_path=None):
 def send_photo(chat_id, file_path, caption, log_file_path=None):
 
     logging.warning("Sending photo...")
-    with Client("user", workdir=Path("user.session").absolute().parent) as app:
-        return_ = app.send_photo(
-            chat_id, file_path, caption=caption, progress=progress
-        )
+    app = client.get_client()
+    return_ = utils.get_rate_limiter(app.name).call(
+        "upload",
+        app.send_photo,
+        chat_id,
+        file_path,
+        caption=caption,
+        progress=progress,
+    )
     if log_file_path:
         utils.log_send_return(str(return_), file_path, log_file_path)
 
@@ -174,35 +190,47 @@ def send_photo(chat_id, file_path, caption, log_file_path=None):
 def send_message(chat_id, text):
 
     logging.warning("Sending message...")
-    with Client("user", workdir=Path("user.session").absolute().parent) as app:
-        return_ = app.send_message(
-            chat_id, text=text, disable_web_page_preview=True
-        )
+    app = client.get_client()
+    return_ = utils.get_rate_limiter(app.name).call(
+        "message",
+        app.send_message,
+        chat_id,
+        text=text,
+        disable_web_page_preview=True,
+    )
     return return_
 
 
 def pin_chat_message(chat_id, message_id):
 
     logging.warning("Pinning message...")
-    with Client("user", workdir=Path("user.session").absolute().parent) as app:
-        return_ = app.pin_chat_message(
-            chat_id, message_id=message_id, both_sides=True
-        )
+    app = client.get_client()
+    return_ = utils.get_rate_limiter(app.name).call(
+        "message",
+        app.pin_chat_message,
+        chat_id,
+        message_id=message_id,
+        both_sides=True,
+    )
     return return_
 
 
 def get_messages(chat_id, message_ids):
 
-    with Client("user", workdir=Path("user.session").absolute().parent) as app:
-        return_ = app.get_messages(chat_id, message_ids)
+    app = client.get_client()
+    return_ = utils.get_rate_limiter(app.name).call(
+        "message", app.get_messages, chat_id, message_ids
+    )
     return return_
 
 
 def get_history(chat_id):
+    """Returns all messages of a chat, newest first. pyrogram 2 has only
+    the async generator get_chat_history, run in the client event loop"""
 
-    with Client("user", workdir=Path("user.session").absolute().parent) as app:
-        return_ = app.get_history(chat_id)
-    return return_
+    from .. import api_async
+
+    return client.run_in_client_loop(api_async.get_history(chat_id))
 
 
 def get_list_media_doc(list_dict_sent_doc):
@@ -232,51 +260,118 @@ def get_list_media_doc(list_dict_sent_doc):
 
 def send_media_group(chat_id, list_media):
 
-    with Client("user", workdir=Path("user.session").absolute().parent) as app:
-        return_ = app.send_media_group(chat_id, media=list_media)
+    app = client.get_client()
+    return_ = utils.get_rate_limiter(app.name).call(
+        "message", app.send_media_group, chat_id, media=list_media
+    )
     return return_
 
 
 def delete_messages(chat_id, list_message_id):
 
-    with Client("user", workdir=Path("user.session").absolute().parent) as app:
-        return_ = app.delete_messages(
-            chat_id=chat_id, message_ids=list_message_id
-        )
+    app = client.get_client()
+    return_ = utils.get_rate_limiter(app.name).call(
+        "message",
+        app.delete_messages,
+        chat_id=chat_id,
+        message_ids=list_message_id,
+    )
     return return_
 
 
-def send_file(dict_file_data, chat_id, time_limit=20, log_file_path=None):
+def send_file(
+    dict_file_data,
+    chat_id,
+    time_limit=20,
+    log_file_path=None,
+    stall_timeout=120,
+):
+    """Send a file, aborting the upload when it stalls.
+    The upload runs in the event loop of the client shared by the sync api.
+
+    Args:
+        dict_file_data (dict): keys file_output (or file_path) and
+            description
+        chat_id (int): chat id to send
+        time_limit (int, optional): minimum minutes of the overall
+            deadline of the upload, sized by the measured throughput.
+            Defaults to 20.
+        log_file_path (Path, optional): json file of sent log.
+            Defaults to None.
+        stall_timeout (float, optional): seconds without upload progress
+            to abort the upload. Defaults to 120.
+
+    Raises:
+        utils.UploadStalled: if upload was aborted by the watchdog
+
+    Returns:
+        pyrogram.types.Message: message sent
+    """
+
+    from .. import api_async
 
     file_path = dict_file_data.get("file_output")
     if file_path is None:
         file_path = dict_file_data.get("file_path")
-    description = dict_file_data["description"]
-    file_extension = Path(file_path).suffix.lower()
-    if file_extension == ".mp4":
-        type_file = "video"
-    elif file_extension in [".mp3", ".aac"]:
-        type_file = "audio"
-    elif file_extension in [".png", ".jpg", ".jpeg", ".gif"]:
-        type_file = "photo"
-    else:
-        type_file = "document"
-
-    dict_params = {
-        "chat_id": chat_id,
-        "file_path": file_path,
-        "caption": description,
-        "log_file_path": str(log_file_path),
+    # keep keys of prepared items, as video_metadata and thumb
+    dict_file_data = {
+        key: dict_file_data[key] for key in dict_file_data.keys()
     }
-    sec_time_out = time_limit * 60
-    if type_file == "video":
-        utils.time_out(sec_time_out, send_video, dict_params, restart=True)
-    elif type_file == "audio":
-        utils.time_out(sec_time_out, send_audio, dict_params, restart=True)
-    elif type_file == "photo":
-        utils.time_out(sec_time_out, send_photo, dict_params, restart=True)
-    elif type_file == "document":
-        utils.time_out(sec_time_out, send_document, dict_params, restart=True)
+    dict_file_data["file_output"] = str(file_path)
+    return_ = client.run_in_client_loop(
+        api_async.send_file_watched(
+            None, dict_file_data, chat_id, stall_timeout, time_limit * 60
+        )
+    )
+    if log_file_path:
+        utils.log_send_return(str(return_), file_path, Path(log_file_path))
+    return return_
+
+
+def send_album(
+    list_dict_file_data, chat_id, time_limit=20, list_log_file_path=None
+):
+    """Send files as one album, by send_media_group.
+    The album is sent in the event loop of the client shared by the sync api.
+
+    Args:
+        list_dict_file_data (list[dict]): items of the album, with keys
+            file_output and description
+        chat_id (int): chat id to send
+        time_limit (int, optional): minimum minutes of the deadline of
+            the album, sized by the measured throughput. Defaults to 20.
+        list_log_file_path (list[Path], optional): json file of sent log
+            of each item. Defaults to None.
+
+    Raises:
+        utils.UploadStalled: if the album overran its deadline
+
+    Returns:
+        list[pyrogram.types.Message]: message of each item, in order
+    """
+
+    from .. import api_async
+
+    # keep keys of prepared items, as video_metadata and thumb
+    list_dict_file_data = [
+        {key: dict_file_data[key] for key in dict_file_data.keys()}
+        for dict_file_data in list_dict_file_data
+    ]
+    list_message = client.run_in_client_loop(
+        api_async.send_album(
+            None, list_dict_file_data, chat_id, time_limit * 60
+        )
+    )
+    if list_log_file_path:
+        for dict_file_data, message, log_file_path in zip(
+            list_dict_file_data, list_message, list_log_file_path
+        ):
+            utils.log_send_return(
+                str(message),
+                dict_file_data["file_output"],
+                Path(log_file_path),
+            )
+    return list_message
 
 
 def send_files(
@@ -284,6 +379,8 @@ def send_files(
     chat_id: int,
     time_limit: int = 20,
     folder_path_project: Path = None,
+    retry_policy=None,
+    stall_timeout: float = 120,
 ):
     """Sends a series of files to the same chat_id
 
@@ -296,11 +393,22 @@ def send_files(
         chat_id (int):
             chat id to send
         time_limit (int):
-            time limit for upload before rebooting automatically
+            minimum minutes of the overall deadline of each upload
         folder_path_project (Path):
             Folder where Logs folder will be created
+        retry_policy (utils.RetryPolicy, optional):
+            retry policy of each file. Defaults to None, to use the
+            default policy. Files that fail are skipped.
+        stall_timeout (float, optional):
+            seconds without upload progress to abort an upload and try
+            it again. Defaults to 120.
+
+    Returns:
+        list[Path]: log file path of each file sent
     """
 
+    retry_policy = retry_policy or utils.RetryPolicy()
+
     list_log_file_path = []
     len_list_dict = len(list_dict)
 
@@ -312,6 +420,7 @@ def send_files(
             file_output = Path(d["file_path"]).name
         else:
             file_output = file_output.name
+        log_file_path = None
         if folder_path_project:
             log_file_path = utils.get_log_file_path(
                 Path(folder_path_project), Path(file_path), index
@@ -322,95 +431,80 @@ def send_files(
 
         logging.warning(f"{order}/{len_list_dict} Uploading: {file_output}")
 
-        file_extension = Path(file_path).suffix
-        description = d["description"]
-
-        if file_extension == ".mp4":
-            type_file = "video"
-        elif file_extension == ".mp3":
-            type_file = "audio"
-        elif file_extension in [".png", ".jpg", ".jpeg", ".gif"]:
-            type_file = "photo"
-        else:
-            type_file = "document"
-
-        dict_params = {
-            "chat_id": chat_id,
-            "file_path": file_path,
-            "caption": description,
-            "log_file_path": log_file_path,
-        }
-        sec_time_out = time_limit * 60
-        while True:
-            try:
-                if type_file == "video":
-                    utils.time_out(
-                        sec_time_out, send_video, dict_params, restart=True
-                    )
-                elif type_file == "audio":
-                    utils.time_out(
-                        sec_time_out, send_audio, dict_params, restart=True
-                    )
-                elif type_file == "photo":
-                    utils.time_out(
-                        sec_time_out, send_photo, dict_params, restart=True
-                    )
-                elif type_file == "document":
-                    utils.time_out(
-                        sec_time_out, send_document, dict_params, restart=True
-                    )
-                break
-            except Exception as e:
-                print(e)
-                print("\nError. Trying again...")
-                time.sleep(30)
-                continue
+        try:
+            retry_policy.call(
+                send_file,
+                {"file_path": file_path, "description": d["description"]},
+                chat_id,
+                time_limit,
+                log_file_path,
+                stall_timeout,
+                label=f"{order}/{len_list_dict}",
+            )
+        except utils.RetryError as e:
+            logging.error(f"{order}/{len_list_dict} Failed: {e}")
+            continue
         list_log_file_path.append(log_file_path)
     return list_log_file_path
 
 
 def create_channel(title, description):
 
-    with Client("user", workdir=Path("user.session").absolute().parent) as app:
-        return_chat = app.create_channel(title=title, description=description)
+    app = client.get_client()
+    return_chat = utils.get_rate_limiter(app.name).call(
+        "admin", app.create_channel, title=title, description=description
+    )
     chat_id = return_chat.id
     return chat_id
 
 
 def add_chat_members(chat_id, user_ids):
 
-    with Client("user", workdir=Path("user.session").absolute().parent) as app:
-        app.add_chat_members(chat_id=chat_id, user_ids=user_ids)
+    app = client.get_client()
+    utils.get_rate_limiter(app.name).call(
+        "admin", app.add_chat_members, chat_id=chat_id, user_ids=user_ids
+    )
 
 
 def promote_chat_members(chat_id, user_ids):
 
-    with Client("user", workdir=Path("user.session").absolute().parent) as app:
+    app = client.get_client()
 
-        privileges_config = types.ChatPrivileges(
-            can_change_info=True,
-            can_post_messages=True,
-            can_edit_messages=True,
-            can_delete_messages=True,
-            can_promote_members=True,
-        )
+    privileges_config = types.ChatPrivileges(
+        can_change_info=True,
+        can_post_messages=True,
+        can_edit_messages=True,
+        can_delete_messages=True,
+        can_promote_members=True,
+    )
 
-        for user_id in user_ids:
-            app.promote_chat_member(
-                chat_id=chat_id, user_id=user_id, privileges=privileges_config
-            )
+    for user_id in user_ids:
+        utils.get_rate_limiter(app.name).call(
+            "admin",
+            app.promote_chat_member,
+            chat_id=chat_id,
+            user_id=user_id,
+            privileges=privileges_config,
+        )
 
 
 def set_chat_description(chat_id, description):
 
-    with Client("user", workdir=Path("user.session").absolute().parent) as app:
-        app.set_chat_description(chat_id=chat_id, description=description)
+    app = client.get_client()
+    utils.get_rate_limiter(app.name).call(
+        "admin",
+        app.set_chat_description,
+        chat_id=chat_id,
+        description=description,
+    )
 
 
 def export_chat_invite_link(chat_id):
 
-    with Client("user", workdir=Path("user.session").absolute().parent) as app:
-        return_ = app.export_chat_invite_link(chat_id=chat_id)
+    app = client.get_client()
+    return_ = utils.get_rate_limiter(app.name).call(
+        "admin", app.export_chat_invite_link, chat_id=chat_id
+    )
 
     return return_
 
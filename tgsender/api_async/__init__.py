@@ -1 +1,5 @@
-from .api_telegram import *
\ No newline at end of file
+from .album import *
+from .api_telegram import *
+from .prefetch import *
+from .scheduler import *
+from .sharding import *
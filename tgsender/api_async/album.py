@@ -0,0 +1,282 @@
+"""
+Album batching of consecutive plan items.
+
+Items with the same value in the grouping column of the plan are sent
+together by send_media_group, up to 10 by album, each one with its own
+caption. Telegram albums mix photos and videos, while audio and documents
+are only grouped with their own type. One album is one message request, so
+image heavy projects send far fewer messages and hit fewer flood waits.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from pathlib import Path
+
+from pyrogram import errors, types
+
+from .. import client, utils
+from ..mediainfo import (
+    get_audio_metadata,
+    get_plan_video_metadata,
+    get_thumb,
+    get_type_file,
+    get_video_metadata,
+)
+from .api_telegram import (
+    FILE_ID_ERRORS,
+    add_file_index,
+    get_item_content_hash,
+    get_upload_path,
+)
+
+# telegram limit of items by album
+ALBUM_MAX_ITEMS = 10
+ALBUM_KIND = {
+    "photo": "visual",
+    "video": "visual",
+    "audio": "audio",
+    "document": "document",
+}
+
+
+def get_album_kind(dict_file_data) -> str:
+    """Kind of album an item may join: visual, audio or document"""
+
+    type_file = dict_file_data.get("type") or get_type_file(
+        dict_file_data["file_output"]
+    )
+    return ALBUM_KIND.get(type_file, "document")
+
+
+def get_album_key(dict_file_data, column: str):
+    """Value of the grouping column. None for items sent alone"""
+
+    value = dict_file_data.get(column)
+    if value is None:
+        return None
+    value = str(value).strip()
+    if value in ["", "nan"]:
+        return None
+    return value
+
+
+def iter_albums(iterable, column: str = "album", max_items=ALBUM_MAX_ITEMS):
+    """Group consecutive items by the grouping column of the plan.
+    Items are consumed lazily, as they come from the prefetch stage.
+
+    Args:
+        iterable (Iterable[tuple[int, dict]]): index and data of items,
+            in plan order
+        column (str, optional): grouping column. Defaults to "album".
+        max_items (int, optional): maximum items by album.
+            Defaults to ALBUM_MAX_ITEMS.
+
+    Yields:
+        list[tuple[int, dict]]: items of an album. A single item for
+            items without group, or not compatible with their neighbours
+    """
+
+    max_items = max(1, min(int(max_items), ALBUM_MAX_ITEMS))
+    list_item = []
+    album_id = None
+    for index, dict_file_data in iterable:
+        key = get_album_key(dict_file_data, column)
+        item_album_id = None
+        if key is not None:
+            item_album_id = (key, get_album_kind(dict_file_data))
+        if list_item and (
+            item_album_id is None
+            or item_album_id != album_id
+            or len(list_item) >= max_items
+        ):
+            yield list_item
+            list_item = []
+        list_item.append((index, dict_file_data))
+        album_id = item_album_id
+    if list_item:
+        yield list_item
+
+
+def get_input_media(dict_file_data, file_id=None):
+    """Album item of a file, with its caption and media metadata
+
+    Args:
+        dict_file_data (dict): keys file_output and description.
+            video_metadata and thumb, if prepared by the prefetch stage
+        file_id (str, optional): file_id of the file already uploaded.
+            Defaults to None, to upload the file.
+
+    Returns:
+        pyrogram.types.InputMedia: media of send_media_group
+    """
+
+    file_path = get_upload_path(dict_file_data)
+    media = file_id or file_path
+    caption = dict_file_data["description"] or ""
+    type_file = dict_file_data.get("type") or get_type_file(file_path)
+    if type_file == "photo":
+        return types.InputMediaPhoto(media, caption=caption)
+    if type_file == "video":
+        video_metadata = (
+            dict_file_data.get("video_metadata")
+            or get_plan_video_metadata(dict_file_data)
+            or get_video_metadata(file_path)
+        )
+        thumb = dict_file_data.get("thumb")
+        if thumb is None and file_id is None:
+            thumb = get_thumb(file_path, video_metadata["duration"])
+        elif hasattr(thumb, "seek"):
+            # thumbnail in memory, read again by each attempt
+            thumb.seek(0)
+        return types.InputMediaVideo(
+            media,
+            thumb=thumb,
+            caption=caption,
+            width=video_metadata["width"],
+            height=video_metadata["height"],
+            duration=video_metadata["duration"],
+            supports_streaming=True,
+        )
+    if type_file == "audio":
+        return types.InputMediaAudio(
+            media, caption=caption, **get_audio_metadata(file_path)
+        )
+    return types.InputMediaDocument(media, caption=caption)
+
+
+def get_album_file_id(list_dict_file_data, file_index, session_name):
+    """file_id of items already uploaded, by the file index
+
+    Returns:
+        list[str | None]: file_id of each item. None to upload it
+    """
+
+    list_file_id = []
+    for dict_file_data in list_dict_file_data:
+        content_hash = get_item_content_hash(dict_file_data, file_index)
+        dict_file_data["content_hash"] = content_hash
+        list_file_id.append(
+            file_index.find_file_id(content_hash, session_name)
+        )
+    return list_file_id
+
+
+async def send_album(
+    app, list_dict_file_data, chat_id, min_deadline=None, use_file_id=True
+):
+    """Send items as one album, by send_media_group
+
+    Args:
+        app (pyrogram.Client): started client. None for the shared one
+        list_dict_file_data (list[dict]): items of the album, from 2 to
+            ALBUM_MAX_ITEMS. keys file_output and description
+        chat_id (int | str): destination chat
+        min_deadline (float, optional): minimum seconds of the deadline
+            of the album, sized by the measured throughput.
+            send_media_group has no progress callback, so the album is
+            aborted only by this deadline. Each attempt has its own
+            deadline, without the waits of the rate limiter.
+            Defaults to None, for no deadline.
+        use_file_id (bool, optional): False to upload every item, also
+            those in the file index. Defaults to True.
+
+    Raises:
+        utils.UploadStalled: if the album overran its deadline
+
+    Returns:
+        list[pyrogram.types.Message]: message of each item, in order
+    """
+
+    app = await client.get_async_client(app)
+    file_index = client.get_file_index()
+    list_file_id = [None] * len(list_dict_file_data)
+    if file_index is not None and use_file_id:
+        list_file_id = await asyncio.to_thread(
+            get_album_file_id, list_dict_file_data, file_index, app.name
+        )
+
+    list_media = await asyncio.to_thread(
+        lambda: [
+            get_input_media(dict_file_data, file_id)
+            for dict_file_data, file_id in zip(
+                list_dict_file_data, list_file_id
+            )
+        ]
+    )
+    deadline_seconds = None
+    if min_deadline is not None:
+        watchdog = utils.UploadWatchdog(min_deadline=min_deadline)
+        deadline_seconds = watchdog.get_deadline_seconds(
+            get_album_size(list_dict_file_data)
+        ) or float(min_deadline)
+
+    async def send_media_group():
+
+        return await asyncio.wait_for(
+            app.send_media_group(chat_id, media=list_media),
+            timeout=deadline_seconds,
+        )
+
+    logging.warning(f"Sending album of {len(list_media)} items...")
+    try:
+        list_message = await utils.get_rate_limiter(app.name).call_async(
+            "upload", send_media_group
+        )
+    except asyncio.TimeoutError as e:
+        if deadline_seconds is None:
+            raise
+        raise utils.UploadStalled(
+            f"Album took more than {deadline_seconds:.0f}s"
+        ) from e
+    except FILE_ID_ERRORS as e:
+        if not any(list_file_id):
+            raise
+        # e.g.: expired file reference. The album is uploaded again
+        logging.warning(f"file_id refused. Uploading the album. {e}")
+        for file_id in filter(None, list_file_id):
+            file_index.forget_file_id(file_id, app.name)
+        return await send_album(
+            app,
+            list_dict_file_data,
+            chat_id,
+            min_deadline,
+            use_file_id=False,
+        )
+    except errors.BadRequest as e:
+        if utils.is_broken_upload(e):
+            # resumed, the retry would finalize the same missing part
+            for dict_file_data in list_dict_file_data:
+                client.remove_checkpoint(
+                    get_upload_path(dict_file_data), app.name
+                )
+        if not any(list_file_id):
+            raise
+        # e.g.: MEDIA_EMPTY. The file_ids are kept, the album is uploaded
+        logging.warning(f"Album not sent by file_id. Uploading. {e}")
+        return await send_album(
+            app,
+            list_dict_file_data,
+            chat_id,
+            min_deadline,
+            use_file_id=False,
+        )
+
+    for dict_file_data, message in zip(list_dict_file_data, list_message):
+        # an aborted upload keeps its checkpoint, to be resumed
+        client.remove_checkpoint(get_upload_path(dict_file_data), app.name)
+        if file_index is not None:
+            await asyncio.to_thread(
+                add_file_index, file_index, dict_file_data, message, app.name
+            )
+    return list_message
+
+
+def get_album_size(list_dict_file_data) -> int:
+    """Bytes of the files of an album"""
+
+    return sum(
+        Path(get_upload_path(dict_file_data)).stat().st_size
+        for dict_file_data in list_dict_file_data
+    )
@@ -1,16 +1,32 @@
 from __future__ import annotations
 
+import asyncio
+import functools
 import logging
-import os
 import sys
-import time
 from datetime import datetime
 from pathlib import Path
 
-from pyrogram import Client, types
+from pyrogram import errors, types
 
-from .. import utils
-from ..mediainfo import ffprobe
+from .. import client, utils
+from ..mediainfo import (
+    get_audio_metadata,
+    get_plan_video_metadata,
+    get_thumb,
+    get_type_file,
+    get_video_metadata,
+)
+from .scheduler import UploadScheduler
+
+# refusals of a stored file_id. Other errors are not about the file_id,
+# which is kept in the file index
+FILE_ID_ERRORS = (
+    errors.FileIdInvalid,
+    errors.FileReferenceEmpty,
+    errors.FileReferenceExpired,
+    errors.FileReferenceInvalid,
+)
 
 
 def logging_config():
@@ -32,9 +48,15 @@ def logging_config():
 
 
 async def get_telegram_app():
+    """Returns the telegram client shared by the async api, started"""
+
+    return await client.get_async_client()
+
 
-    app = Client("user")
-    return await app.start()
+async def stop_telegram_app():
+    """Stop the telegram client shared by the async api"""
+
+    await client.stop_async_client()
 
 
 async def ensure_connection():
@@ -42,13 +64,11 @@ async def ensure_connection():
     logging.warning("Ensuring connection...")
     if Path("user.session").exists():
         try:
-            async with Client(
-                "user", workdir=Path("user.session").absolute().parent
-            ) as app:
-                message = await app.send_message(
-                    "me", text="telegram filesender-Connected..."
-                )
-                await message.delete()
+            app = await client.get_async_client()
+            message = await app.send_message(
+                "me", text="telegram filesender-Connected..."
+            )
+            await message.delete()
             return
         except:
             print("Delete Session file and try again.")
@@ -58,11 +78,8 @@ async def ensure_connection():
             api_id = int(input("Enter your api_id: "))
             api_hash = input("Enter your api_hash: ")
 
-            async with Client(
-                "user",
-                api_id,
-                api_hash,
-                workdir=Path("user.session").absolute().parent,
+            async with client.create_client(
+                api_id=api_id, api_hash=api_hash
             ) as app:
                 message = await app.send_message(
                     "me", text="telegram filesender-Connected..."
@@ -84,41 +101,53 @@ def progress(current, total):
     sys.stdout.flush()
 
 
-def get_video_metadata(file_path):
-
-    try:
-        metadata = ffprobe(file_path).get_output_as_dict()
-        metadata_streams = metadata["streams"]
-        video_metadata = metadata_streams[0]
-    except:
-        # case of error, show all file metadata
-        print(file_path)
-        print(ffprobe(file_path).get_output_as_dict())
-        metadata = ffprobe(file_path).get_output_as_dict()
-        metadata_streams = metadata["streams"]
-        video_metadata = metadata_streams[0]
-    try:
-        width = video_metadata["width"]
-    except:
-        video_metadata = metadata_streams[1]
-    try:
-        width = video_metadata["width"]
-        height = video_metadata["height"]
-        duration = int(float(metadata["format"]["duration"]))
-        return {"width": width, "height": height, "duration": duration}
-    except Exception as e:
-        logging.error(f"File Error: {file_path}.\napi_telegram.py line 63")
-        raise ValueError(e)
+async def send_video(
+    app,
+    chat_id,
+    file_path,
+    caption,
+    progress=progress,
+    video_metadata=None,
+    thumb=None,
+):
+    """Send a video with its dimensions, duration and thumbnail
 
+    Args:
+        app (pyrogram.Client): started client. None for the shared one
+        chat_id (int | str): destination chat
+        file_path (str): video file path
+        caption (str): video caption
+        progress (Callable, optional): pyrogram progress callback
+        video_metadata (dict, optional): width, height and duration,
+            already probed. Defaults to None, to probe the video.
+        thumb (str | io.BytesIO, optional): thumbnail already made.
+            Defaults to None, to get one from the thumbnail cache.
 
-async def send_video(app, chat_id, file_path, caption):
+    Returns:
+        pyrogram.types.Message: message sent
+    """
 
     logging.warning("Sending video...")
+    app = await client.get_async_client(app)
+
+    # ffprobe and ffmpeg run outside the event loop,
+    # to not stall other uploads in flight. Not counted as upload time
+    with utils.watchdog_paused():
+        if video_metadata is None:
+            video_metadata = await asyncio.to_thread(
+                get_video_metadata, file_path
+            )
+        if thumb is None:
+            thumb = await asyncio.to_thread(
+                get_thumb, file_path, video_metadata["duration"]
+            )
+        elif hasattr(thumb, "seek"):
+            # thumbnail in memory, read again by each attempt
+            thumb.seek(0)
 
-    video_metadata = get_video_metadata(file_path)
-    thumb = utils.create_thumb(file_path)
-
-    return_ = await app.send_video(
+    return_ = await utils.get_rate_limiter(app.name).call_async(
+        "upload",
+        app.send_video,
         chat_id,
         file_path,
         caption=caption,
@@ -129,86 +158,108 @@ async def send_video(app, chat_id, file_path, caption):
         duration=video_metadata["duration"],
         thumb=thumb,
     )
-    os.remove(thumb)
     return return_
 
 
-async def send_sticker(chat_id, sticker):
+async def send_sticker(chat_id, sticker, app=None):
 
     logging.warning("Sending sticker...")
-    async with Client(
-        "user", workdir=Path("user.session").absolute().parent
-    ) as app:
-        return_ = await app.send_sticker(chat_id, sticker)
-        return return_
+    app = await client.get_async_client(app)
+    return_ = await utils.get_rate_limiter(app.name).call_async(
+        "message", app.send_sticker, chat_id, sticker
+    )
+    return return_
 
 
-async def send_audio(app, chat_id, file_path, caption):
+async def send_audio(app, chat_id, file_path, caption, progress=progress):
     logging.warning("Sending audio...")
-    return_ = await app.send_audio(
-        chat_id, file_path, caption=caption, progress=progress
+    app = await client.get_async_client(app)
+    # duration, performer and title, shown by the telegram player
+    with utils.watchdog_paused():
+        audio_metadata = await asyncio.to_thread(get_audio_metadata, file_path)
+    return_ = await utils.get_rate_limiter(app.name).call_async(
+        "upload",
+        app.send_audio,
+        chat_id,
+        file_path,
+        caption=caption,
+        progress=progress,
+        **audio_metadata,
     )
     return return_
 
 
-async def send_document(app, chat_id, file_path, caption):
+async def send_document(app, chat_id, file_path, caption, progress=progress):
 
     logging.warning("Sending document...")
-    return_ = await app.send_document(
-        chat_id, file_path, caption=caption, progress=progress
+    app = await client.get_async_client(app)
+    return_ = await utils.get_rate_limiter(app.name).call_async(
+        "upload",
+        app.send_document,
+        chat_id,
+        file_path,
+        caption=caption,
+        progress=progress,
     )
     return return_
 
 
-async def send_photo(chat_id, file_path, caption):
+async def send_photo(app, chat_id, file_path, caption, progress=progress):
 
     logging.warning("Sending photo...")
-    async with Client(
-        "user", workdir=Path("user.session").absolute().parent
-    ) as app:
-        return_ = await app.send_photo(
-            chat_id, file_path, caption=caption, progress=progress
-        )
+    app = await client.get_async_client(app)
+    return_ = await utils.get_rate_limiter(app.name).call_async(
+        "upload",
+        app.send_photo,
+        chat_id,
+        file_path,
+        caption=caption,
+        progress=progress,
+    )
     return return_
 
 
-async def send_message(chat_id, text):
+async def send_message(chat_id, text, app=None):
 
     logging.warning("Sending message...")
-    async with Client(
-        "user", workdir=Path("user.session").absolute().parent
-    ) as app:
-        return_ = await app.send_message(
-            chat_id, text=text, disable_web_page_preview=True
-        )
+    app = await client.get_async_client(app)
+    return_ = await utils.get_rate_limiter(app.name).call_async(
+        "message",
+        app.send_message,
+        chat_id,
+        text=text,
+        disable_web_page_preview=True,
+    )
     return return_
 
 
-async def pin_chat_message(chat_id, message_id):
+async def pin_chat_message(chat_id, message_id, app=None):
 
     logging.warning("Pinning message...")
-    async with Client(
-        "user", workdir=Path("user.session").absolute().parent
-    ) as app:
-        return_ = await app.pin_chat_message(
-            chat_id, message_id=message_id, both_sides=True
-        )
+    app = await client.get_async_client(app)
+    return_ = await utils.get_rate_limiter(app.name).call_async(
+        "message",
+        app.pin_chat_message,
+        chat_id,
+        message_id=message_id,
+        both_sides=True,
+    )
     return return_
 
 
-async def get_messages(chat_id, message_ids):
+async def get_messages(chat_id, message_ids, app=None):
 
-    async with Client(
-        "user", workdir=Path("user.session").absolute().parent
-    ) as app:
-        return_ = await app.get_messages(chat_id, message_ids)
+    app = await client.get_async_client(app)
+    return_ = await utils.get_rate_limiter(app.name).call_async(
+        "message", app.get_messages, chat_id, message_ids
+    )
     return return_
 
 
-def get_history(chat_id):
+async def get_history(chat_id, app=None):
 
-    with Client("user", workdir=Path("user.session").absolute().parent) as app:
-        return_ = app.get_history(chat_id)
+    app = await client.get_async_client(app)
+    return_ = [message async for message in app.get_chat_history(chat_id)]
     return return_
 
 
@@ -237,46 +288,54 @@ def get_list_media_doc(list_dict_sent_doc):
     return list_media_doc
 
 
-async def send_media_group(chat_id, list_media):
+async def send_media_group(chat_id, list_media, app=None):
 
-    async with Client(
-        "user", workdir=Path("user.session").absolute().parent
-    ) as app:
-        return_ = await app.send_media_group(chat_id, media=list_media)
+    app = await client.get_async_client(app)
+    return_ = await utils.get_rate_limiter(app.name).call_async(
+        "message", app.send_media_group, chat_id, media=list_media
+    )
     return return_
 
 
-async def delete_messages(chat_id, list_message_id):
+async def delete_messages(chat_id, list_message_id, app=None):
 
-    async with Client(
-        "user", workdir=Path("user.session").absolute().parent
-    ) as app:
-        return_ = await app.delete_messages(
-            chat_id=chat_id, message_ids=list_message_id
-        )
+    app = await client.get_async_client(app)
+    return_ = await utils.get_rate_limiter(app.name).call_async(
+        "message",
+        app.delete_messages,
+        chat_id=chat_id,
+        message_ids=list_message_id,
+    )
     return return_
 
 
-async def send_file(app, dict_file_data, chat_id):
+def get_upload_path(dict_file_data) -> str:
+    """File uploaded for an item. A faststart copy, if the prefetch stage
+    made one, or the file of the plan"""
+
+    return dict_file_data.get("file_upload") or dict_file_data["file_output"]
 
-    file_path = dict_file_data["file_output"]
+
+async def send_file(app, dict_file_data, chat_id, progress=progress):
+
+    file_path = get_upload_path(dict_file_data)
     description = dict_file_data["description"]
-    file_extension = Path(file_path).suffix.lower()
-    if file_extension == ".mp4":
-        type_file = "video"
-    elif file_extension == ".mp3":
-        type_file = "audio"
-    elif file_extension in [".png", ".jpg", ".jpeg", ".gif"]:
-        type_file = "photo"
-    else:
-        type_file = "document"
+    # type and metadata saved in the plan by the preflight
+    type_file = dict_file_data.get("type") or get_type_file(file_path)
 
     if type_file == "video":
+        # metadata and thumbnail, if prepared by the prefetch stage
+        video_metadata = dict_file_data.get(
+            "video_metadata"
+        ) or get_plan_video_metadata(dict_file_data)
         return_ = await send_video(
             app,
             chat_id=chat_id,
             file_path=file_path,
             caption=description,
+            progress=progress,
+            video_metadata=video_metadata,
+            thumb=dict_file_data.get("thumb"),
         )
     elif type_file == "audio":
         return_ = await send_audio(
@@ -284,6 +343,7 @@ async def send_file(app, dict_file_data, chat_id):
             chat_id=chat_id,
             file_path=file_path,
             caption=description,
+            progress=progress,
         )
     elif type_file == "photo":
         return_ = await send_photo(
@@ -291,6 +351,7 @@ async def send_file(app, dict_file_data, chat_id):
             chat_id=chat_id,
             file_path=file_path,
             caption=description,
+            progress=progress,
         )
     elif type_file == "document":
         return_ = await send_document(
@@ -298,12 +359,272 @@ async def send_file(app, dict_file_data, chat_id):
             chat_id=chat_id,
             file_path=file_path,
             caption=description,
+            progress=progress,
+        )
+
+    return return_
+
+
+async def send_file_watched(
+    app,
+    dict_file_data,
+    chat_id,
+    stall_timeout=120,
+    min_deadline=None,
+    index_sent=True,
+):
+    """Send a file under an upload watchdog
+
+    Args:
+        app (pyrogram.Client): started client. None for the shared one
+        dict_file_data (dict): keys file_output and description
+        chat_id (int | str): destination chat
+        stall_timeout (float, optional): seconds without upload progress
+            to abort the upload. Defaults to 120.
+        min_deadline (float, optional): minimum seconds of the overall
+            deadline, sized by the measured throughput.
+            Defaults to None, for no overall deadline.
+        index_sent (bool, optional): False if the message is not the
+            final one, e.g. staged in Saved Messages, to be indexed by the
+            caller once published. Defaults to True.
+
+    Raises:
+        utils.UploadStalled: if upload was aborted by the watchdog
+
+    Returns:
+        pyrogram.types.Message: message sent
+    """
+
+    app = await client.get_async_client(app)
+    file_index = client.get_file_index()
+    if file_index is not None:
+        return_ = await send_file_by_file_id(
+            app, dict_file_data, chat_id, file_index
         )
+        if return_ is not None:
+            if index_sent:
+                await asyncio.to_thread(
+                    add_file_index,
+                    file_index,
+                    dict_file_data,
+                    return_,
+                    app.name,
+                )
+            return return_
 
+    file_path = get_upload_path(dict_file_data)
+    watchdog = utils.UploadWatchdog(stall_timeout, min_deadline)
+    try:
+        return_ = await watchdog.run(
+            send_file(
+                app,
+                dict_file_data,
+                chat_id,
+                progress=watchdog.wrap_progress(progress),
+            ),
+            Path(file_path).stat().st_size,
+        )
+    except Exception as e:
+        if utils.is_broken_upload(e):
+            # resumed, the retry would finalize the same missing part
+            client.remove_checkpoint(file_path, app.name)
+        raise
+    # an aborted upload keeps its checkpoint, to be resumed
+    client.remove_checkpoint(file_path, app.name)
+    if file_index is not None and index_sent:
+        await asyncio.to_thread(
+            add_file_index, file_index, dict_file_data, return_, app.name
+        )
     return return_
 
 
-async def send_files(list_dict, chat_id, time_limit=20):
+async def send_file_by_file_id(app, dict_file_data, chat_id, file_index):
+    """Post a file already uploaded, by its file_id, without upload
+
+    Args:
+        app (pyrogram.Client): started client
+        dict_file_data (dict): keys file_output and description.
+            duplicate_checked and content_hash, if looked up by the
+            prefetch stage
+        chat_id (int | str): destination chat
+        file_index (client.FileIndex): index of uploaded files
+
+    Returns:
+        pyrogram.types.Message | None: message sent. None if the file is
+            not in the index or telegram did not take its file_id, to
+            upload the file
+    """
+
+    content_hash = await asyncio.to_thread(
+        get_item_content_hash, dict_file_data, file_index
+    )
+    file_id = file_index.find_file_id(content_hash, app.name)
+    if file_id is None:
+        return None
+    logging.warning("Sending duplicate by file_id...")
+    try:
+        return await utils.get_rate_limiter(app.name).call_async(
+            "message",
+            app.send_cached_media,
+            chat_id,
+            file_id,
+            caption=dict_file_data["description"],
+        )
+    except FILE_ID_ERRORS as e:
+        # e.g.: expired file reference. The file is uploaded again
+        logging.warning(f"file_id refused. Uploading the file. {e}")
+        file_index.forget_file_id(file_id, app.name)
+        return None
+    except errors.BadRequest as e:
+        # e.g.: MEDIA_EMPTY. The file_id is kept, the file is uploaded
+        logging.warning(f"Duplicate not sent by file_id. Uploading. {e}")
+        return None
+
+
+def get_item_content_hash(dict_file_data, file_index):
+    """Content hash of an item, if it may be a duplicate. The result of
+    the prefetch stage is used, without reading the file again
+
+    Returns:
+        str | None: content hash. None if the file is not indexed
+    """
+
+    if dict_file_data.get("content_hash") or dict_file_data.get(
+        "duplicate_checked"
+    ):
+        return dict_file_data.get("content_hash")
+    return file_index.get_content_hash(dict_file_data["file_output"])
+
+
+def add_file_index(file_index, dict_file_data, message, session_name):
+    """Record the message sent, and the file_id of its file, in the index"""
+
+    file_id = client.get_message_file_id(message)
+    file_index.add_sent(
+        dict_file_data["file_output"],
+        message.chat.id,
+        message.id,
+        file_id,
+        session_name,
+        dict_file_data.get("content_hash"),
+        message.date,
+    )
+    if file_id is None:
+        return
+    try:
+        file_index.add(
+            dict_file_data["file_output"],
+            file_id,
+            session_name,
+            dict_file_data.get("content_hash"),
+        )
+    except OSError as e:
+        logging.warning(f"File not indexed. {e}")
+
+
+async def publish_message(
+    message, chat_id, staging: str = "me", session_name: str = None
+):
+    """Publish an uploaded message in the chat
+
+    Args:
+        message (pyrogram.types.Message): message uploaded by an account
+        chat_id (int): destination chat
+        staging (str, optional): 'me' if message is in Saved Messages,
+            to be copied to the chat. 'channel' if message was uploaded
+            to the chat. Defaults to "me".
+
+    Returns:
+        pyrogram.types.Message: message in the chat
+    """
+
+    if staging == "channel":
+        return message
+    rate_limiter = utils.get_rate_limiter(session_name)
+    published = await rate_limiter.call_async("message", message.copy, chat_id)
+    try:
+        await rate_limiter.call_async("message", message.delete)
+    except Exception as e:
+        # raised again, a retry would post the file twice
+        logging.warning(f"Staged message not deleted. {e}")
+    return published
+
+
+async def send_file_until_success(
+    app,
+    dict_file_data,
+    chat_id,
+    order_label,
+    retry_policy=None,
+    stall_timeout=120,
+    min_deadline=None,
+    index_sent=True,
+):
+    """Send a file, retrying errors by the retry policy.
+    Uploads that stall are aborted and retried as transient errors.
+
+    Args:
+        app (pyrogram.Client): started client. None for the shared one
+        dict_file_data (dict): keys file_output and description
+        chat_id (int | str): destination chat
+        order_label (str): position of file, for log. e.g.: 2/10
+        retry_policy (utils.RetryPolicy, optional): Defaults to None,
+            to use the default policy.
+        stall_timeout (float, optional): seconds without upload progress
+            to abort the upload. Defaults to 120.
+        min_deadline (float, optional): minimum seconds of the overall
+            deadline. Defaults to None, for no overall deadline.
+        index_sent (bool, optional): see send_file_watched.
+            Defaults to True.
+
+    Raises:
+        utils.RetryError: on permanent error or when attempts are over
+
+    Returns:
+        pyrogram.types.Message: message sent
+    """
+
+    logging.warning(
+        f"{order_label} Uploading: {dict_file_data['file_output']}"
+    )
+    app = await client.get_async_client(app)
+    retry_policy = retry_policy or utils.RetryPolicy()
+    return await retry_policy.call_async(
+        send_file_watched,
+        app,
+        dict_file_data,
+        chat_id,
+        stall_timeout,
+        min_deadline,
+        index_sent,
+        label=order_label,
+    )
+
+
+async def send_file_or_none(
+    app, dict_file_data, chat_id, order_label, **kwargs
+):
+    """Same as send_file_until_success, returning None if file failed"""
+
+    try:
+        return await send_file_until_success(
+            app, dict_file_data, chat_id, order_label, **kwargs
+        )
+    except utils.RetryError as e:
+        logging.error(f"{order_label} Failed: {e}")
+        return None
+
+
+async def send_files(
+    list_dict,
+    chat_id,
+    time_limit=20,
+    app=None,
+    max_concurrent=1,
+    dict_type_limit=None,
+    retry_policy=None,
+    stall_timeout=120,
+):
     """Sends a series of files to the same chat_id
 
     Args:
@@ -311,134 +632,184 @@ async def send_files(list_dict, chat_id, time_limit=20):
             file_path=Absolute file_path
             description=file description
             file_output=file name for log
+        app (pyrogram.Client, optional): started client.
+            Defaults to None, to use the client shared by the async api.
+        max_concurrent (int, optional): maximum uploads in flight.
+            With more than 1, files are uploaded to Saved Messages and
+            copied to the chat in list_dict order, as uploads finish out
+            of order. Defaults to 1.
+        dict_type_limit (dict[str, int], optional): maximum uploads in
+            flight by file type. e.g.: {"video": 1}. Defaults to None.
+        time_limit (int, optional): minimum minutes of the overall
+            deadline of each upload. Defaults to 20.
+        retry_policy (utils.RetryPolicy, optional): Defaults to None,
+            to use the default policy.
+        stall_timeout (float, optional): seconds without upload progress
+            to abort an upload. Defaults to 120.
+
+    Returns:
+        list: pyrogram return of each item, in list_dict order.
+            None for files missing or that failed.
     """
 
-    list_return = []
     len_list_dict = len(list_dict)
 
-    app = await get_telegram_app()
+    app = await client.get_async_client(app)
+    retry_policy = retry_policy or utils.RetryPolicy()
+    file_index = client.get_file_index()
+    staging = "me" if max_concurrent > 1 else "channel"
+    destination = "me" if staging == "me" else chat_id
+    loop = asyncio.get_running_loop()
+    # upload of each item, awaited by the publisher in list_dict order
+    list_future = [loop.create_future() for _ in list_dict]
+
+    async def upload(index, dict_file_data, order_label):
 
+        message = await send_file_or_none(
+            app,
+            dict_file_data,
+            destination,
+            order_label,
+            retry_policy=retry_policy,
+            stall_timeout=stall_timeout,
+            min_deadline=time_limit * 60,
+            index_sent=staging == "channel",
+        )
+        list_future[index].set_result(message)
+
+    async def publish():
+
+        list_return = []
+        for index, future in enumerate(list_future):
+            message = await future
+            if message is not None and staging == "me":
+                message = await publish_staged(
+                    app,
+                    list_dict[index],
+                    message,
+                    chat_id,
+                    f"{index+1}/{len_list_dict}",
+                    retry_policy,
+                    file_index,
+                )
+            list_return.append(message)
+        return list_return
+
+    list_job = []
     for index, d in enumerate(list_dict):
-        order = index + 1
         file_path = d["file_output"]
-
         if not Path(file_path).exists():
             logging.error(f"file not exist. {file_path}")
+            list_future[index].set_result(None)
             continue
+        func_ = functools.partial(
+            upload, index, d, f"{index+1}/{len_list_dict}"
+        )
+        list_job.append((get_type_file(file_path), func_))
+
+    scheduler = UploadScheduler(max_concurrent, dict_type_limit)
+    task_publish = asyncio.create_task(publish())
+    try:
+        await scheduler.run(list_job)
+    except BaseException:
+        task_publish.cancel()
+        raise
+    return await task_publish
+
+
+async def publish_staged(
+    app,
+    dict_file_data,
+    message,
+    chat_id,
+    order_label,
+    retry_policy,
+    file_index=None,
+):
+    """Copy a message staged in Saved Messages to the chat, and record
+    the published message in the file index
+
+    Returns:
+        pyrogram.types.Message | None: message in the chat. None if the
+            copy failed by the retry policy
+    """
 
-        logging.warning(f"{order}/{len_list_dict} Uploading: {file_path}")
-
-        file_extension = Path(file_path).suffix
-        description = d["description"]
-
-        if file_extension == ".mp4":
-            type_file = "video"
-        elif file_extension == ".mp3":
-            type_file = "audio"
-        elif file_extension in [".png", ".jpg", ".jpeg", ".gif"]:
-            type_file = "photo"
-        else:
-            type_file = "document"
-
-        while True:
-            try:
-                if type_file == "video":
-                    return_ = await send_video(
-                        app,
-                        chat_id=chat_id,
-                        file_path=file_path,
-                        caption=description,
-                    )
-                elif type_file == "audio":
-                    return_ = await send_audio(
-                        app,
-                        chat_id=chat_id,
-                        file_path=file_path,
-                        caption=description,
-                    )
-                elif type_file == "photo":
-                    return_ = await send_photo(
-                        app,
-                        chat_id=chat_id,
-                        file_path=file_path,
-                        caption=description,
-                    )
-                elif type_file == "document":
-                    return_ = await send_document(
-                        app,
-                        chat_id=chat_id,
-                        file_path=file_path,
-                        caption=description,
-                    )
-                break
-            except Exception as e:
-                print(e)
-                print("\nError. Trying again...")
-                time.sleep(30)
-                continue
-        list_return.append(return_)
-    await app.stop()
-    return list_return
-
-
-async def create_channel(title, description):
-
-    async with Client(
-        "user", workdir=Path("user.session").absolute().parent
-    ) as app:
-        return_chat = await app.create_channel(
-            title=title, description=description
+    try:
+        published = await retry_policy.call_async(
+            publish_message,
+            message,
+            chat_id,
+            "me",
+            app.name,
+            label=order_label,
+        )
+    except utils.RetryError as e:
+        logging.error(f"{order_label} Failed: {e}")
+        return None
+    if file_index is not None:
+        await asyncio.to_thread(
+            add_file_index, file_index, dict_file_data, published, app.name
         )
+    return published
+
+
+async def create_channel(title, description, app=None):
+
+    app = await client.get_async_client(app)
+    return_chat = await utils.get_rate_limiter(app.name).call_async(
+        "admin", app.create_channel, title=title, description=description
+    )
     chat_id = return_chat.id
     return chat_id
 
 
-async def add_chat_members(chat_id, user_ids):
+async def add_chat_members(chat_id, user_ids, app=None):
 
-    async with Client(
-        "user", workdir=Path("user.session").absolute().parent
-    ) as app:
-        return_chat = await app.add_chat_members(
-            chat_id=chat_id, user_ids=user_ids
-        )
+    app = await client.get_async_client(app)
+    return_chat = await utils.get_rate_limiter(app.name).call_async(
+        "admin", app.add_chat_members, chat_id=chat_id, user_ids=user_ids
+    )
 
 
-async def promote_chat_members(chat_id, user_ids):
+async def promote_chat_members(chat_id, user_ids, app=None):
 
-    async with Client(
-        "user", workdir=Path("user.session").absolute().parent
-    ) as app:
+    app = await client.get_async_client(app)
 
-        privileges_config = types.ChatPrivileges(
-            can_change_info=True,
-            can_post_messages=True,
-            can_edit_messages=True,
-            can_delete_messages=True,
-            can_promote_members=True,
-        )
+    privileges_config = types.ChatPrivileges(
+        can_change_info=True,
+        can_post_messages=True,
+        can_edit_messages=True,
+        can_delete_messages=True,
+        can_promote_members=True,
+    )
 
-        for user_id in user_ids:
-            await app.promote_chat_member(
-                chat_id=chat_id, user_id=user_id, privileges=privileges_config
-            )
+    for user_id in user_ids:
+        await utils.get_rate_limiter(app.name).call_async(
+            "admin",
+            app.promote_chat_member,
+            chat_id=chat_id,
+            user_id=user_id,
+            privileges=privileges_config,
+        )
 
 
-async def set_chat_description(chat_id, description):
+async def set_chat_description(chat_id, description, app=None):
 
-    async with Client(
-        "user", workdir=Path("user.session").absolute().parent
-    ) as app:
-        await app.set_chat_description(
-            chat_id=chat_id, description=description
-        )
+    app = await client.get_async_client(app)
+    await utils.get_rate_limiter(app.name).call_async(
+        "admin",
+        app.set_chat_description,
+        chat_id=chat_id,
+        description=description,
+    )
 
 
-async def export_chat_invite_link(chat_id):
+async def export_chat_invite_link(chat_id, app=None):
 
-    async with Client(
-        "user", workdir=Path("user.session").absolute().parent
-    ) as app:
-        return_ = await app.export_chat_invite_link(chat_id=chat_id)
+    app = await client.get_async_client(app)
+    return_ = await utils.get_rate_limiter(app.name).call_async(
+        "admin", app.export_chat_invite_link, chat_id=chat_id
+    )
 
     return return_
 
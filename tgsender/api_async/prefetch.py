@@ -0,0 +1,185 @@
+"""
+Prefetch of video metadata and thumbnails.
+
+While a file uploads, a pool of threads probes and thumbnails the next
+items of the plan, and hashes the ones that may be duplicates of uploaded
+files, so ffprobe, ffmpeg and disk reads do not leave the network idle.
+Items come out in plan order, through a bounded window of prepared files.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .. import client
+from ..mediainfo import (
+    discard_faststart_file,
+    get_faststart_file,
+    get_plan_video_metadata,
+    get_thumb,
+    get_type_file,
+    get_video_metadata,
+)
+
+
+def prepare_file(dict_file_data) -> dict:
+    """Probe and thumbnail a video, and remux it to faststart if enabled.
+    Other files are returned as they are. On error the video is returned
+    unprepared, to be probed on upload.
+
+    Args:
+        dict_file_data (dict | PlanRow): keys file_output and description
+
+    Returns:
+        dict: item data, with keys video_metadata, thumb and, if
+            remuxed, file_upload for videos. duplicate_checked once
+            looked up in the file index, and content_hash for files that
+            may be posted by file_id
+    """
+
+    dict_prepared = {key: dict_file_data[key] for key in dict_file_data.keys()}
+    file_path = dict_prepared["file_output"]
+    if not os.path.exists(file_path):
+        return dict_prepared
+    file_index = client.get_file_index()
+    if file_index is not None:
+        try:
+            content_hash = file_index.get_content_hash(file_path)
+        except OSError as e:
+            logging.warning(f"Prefetch failed: {file_path}. {e}")
+            content_hash = None
+        else:
+            # not hashed again on upload
+            dict_prepared["duplicate_checked"] = True
+        if content_hash is not None:
+            # duplicate, to be posted without upload
+            dict_prepared["content_hash"] = content_hash
+            return dict_prepared
+    if get_type_file(file_path) != "video":
+        return dict_prepared
+    try:
+        # probed by the preflight, if it ran
+        dict_prepared["video_metadata"] = get_plan_video_metadata(
+            dict_prepared
+        ) or get_video_metadata(file_path)
+        dict_prepared["thumb"] = get_thumb(
+            file_path, dict_prepared["video_metadata"]["duration"]
+        )
+        file_path_faststart = get_faststart_file(file_path)
+        if file_path_faststart is not None:
+            dict_prepared["file_upload"] = file_path_faststart
+    except Exception as e:
+        logging.warning(f"Prefetch failed: {file_path}. {e}")
+    return dict_prepared
+
+
+def discard_prepared(dict_prepared: dict):
+    """Release the thumbnail and remove the faststart copy of a prepared
+    item, after its upload. Thumbnails in the cache are kept for next runs
+    """
+
+    thumb = dict_prepared.pop("thumb", None)
+    if hasattr(thumb, "close"):
+        thumb.close()
+    discard_faststart_file(dict_prepared.pop("file_upload", None))
+
+
+class Prefetcher:
+    """Iterate items prepared ahead by a pool of threads.
+    Supports sync and async iteration.
+
+    Args:
+        iter_item (Iterable[tuple[int, dict]]): (index, dict_file_data)
+            in plan order
+        workers (int, optional): threads preparing items. Defaults to 2.
+        lookahead (int, optional): items prepared ahead. Defaults to 4.
+        prepare (Callable, optional): function that prepares one item.
+            Defaults to prepare_file.
+    """
+
+    def __init__(
+        self, iter_item, workers: int = 2, lookahead: int = 4, prepare=None
+    ):
+
+        self.iter_item = iter(iter_item)
+        self.lookahead = max(1, int(lookahead))
+        self.prepare = prepare or prepare_file
+        self.executor = ThreadPoolExecutor(
+            max(1, int(workers)), thread_name_prefix="Prefetch"
+        )
+        self.deque_future = deque()
+        self.is_exhausted = False
+
+    def fill(self):
+        """Submit items until the window is full"""
+
+        while (
+            not self.is_exhausted and len(self.deque_future) < self.lookahead
+        ):
+            item = next(self.iter_item, None)
+            if item is None:
+                self.is_exhausted = True
+                break
+            index, dict_file_data = item
+            future = self.executor.submit(self.prepare, dict_file_data)
+            self.deque_future.append((index, future))
+
+    def pop(self):
+
+        self.fill()
+        if len(self.deque_future) == 0:
+            self.close()
+            return None
+        item = self.deque_future.popleft()
+        # the next item starts while this one uploads
+        self.fill()
+        return item
+
+    def __iter__(self):
+
+        return self
+
+    def __next__(self):
+
+        item = self.pop()
+        if item is None:
+            raise StopIteration
+        index, future = item
+        return index, future.result()
+
+    def __aiter__(self):
+
+        return self
+
+    async def __anext__(self):
+
+        item = self.pop()
+        if item is None:
+            raise StopAsyncIteration
+        index, future = item
+        return index, await asyncio.wrap_future(future)
+
+    def close(self):
+        """Stop the threads and release thumbnails not consumed"""
+
+        while self.deque_future:
+            _, future = self.deque_future.popleft()
+            if future.cancel():
+                continue
+            try:
+                discard_prepared(future.result())
+            except Exception:
+                pass
+        self.executor.shutdown(wait=False)
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *args):
+
+        self.close()
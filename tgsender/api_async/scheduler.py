@@ -0,0 +1,124 @@
+"""
+Bounded concurrency for uploads in asyncio.
+
+Jobs start in plan order, limited by a total of uploads in flight and by a
+limit per file type. A job whose type is full does not block the next ones,
+so small files are not stuck behind a large video. Results keep plan order.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections import Counter
+
+
+class UploadScheduler:
+    """Run upload jobs with bounded concurrency
+
+    Args:
+        max_concurrent (int, optional): maximum uploads in flight.
+            Defaults to 1.
+        dict_type_limit (dict[str, int], optional): maximum uploads in
+            flight by file type. e.g.: {"video": 2}. Defaults to None.
+        lookahead (int, optional): how many pending jobs are checked for
+            a free type. Defaults to None, to use 4 * max_concurrent.
+
+    Raises:
+        ValueError: if a type limit is below 1, as its jobs never start
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 1,
+        dict_type_limit: dict[str, int] = None,
+        lookahead: int = None,
+    ):
+
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.dict_type_limit = dict_type_limit or {}
+        for type_file, type_limit in self.dict_type_limit.items():
+            if int(type_limit) < 1:
+                raise ValueError(
+                    f"Upload limit of {type_file} must be at least 1"
+                )
+        self.lookahead = lookahead or 4 * self.max_concurrent
+
+    def has_capacity(self, type_file: str, in_flight: Counter) -> bool:
+
+        if sum(in_flight.values()) >= self.max_concurrent:
+            return False
+        type_limit = self.dict_type_limit.get(type_file)
+        return type_limit is None or in_flight[type_file] < type_limit
+
+    def pick_next(self, list_pending: list[int], list_job, in_flight):
+        """Returns position in list_pending of the first job that can start"""
+
+        for position, index in enumerate(list_pending[: self.lookahead]):
+            type_file = list_job[index][0]
+            if self.has_capacity(type_file, in_flight):
+                return position
+        return None
+
+    async def run(self, list_job: list) -> list:
+        """Run jobs and return their results in the order of list_job
+
+        Args:
+            list_job (list[tuple[str, Callable]]): list of
+                (type_file, async function without arguments)
+
+        Returns:
+            list: job returns, in the order of list_job
+        """
+
+        list_result = [None] * len(list_job)
+        list_pending = list(range(len(list_job)))
+        in_flight = Counter()
+        condition = asyncio.Condition()
+        list_task = []
+
+        async def run_job(index):
+
+            type_file, func_ = list_job[index]
+            try:
+                list_result[index] = await func_()
+            finally:
+                async with condition:
+                    in_flight[type_file] -= 1
+                    condition.notify_all()
+
+        async with condition:
+            while list_pending:
+                position = self.pick_next(list_pending, list_job, in_flight)
+                if position is None:
+                    await condition.wait()
+                    continue
+                index = list_pending.pop(position)
+                in_flight[list_job[index][0]] += 1
+                list_task.append(asyncio.create_task(run_job(index)))
+
+        await asyncio.gather(*list_task)
+        return list_result
+
+
+def parse_type_limit(value: str) -> dict[str, int]:
+    """Limits by file type from a config value. e.g.: "video:1, photo:4"
+
+    Args:
+        value (str): pairs of file type and limit, separated by comma
+
+    Raises:
+        ValueError: if a pair is malformed
+
+    Returns:
+        dict[str, int]: maximum uploads in flight by file type
+    """
+
+    dict_type_limit = {}
+    for pair in (value or "").split(","):
+        if not pair.strip():
+            continue
+        type_file, separator, type_limit = pair.partition(":")
+        if not separator:
+            raise ValueError(f"Upload type limit must be type:limit: {pair}")
+        dict_type_limit[type_file.strip()] = int(type_limit)
+    return dict_type_limit
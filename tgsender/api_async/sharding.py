@@ -0,0 +1,195 @@
+"""
+Upload sharding across many telegram accounts.
+
+Each account pulls the next item of the plan when it is free, so faster
+accounts take more files. Uploads go to the Saved Messages of the account
+and are then copied to the channel in plan order, by the same account, so
+each file is uploaded only once and the posts keep the plan order.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from pathlib import Path
+
+from .. import utils
+from .api_telegram import publish_message, send_file_until_success
+
+SHARD_STAGINGS = ["me", "channel"]
+
+
+async def send_files_sharded(
+    iter_item,
+    chat_id,
+    dict_app: dict,
+    staging: str = "me",
+    on_published=None,
+    max_pending: int = None,
+    on_failed=None,
+    retry_policy=None,
+    stall_timeout: float = 120,
+    min_deadline: float = None,
+):
+    """Send files using many accounts, each one uploading a share of them
+
+    Args:
+        iter_item (Iterable | AsyncIterable): (index, dict_file_data)
+            in plan order. dict_file_data with keys file_output, description.
+            e.g.: a Prefetcher
+        chat_id (int): destination chat
+        dict_app (dict[str, pyrogram.Client]): session name: started client
+        staging (str, optional): 'me', to upload to Saved Messages and copy
+            to the chat in plan order. 'channel', to upload straight to the
+            chat, in the order uploads finish. Defaults to "me".
+        on_published (Callable, optional): called as
+            on_published(index, dict_file_data, message, session_name)
+            after each file reaches the chat. Uploads are not recorded in
+            the file index, as the staged messages are deleted. Record
+            the published message here. Defaults to None.
+        max_pending (int, optional): maximum of files uploaded and not
+            published yet. Defaults to None, to use 2 by account.
+        on_failed (Callable, optional): called as
+            on_failed(index, dict_file_data, error) for files whose upload
+            or publication failed by the retry policy. Defaults to None.
+        retry_policy (utils.RetryPolicy, optional): policy of uploads and
+            publications. Defaults to None, to use the default policy.
+        stall_timeout (float, optional): seconds without upload progress
+            to abort an upload. Defaults to 120.
+        min_deadline (float, optional): minimum seconds of the overall
+            deadline of each upload. Defaults to None, for no deadline.
+
+    Returns:
+        int: number of files published
+    """
+
+    if staging not in SHARD_STAGINGS:
+        raise ValueError(f"staging must be one of {SHARD_STAGINGS}")
+    if len(dict_app) == 0:
+        raise ValueError("No account to send files")
+
+    if hasattr(iter_item, "__aiter__"):
+        iter_item = iter_item.__aiter__()
+
+        async def get_next_item():
+
+            try:
+                return await iter_item.__anext__()
+            except StopAsyncIteration:
+                return None, None
+
+    else:
+        iter_item = iter(iter_item)
+
+        async def get_next_item():
+
+            return next(iter_item, (None, None))
+
+    retry_policy = retry_policy or utils.RetryPolicy()
+    destination = "me" if staging == "me" else chat_id
+    max_pending = max_pending or 2 * len(dict_app)
+    # released by the publisher, so uploads do not run far ahead of it
+    slots = asyncio.Semaphore(max_pending)
+    queue_publish = asyncio.Queue()
+    lock_next = asyncio.Lock()
+    count_account_working = len(dict_app)
+    loop = asyncio.get_running_loop()
+
+    async def upload(session_name, app):
+
+        nonlocal count_account_working
+        try:
+            while True:
+                await slots.acquire()
+                # take the item and queue its future under the lock,
+                # so the publisher receives them in plan order
+                async with lock_next:
+                    index, dict_file_data = await get_next_item()
+                    if dict_file_data is None:
+                        slots.release()
+                        return
+                    future = loop.create_future()
+                    queue_publish.put_nowait(
+                        (index, dict_file_data, session_name, future)
+                    )
+
+                file_path = dict_file_data["file_output"]
+                if not Path(file_path).exists():
+                    logging.error(f"file not exist. {file_path}")
+                    future.set_result(None)
+                    continue
+                order_label = f"{index+1} [{session_name}]"
+                try:
+                    message = await send_file_until_success(
+                        app,
+                        dict_file_data,
+                        destination,
+                        order_label,
+                        retry_policy,
+                        stall_timeout,
+                        min_deadline,
+                        index_sent=False,
+                    )
+                except utils.RetryError as e:
+                    logging.error(f"{order_label} Failed: {e}")
+                    future.set_result(None)
+                    if on_failed is not None:
+                        on_failed(index, dict_file_data, e)
+                    continue
+                except BaseException as e:
+                    future.set_exception(e)
+                    raise
+                future.set_result(message)
+        finally:
+            count_account_working -= 1
+            if count_account_working == 0:
+                queue_publish.put_nowait(None)
+
+    async def publish():
+
+        count_published = 0
+        while True:
+            item = await queue_publish.get()
+            if item is None:
+                return count_published
+            index, dict_file_data, session_name, future = item
+            try:
+                message = await future
+                if message is None:
+                    continue
+                order_label = f"{index+1} [{session_name}]"
+                try:
+                    published = await retry_policy.call_async(
+                        publish_message,
+                        message,
+                        chat_id,
+                        staging,
+                        session_name,
+                        label=order_label,
+                    )
+                except utils.RetryError as e:
+                    logging.error(f"{order_label} Not published: {e}")
+                    if on_failed is not None:
+                        on_failed(index, dict_file_data, e)
+                    continue
+                count_published += 1
+                if on_published is not None:
+                    on_published(
+                        index, dict_file_data, published, session_name
+                    )
+            finally:
+                slots.release()
+
+    list_task = [
+        asyncio.create_task(upload(session_name, app))
+        for session_name, app in dict_app.items()
+    ]
+    task_publish = asyncio.create_task(publish())
+    try:
+        # an error of the publisher stops the uploads, waiting for slots
+        *_, count_published = await asyncio.gather(*list_task, task_publish)
+        return count_published
+    except BaseException:
+        for task in list_task + [task_publish]:
+            task.cancel()
+        raise
@@ -0,0 +1,4 @@
+from .accounts import *
+from .checkpoint import *
+from .file_index import *
+from .session import *
@@ -0,0 +1,99 @@
+"""
+Pool of telegram accounts, one session file each, used to share an upload.
+"""
+
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+
+from .session import SESSION_NAME, create_client, get_async_client, get_workdir
+
+
+def get_list_session_file(session_files: str) -> list[Path]:
+    """Parse the session_files config value
+
+    Args:
+        session_files (str): session file paths, separated by comma.
+            e.g.: "user.session, account2.session"
+
+    Returns:
+        list[Path]: absolute session file paths.
+            The default 'user.session' if session_files is empty.
+    """
+
+    list_session_file = [
+        Path(session_file.strip()).absolute()
+        for session_file in (session_files or "").split(",")
+        if session_file.strip()
+    ]
+    if len(list_session_file) == 0:
+        list_session_file = [get_workdir() / (SESSION_NAME + ".session")]
+    return list_session_file
+
+
+def is_shared_session(session_file: Path) -> bool:
+    """True if session file is the one of the client shared by the api"""
+
+    return session_file == get_workdir() / (SESSION_NAME + ".session")
+
+
+class AccountPool:
+    """Started clients of many accounts, for the async api.
+    The default account reuses the client shared by the api.
+
+    Args:
+        list_session_file (list[Path]): session file of each account.
+            Session files must be already authorized.
+    """
+
+    def __init__(self, list_session_file: list[Path]):
+
+        self.list_session_file = [Path(x) for x in list_session_file]
+        self.dict_app = {}
+
+    @property
+    def list_session_name(self) -> list[str]:
+
+        return [session_file.stem for session_file in self.list_session_file]
+
+    async def start(self) -> dict:
+        """Start the client of each account
+
+        Returns:
+            dict[str, pyrogram.Client]: session name: started client
+        """
+
+        for session_file in self.list_session_file:
+            session_name = session_file.stem
+            if session_name in self.dict_app:
+                raise ValueError(f"Duplicate session name: {session_name}")
+            if is_shared_session(session_file):
+                app = await get_async_client()
+            else:
+                logging.info("Starting telegram client: %s", session_file)
+                app = create_client(session_name, session_file.parent)
+                await app.start()
+            self.dict_app[session_name] = app
+        return self.dict_app
+
+    async def stop(self):
+        """Stop the clients started by the pool. The shared client is kept"""
+
+        for session_file in self.list_session_file:
+            app = self.dict_app.pop(session_file.stem, None)
+            if app is None or is_shared_session(session_file):
+                continue
+            try:
+                await app.stop()
+            except Exception as e:
+                logging.error("Error stopping %s. %s", session_file, e)
+
+    async def __aenter__(self):
+
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+
+        await self.stop()
@@ -0,0 +1,271 @@
+"""
+Checkpoints of large file uploads.
+
+Telegram keeps the parts of an unfinished upload for a while, by file id.
+A checkpoint records that file id and the parts already acknowledged, so a
+new attempt, even from a new process, sends only the missing parts. It is
+a json header line followed by one line by part, appended as parts finish.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+# telegram drops unfinished uploads after some hours
+CHECKPOINT_TTL = 6 * 60 * 60
+MIB = 1024 * 1024
+
+
+class UploadSettings:
+    """Settings of the upload engine, shared by all clients of the run
+
+    Args:
+        folder_path_checkpoint (Path, optional): folder of checkpoints.
+            Defaults to None, to not resume uploads.
+        checkpoint_ttl (float, optional): seconds a checkpoint is valid.
+            Defaults to CHECKPOINT_TTL.
+        part_workers (int, optional): parts of a file uploaded at once.
+            Defaults to 4.
+        media_sessions (int, optional): connections to the media DC,
+            shared by the part workers. Defaults to 1.
+        max_bytes_in_flight (int, optional): maximum bytes of parts being
+            uploaded, by client, among all files. Defaults to 16 MiB.
+        concurrent_files (int, optional): files uploaded at once by
+            client, the max_concurrent_transmissions of pyrogram.
+            Defaults to 1.
+    """
+
+    def __init__(
+        self,
+        folder_path_checkpoint: Path = None,
+        checkpoint_ttl: float = CHECKPOINT_TTL,
+        part_workers: int = 4,
+        media_sessions: int = 1,
+        max_bytes_in_flight: int = 16 * MIB,
+        concurrent_files: int = 1,
+    ):
+
+        self.folder_path_checkpoint = folder_path_checkpoint
+        self.checkpoint_ttl = checkpoint_ttl
+        self.part_workers = part_workers
+        self.media_sessions = media_sessions
+        self.max_bytes_in_flight = max_bytes_in_flight
+        self.concurrent_files = concurrent_files
+
+
+upload_settings = UploadSettings()
+
+
+def get_checkpoint_folder(folder_path_project: Path) -> Path:
+    """Folder of upload checkpoints, next to the log_sent folder
+
+    Args:
+        folder_path_project (Path): project folder, with upload_plan.csv
+
+    Returns:
+        Path: checkpoint folder. e.g.: project/upload_checkpoint
+    """
+
+    return Path(folder_path_project) / "upload_checkpoint"
+
+
+def configure_upload(**kwargs) -> UploadSettings:
+    """Update the upload settings. See UploadSettings arguments"""
+
+    for key, value in kwargs.items():
+        if not hasattr(upload_settings, key):
+            raise ValueError(f"Unknown upload setting: {key}")
+        setattr(upload_settings, key, value)
+    return upload_settings
+
+
+def configure_upload_from_config(
+    dict_config: dict, folder_path_project: Path = None
+) -> UploadSettings:
+    """Update the upload settings from config keys resume_uploads,
+    upload_part_workers, upload_media_sessions, upload_concurrent_files
+    and upload_max_mib_in_flight
+
+    Args:
+        dict_config (dict): configuration data
+        folder_path_project (Path, optional): project folder, where
+            checkpoints are kept. Defaults to None, to not resume uploads.
+    """
+
+    folder_path_checkpoint = None
+    if folder_path_project is not None and int(
+        dict_config.get("resume_uploads", 1)
+    ):
+        folder_path_checkpoint = get_checkpoint_folder(folder_path_project)
+    dict_setting = {"folder_path_checkpoint": folder_path_checkpoint}
+    for key in ["part_workers", "media_sessions", "concurrent_files"]:
+        value = dict_config.get(f"upload_{key}")
+        if value:
+            dict_setting[key] = max(1, int(value))
+    value = dict_config.get("upload_max_mib_in_flight")
+    if value:
+        dict_setting["max_bytes_in_flight"] = int(float(value) * MIB)
+    return configure_upload(**dict_setting)
+
+
+def get_upload_settings() -> UploadSettings:
+
+    return upload_settings
+
+
+class UploadCheckpoint:
+    """Checkpoint of the upload of one file
+
+    Args:
+        checkpoint_path (Path): checkpoint file path.
+            None for a checkpoint kept only in memory
+        header (dict): file_path, file_size, mtime_ns, part_size,
+            file_id and created
+        set_part (set[int], optional): parts acknowledged.
+            Defaults to None.
+    """
+
+    def __init__(self, checkpoint_path: Path, header: dict, set_part=None):
+
+        self.checkpoint_path = checkpoint_path and Path(checkpoint_path)
+        self.header = header
+        self.set_part = set(set_part or [])
+
+    @property
+    def file_id(self) -> int:
+
+        return self.header["file_id"]
+
+    @staticmethod
+    def get_path(
+        folder_path_checkpoint: Path, file_path: Path, session_name: str
+    ) -> Path:
+        """Checkpoint file path. File ids are valid only for the account
+        that made the upload, so each account has its own checkpoint"""
+
+        key = f"{session_name}:{Path(file_path).absolute()}".encode("utf-8")
+        name = hashlib.sha1(key).hexdigest()[:16]
+        return Path(folder_path_checkpoint) / f"{name}.checkpoint"
+
+    @staticmethod
+    def get_file_header(
+        file_path: Path, part_size: int, session_name: str
+    ) -> dict:
+
+        stat = os.stat(file_path)
+        return {
+            "session_name": session_name,
+            "file_path": str(Path(file_path).absolute()),
+            "file_size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "part_size": part_size,
+        }
+
+    @classmethod
+    def open(
+        cls,
+        folder_path_checkpoint: Path,
+        file_path: Path,
+        part_size: int,
+        session_name: str,
+        new_file_id,
+        ttl: float = CHECKPOINT_TTL,
+    ) -> UploadCheckpoint:
+        """Load the checkpoint of a file, or start a new one.
+        Checkpoints of a changed file, or older than ttl, are discarded.
+
+        Args:
+            folder_path_checkpoint (Path): folder of checkpoints
+            file_path (Path): file to upload
+            part_size (int): bytes by part
+            session_name (str): account that uploads the file
+            new_file_id (Callable): returns a file id for a new upload
+            ttl (float, optional): seconds a checkpoint is valid.
+                Defaults to CHECKPOINT_TTL.
+
+        Returns:
+            UploadCheckpoint: checkpoint of the file
+        """
+
+        checkpoint_path = cls.get_path(
+            folder_path_checkpoint, file_path, session_name
+        )
+        header_file = cls.get_file_header(file_path, part_size, session_name)
+        checkpoint = cls.load(checkpoint_path)
+        if checkpoint is not None:
+            header = {key: checkpoint.header.get(key) for key in header_file}
+            is_expired = time.time() - checkpoint.header["created"] > ttl
+            if header == header_file and not is_expired:
+                logging.warning(
+                    f"Resuming upload: {len(checkpoint.set_part)} parts "
+                    f"already sent. {file_path}"
+                )
+                return checkpoint
+            checkpoint.remove()
+
+        header = dict(header_file, file_id=new_file_id(), created=time.time())
+        checkpoint = cls(checkpoint_path, header)
+        checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(checkpoint_path, "w", encoding="utf-8") as file:
+            file.write(json.dumps(header) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        return checkpoint
+
+    @classmethod
+    def load(cls, checkpoint_path: Path):
+        """Read a checkpoint file. None if missing or unreadable.
+        A torn last line, from a process killed while writing, is ignored.
+        """
+
+        if not Path(checkpoint_path).exists():
+            return None
+        set_part = set()
+        with open(checkpoint_path, "r", encoding="utf-8") as file:
+            try:
+                header = json.loads(file.readline())
+            except json.JSONDecodeError:
+                return None
+            for line in file:
+                line = line.strip()
+                if line.isdigit():
+                    set_part.add(int(line))
+        return cls(checkpoint_path, header, set_part)
+
+    def add_part(self, file_part: int):
+        """Record a part acknowledged by telegram"""
+
+        self.set_part.add(file_part)
+        if self.checkpoint_path is None:
+            return
+        # not synced by part. A part lost in a crash is only sent again
+        with open(self.checkpoint_path, "a", encoding="utf-8") as file:
+            file.write(f"{file_part}\n")
+
+    def remove(self):
+
+        if self.checkpoint_path is not None and self.checkpoint_path.exists():
+            os.remove(self.checkpoint_path)
+
+
+def remove_checkpoint(file_path: Path, session_name: str):
+    """Remove the checkpoint of a file, after its message was sent
+
+    Args:
+        file_path (Path): file uploaded
+        session_name (str): account that uploaded the file
+    """
+
+    folder_path_checkpoint = upload_settings.folder_path_checkpoint
+    if folder_path_checkpoint is None:
+        return
+    checkpoint_path = UploadCheckpoint.get_path(
+        folder_path_checkpoint, file_path, session_name
+    )
+    if checkpoint_path.exists():
+        os.remove(checkpoint_path)
@@ -0,0 +1,472 @@
+"""
+Index of uploaded files by content.
+
+Files already uploaded are recorded with their telegram file_id. Before an
+upload, a file is compared with the index by size, then by a hash of its
+first and last bytes and only then by a hash of its whole content, so most
+files are never read. A file found in the index is posted by file_id,
+without upload.
+
+Messages sent are also recorded, by file path, content hash, chat and
+message id, live and from the json files of log_sent, so a plan already
+sent can be posted again to another chat without upload.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# bytes read from start and end of a file for its sample hash
+SAMPLE_SIZE = 64 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+# message attributes with the media of a file
+MESSAGE_MEDIA_ATTRIBUTES = [
+    "video",
+    "audio",
+    "photo",
+    "document",
+    "animation",
+    "voice",
+    "video_note",
+]
+
+SQL_CREATE_FILE_TABLE = """
+CREATE TABLE IF NOT EXISTS file (
+    file_path TEXT NOT NULL,
+    session_name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sample_hash TEXT NOT NULL,
+    content_hash TEXT,
+    file_id TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (file_path, session_name)
+);
+CREATE INDEX IF NOT EXISTS idx_file_sample ON file (size, sample_hash);
+CREATE INDEX IF NOT EXISTS idx_file_content ON file (content_hash);
+CREATE TABLE IF NOT EXISTS sent (
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    file_path TEXT NOT NULL,
+    content_hash TEXT,
+    file_id TEXT,
+    session_name TEXT,
+    date TEXT,
+    PRIMARY KEY (chat_id, message_id)
+);
+CREATE INDEX IF NOT EXISTS idx_sent_path ON sent (file_path);
+CREATE INDEX IF NOT EXISTS idx_sent_content ON sent (content_hash);
+CREATE TABLE IF NOT EXISTS indexed_log (
+    log_path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+"""
+SENT_FILTERS = ["file_path", "content_hash", "chat_id", "message_id"]
+
+
+def get_sample_hash(file_path) -> str:
+    """Hash of size, first and last bytes of a file"""
+
+    size = os.path.getsize(file_path)
+    hash_ = hashlib.blake2b(f"{size}:".encode("utf-8"), digest_size=20)
+    with open(file_path, "rb") as file:
+        hash_.update(file.read(SAMPLE_SIZE))
+        if size > 2 * SAMPLE_SIZE:
+            file.seek(-SAMPLE_SIZE, os.SEEK_END)
+            hash_.update(file.read(SAMPLE_SIZE))
+    return hash_.hexdigest()
+
+
+def get_content_hash(file_path) -> str:
+    """Hash of the whole content of a file, read in chunks"""
+
+    hash_ = hashlib.blake2b(digest_size=20)
+    with open(file_path, "rb") as file:
+        while True:
+            chunk = file.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            hash_.update(chunk)
+    return hash_.hexdigest()
+
+
+def get_message_file_id(message):
+    """Returns the file_id of the media of a pyrogram message.
+    None for messages without media"""
+
+    for attribute in MESSAGE_MEDIA_ATTRIBUTES:
+        media = getattr(message, attribute, None)
+        if media is not None and getattr(media, "file_id", None):
+            return media.file_id
+    return None
+
+
+def get_dict_message_file_id(dict_message: dict):
+    """Returns the file_id of the media of a message saved as json, as in
+    log_sent. None for messages without media"""
+
+    for attribute in MESSAGE_MEDIA_ATTRIBUTES:
+        media = dict_message.get(attribute)
+        if isinstance(media, dict) and media.get("file_id"):
+            return media["file_id"]
+    return None
+
+
+def get_default_index_path() -> Path:
+    """User wide index database. e.g.: ~/.cache/tgsender/file_index.sqlite"""
+
+    from ..mediainfo import get_cache_folder
+
+    return get_cache_folder() / "file_index.sqlite"
+
+
+class FileIndex:
+    """Uploaded files by content, with their telegram file_id.
+    Safe to share between threads.
+
+    Args:
+        database_path (Path, optional): sqlite file.
+            Defaults to None, to use get_default_index_path.
+    """
+
+    def __init__(self, database_path: Path = None):
+
+        self.database_path = Path(database_path or get_default_index_path())
+        self.lock = threading.RLock()
+        self.database_path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(
+            self.database_path, timeout=30, check_same_thread=False
+        )
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SQL_CREATE_FILE_TABLE)
+        self.connection.commit()
+
+    def close(self):
+
+        with self.lock:
+            self.connection.close()
+
+    def get_stored_content_hash(self, row):
+        """Content hash of an indexed file, computed on first need.
+        None if the file is gone or changed since indexed"""
+
+        if row["content_hash"]:
+            return row["content_hash"]
+        try:
+            stat = os.stat(row["file_path"])
+        except OSError:
+            return None
+        if (stat.st_size, stat.st_mtime_ns) != (row["size"], row["mtime_ns"]):
+            return None
+        content_hash = get_content_hash(row["file_path"])
+        self.set_content_hash(row, content_hash)
+        return content_hash
+
+    def set_content_hash(self, row, content_hash: str):
+
+        with self.lock:
+            self.connection.execute(
+                "UPDATE file SET content_hash = ? "
+                "WHERE file_path = ? AND session_name = ?",
+                (content_hash, row["file_path"], row["session_name"]),
+            )
+            self.connection.commit()
+
+    def get_content_hash(self, file_path):
+        """Content hash of a file, only if it may be a duplicate of an
+        indexed file. Files of a size not indexed are not read, and files
+        of a sample hash not indexed are read only at start and end.
+
+        Args:
+            file_path (Path): file to upload
+
+        Returns:
+            str | None: content hash. None if the file is not indexed
+        """
+
+        file_path = str(Path(file_path).absolute())
+        stat = os.stat(file_path)
+        size = stat.st_size
+        with self.lock:
+            count = self.connection.execute(
+                "SELECT COUNT(*) FROM file WHERE size = ?", (size,)
+            ).fetchone()[0]
+        if count == 0:
+            return None
+        sample_hash = get_sample_hash(file_path)
+        with self.lock:
+            list_row = self.connection.execute(
+                "SELECT * FROM file WHERE size = ? AND sample_hash = ?",
+                (size, sample_hash),
+            ).fetchall()
+        if len(list_row) == 0:
+            return None
+        for row in list_row:
+            if (
+                row["file_path"] == file_path
+                and row["mtime_ns"] == stat.st_mtime_ns
+            ):
+                # same file, sent before. Hashed at most once
+                return self.get_stored_content_hash(row)
+        content_hash = get_content_hash(file_path)
+        for row in list_row:
+            if self.get_stored_content_hash(row) == content_hash:
+                return content_hash
+        return None
+
+    def find_file_id(self, content_hash: str, session_name: str):
+        """file_id of a file uploaded by the account. A file_id is valid
+        only for the account that uploaded the file
+
+        Args:
+            content_hash (str): content hash, from get_content_hash
+            session_name (str): account that will send the file
+
+        Returns:
+            str | None: file_id. None if not found
+        """
+
+        if content_hash is None:
+            return None
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT file_id FROM file "
+                "WHERE content_hash = ? AND session_name = ? "
+                "ORDER BY created DESC LIMIT 1",
+                (content_hash, session_name),
+            ).fetchone()
+        return None if row is None else row["file_id"]
+
+    def add(
+        self,
+        file_path,
+        file_id: str,
+        session_name: str,
+        content_hash: str = None,
+    ):
+        """Record an uploaded file
+
+        Args:
+            file_path (Path): file uploaded
+            file_id (str): telegram file_id of the message media
+            session_name (str): account that uploaded the file
+            content_hash (str, optional): content hash, if known.
+                Defaults to None, to compute it on first need.
+        """
+
+        file_path = str(Path(file_path).absolute())
+        stat = os.stat(file_path)
+        sample_hash = get_sample_hash(file_path)
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO file (file_path, session_name, "
+                "size, mtime_ns, sample_hash, content_hash, file_id, "
+                "created) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    file_path,
+                    session_name,
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    sample_hash,
+                    content_hash,
+                    file_id,
+                    time.time(),
+                ),
+            )
+            self.connection.commit()
+
+    def forget_file_id(self, file_id: str, session_name: str):
+        """Remove a file_id refused by telegram. e.g.: expired reference
+
+        Args:
+            file_id (str): file_id refused
+            session_name (str): account that sent the file_id
+        """
+
+        with self.lock:
+            self.connection.execute(
+                "DELETE FROM file WHERE file_id = ? AND session_name = ?",
+                (file_id, session_name),
+            )
+            self.connection.commit()
+
+    def add_sent(
+        self,
+        file_path,
+        chat_id: int,
+        message_id: int,
+        file_id: str = None,
+        session_name: str = None,
+        content_hash: str = None,
+        date: str = None,
+    ):
+        """Record a message sent with a file
+
+        Args:
+            file_path (Path): file of the plan
+            chat_id (int): chat of the message
+            message_id (int): message id
+            file_id (str, optional): file_id of the message media.
+                Defaults to None.
+            session_name (str, optional): account that sent the message.
+                Defaults to None.
+            content_hash (str, optional): content hash, if known.
+                Defaults to None.
+            date (str, optional): message date. Defaults to None.
+        """
+
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO sent (chat_id, message_id, "
+                "file_path, content_hash, file_id, session_name, date) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    int(chat_id),
+                    int(message_id),
+                    str(Path(file_path).absolute()),
+                    content_hash,
+                    file_id,
+                    session_name,
+                    None if date is None else str(date),
+                ),
+            )
+            self.connection.commit()
+
+    def find_sent(self, **filters) -> list[dict]:
+        """Messages sent, by file_path, content_hash, chat_id or
+        message_id. e.g.: find_sent(file_path=path, chat_id=chat_id)
+
+        Returns:
+            list[dict]: messages, newest first
+        """
+
+        list_condition = []
+        list_value = []
+        for key, value in filters.items():
+            if key not in SENT_FILTERS:
+                raise ValueError(f"find_sent filters: {SENT_FILTERS}")
+            if key == "file_path":
+                value = str(Path(value).absolute())
+            list_condition.append(f"{key} = ?")
+            list_value.append(value)
+        where = " AND ".join(list_condition) or "1"
+        with self.lock:
+            list_row = self.connection.execute(
+                f"SELECT * FROM sent WHERE {where} "
+                "ORDER BY date DESC, message_id DESC",
+                list_value,
+            ).fetchall()
+        return [dict(row) for row in list_row]
+
+    def find_sent_file_id(self, file_path):
+        """file_id of the last message sent with a file. None if not sent"""
+
+        for dict_sent in self.find_sent(file_path=file_path):
+            if dict_sent["file_id"]:
+                return dict_sent["file_id"]
+        return None
+
+    def index_log_sent(self, folder_path_log_sent: Path) -> int:
+        """Record the messages saved in the json files of log_sent.
+        Files already indexed, and not changed since, are skipped.
+
+        Args:
+            folder_path_log_sent (Path): log_sent folder of a project
+
+        Returns:
+            int: number of messages recorded
+        """
+
+        folder_path_log_sent = Path(folder_path_log_sent)
+        if not folder_path_log_sent.exists():
+            return 0
+        with self.lock:
+            dict_indexed = dict(
+                self.connection.execute(
+                    "SELECT log_path, mtime_ns FROM indexed_log"
+                ).fetchall()
+            )
+        count_sent = 0
+        for entry in os.scandir(folder_path_log_sent):
+            if not entry.name.endswith(".json") or not entry.is_file():
+                continue
+            mtime_ns = entry.stat().st_mtime_ns
+            if dict_indexed.get(entry.path) == mtime_ns:
+                continue
+            try:
+                with open(entry.path, "r", encoding="utf-8") as file:
+                    dict_message = json.load(file)
+                self.add_sent(
+                    dict_message["file_origin"],
+                    dict_message["chat"]["id"],
+                    dict_message["id"],
+                    get_dict_message_file_id(dict_message),
+                    dict_message.get("session_name"),
+                    date=dict_message.get("date"),
+                )
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logging.warning(f"Log not indexed: {entry.path}. {e}")
+                continue
+            with self.lock:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO indexed_log (log_path, mtime_ns) "
+                    "VALUES (?, ?)",
+                    (entry.path, mtime_ns),
+                )
+                self.connection.commit()
+            count_sent += 1
+        return count_sent
+
+
+_file_index = None
+_file_index_settings = {"enabled": False, "database_path": None}
+
+
+def configure_file_index(enabled: bool = False, database_path: Path = None):
+    """Set the index used to skip uploads of duplicated files
+
+    Args:
+        enabled (bool, optional): True to post duplicates by file_id.
+            Defaults to False.
+        database_path (Path, optional): sqlite file.
+            Defaults to None, for the user wide index.
+    """
+
+    global _file_index
+    if _file_index is not None:
+        _file_index.close()
+        _file_index = None
+    _file_index_settings.update(enabled=enabled, database_path=database_path)
+
+
+def configure_file_index_from_config(dict_config: dict):
+    """Set the file index from config keys dedup and file_index_path"""
+
+    configure_file_index(
+        bool(int(dict_config.get("dedup") or 0)),
+        dict_config.get("file_index_path") or None,
+    )
+
+
+def get_file_index():
+    """Returns the shared file index. None if disabled or unavailable"""
+
+    global _file_index
+    if not _file_index_settings["enabled"]:
+        return None
+    if _file_index is None:
+        try:
+            _file_index = FileIndex(_file_index_settings["database_path"])
+        except (OSError, sqlite3.Error) as e:
+            logging.warning(f"File index disabled. {e}")
+            _file_index_settings["enabled"] = False
+            return None
+    return _file_index
@@ -0,0 +1,252 @@
+"""
+Telegram client kept alive for the whole run.
+
+Opening a pyrogram Client costs a handshake and an auth check. The sessions
+here start one client on first use and share it with every call, of the sync
+and async api, starting it again when it was disconnected or when used from
+a forked process. Only one client by session file is kept started, since
+pyrogram holds a lock on the session database while running.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import atexit
+import logging
+import os
+from pathlib import Path
+
+SESSION_NAME = "user"
+
+
+def get_workdir() -> Path:
+    """Folder of the session file 'user.session'"""
+
+    return Path("user.session").absolute().parent
+
+
+def create_client(session_name: str = SESSION_NAME, workdir=None, **kwargs):
+    """Build a pyrogram Client, not started
+
+    Args:
+        session_name (str, optional): session file name, without extension.
+            Defaults to "user".
+        workdir (Path, optional): folder of session file.
+            Defaults to None, to use the current folder.
+        kwargs: other pyrogram.Client arguments. e.g.: api_id, api_hash.
+            max_concurrent_transmissions defaults to the concurrent_files
+            of the upload settings, so concurrent uploads are not
+            serialized by pyrogram.
+
+    Returns:
+        UploadClient: telegram client, a pyrogram.Client with resumable
+            uploads
+    """
+
+    from .checkpoint import get_upload_settings
+    from .upload import UploadClient
+
+    kwargs.setdefault(
+        "max_concurrent_transmissions",
+        max(1, int(get_upload_settings().concurrent_files)),
+    )
+    if workdir is None:
+        workdir = get_workdir()
+    return UploadClient(session_name, workdir=workdir, **kwargs)
+
+
+class ClientSession:
+    """One started client shared by all calls of the sync and async api.
+    For the sync api, the client runs in its own event loop, so it keeps
+    working between calls of asyncio.run made by other parts of the program.
+    Coroutines run with `run` share that same client.
+
+    Args:
+        session_name (str, optional): session file name, without extension.
+            Defaults to "user".
+        workdir (Path, optional): folder of session file.
+            Defaults to None, to use the current folder.
+    """
+
+    def __init__(self, session_name: str = SESSION_NAME, workdir=None):
+
+        self.session_name = session_name
+        self.workdir = workdir
+        self.app = None
+        self.loop = None
+        self.pid = None
+
+    def get(self):
+        """Returns the started client, starting it if necessary
+
+        Returns:
+            pyrogram.Client: started telegram client
+        """
+
+        if self.app is not None and self.pid != os.getpid():
+            # inherited from parent process. Its connection is not ours
+            self.app = None
+            self.loop = None
+
+        if self.loop is None or self.loop.is_closed():
+            self.loop = asyncio.new_event_loop()
+            self.app = None
+        # pyrogram sync methods run in the current event loop
+        asyncio.set_event_loop(self.loop)
+
+        if self.app is None:
+            logging.info("Starting telegram client: %s", self.session_name)
+            self.app = create_client(self.session_name, self.workdir)
+            self.pid = os.getpid()
+            self.app.start()
+        elif not self.app.is_connected:
+            logging.warning("Telegram client disconnected. Reconnecting...")
+            self.app.start()
+        return self.app
+
+    async def get_async(self):
+        """Returns the started client for the running event loop.
+        A client started in another event loop is stopped and replaced.
+
+        Returns:
+            pyrogram.Client: started telegram client
+        """
+
+        loop = asyncio.get_running_loop()
+        if self.app is not None and self.pid != os.getpid():
+            self.app = None
+            self.loop = None
+
+        if self.app is not None and self.loop is not loop:
+            # the loop of that client is free, so it can run in a thread
+            await asyncio.to_thread(self.stop)
+
+        if self.app is None:
+            logging.info("Starting telegram client: %s", self.session_name)
+            self.loop = loop
+            self.app = create_client(self.session_name, self.workdir)
+            self.pid = os.getpid()
+            await self.app.start()
+        elif not self.app.is_connected:
+            logging.warning("Telegram client disconnected. Reconnecting...")
+            await self.app.start()
+        return self.app
+
+    def run(self, coroutine):
+        """Run a coroutine in the event loop of the shared client,
+        so the async api reuses the client of the sync api
+
+        Args:
+            coroutine (Coroutine): coroutine to run
+
+        Returns:
+            type undefined: coroutine return
+        """
+
+        if self.app is not None and self.pid != os.getpid():
+            self.app = None
+            self.loop = None
+        if self.loop is None or self.loop.is_closed():
+            self.loop = asyncio.new_event_loop()
+            self.app = None
+        asyncio.set_event_loop(self.loop)
+        return self.loop.run_until_complete(coroutine)
+
+    def reconnect(self):
+        """Restart the client. Use after connection errors
+
+        Returns:
+            pyrogram.Client: started telegram client
+        """
+
+        self.stop()
+        return self.get()
+
+    def stop(self):
+        """Stop the client, if it was started by this process"""
+
+        if self.app is None or self.pid != os.getpid():
+            return
+        if self.loop.is_closed():
+            logging.error("Telegram client left running in a closed loop")
+            self.app = None
+            return
+        asyncio.set_event_loop(self.loop)
+        try:
+            if self.app.is_connected:
+                self.app.stop()
+        except Exception as e:
+            logging.error("Error stopping telegram client. %s", e)
+        self.app = None
+
+    async def stop_async(self):
+        """Stop the client, from the running event loop"""
+
+        if self.app is None or self.pid != os.getpid():
+            return
+        if self.loop is not asyncio.get_running_loop():
+            await asyncio.to_thread(self.stop)
+            return
+        try:
+            if self.app.is_connected:
+                await self.app.stop()
+        except Exception as e:
+            logging.error("Error stopping telegram client. %s", e)
+        self.app = None
+
+
+client_session = ClientSession()
+atexit.register(client_session.stop)
+
+
+def get_client():
+    """Returns the telegram client shared by the sync api"""
+
+    return client_session.get()
+
+
+def reconnect_client():
+    """Restart the telegram client shared by the sync api"""
+
+    return client_session.reconnect()
+
+
+def stop_client():
+    """Stop the telegram client shared by the sync api"""
+
+    client_session.stop()
+
+
+async def get_async_client(app=None):
+    """Returns the telegram client to be used by the async api
+
+    Args:
+        app (pyrogram.Client, optional): client already started, injected
+            by the caller. Defaults to None, to use the shared client.
+
+    Returns:
+        pyrogram.Client: started telegram client
+    """
+
+    if app is not None:
+        return app
+    return await client_session.get_async()
+
+
+async def stop_async_client():
+    """Stop the telegram client shared by the async api"""
+
+    await client_session.stop_async()
+
+
+def run_in_client_loop(coroutine):
+    """Run a coroutine sharing the telegram client of the sync api
+
+    Args:
+        coroutine (Coroutine): coroutine to run
+
+    Returns:
+        type undefined: coroutine return
+    """
+
+    return client_session.run(coroutine)
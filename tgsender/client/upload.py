@@ -0,0 +1,281 @@
+"""
+Upload engine for large files.
+
+pyrogram.Client.save_file restarts every upload from the first part and
+only logs parts that fail, leaving a broken file. UploadClient sends the
+parts of large files itself: each acknowledged part is recorded in a
+checkpoint, a part that fails fails the upload, and a new attempt sends
+only the parts still missing.
+
+Parts are sent by a configurable number of workers over a pool of media
+connections, kept open between files, with a budget of bytes in flight
+shared by all uploads of the client. On high latency links, throughput
+grows with the parts in flight.
+
+Importing this module imports pyrogram.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import inspect
+import math
+import os
+from pathlib import PurePath
+
+from pyrogram import Client, raw
+from pyrogram.session import Session
+from pyrogram.sync import async_to_sync
+
+from .checkpoint import UploadCheckpoint, get_upload_settings
+
+PART_SIZE = 512 * 1024
+# files from this size are sent as big files, by telegram rules
+BIG_FILE_SIZE = 10 * 1024 * 1024
+
+
+class BytesBudget:
+    """Bound the bytes in flight among concurrent uploads
+
+    Args:
+        max_bytes (int): maximum bytes in flight
+    """
+
+    def __init__(self, max_bytes: int):
+
+        self.max_bytes = max_bytes
+        self.bytes_in_flight = 0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self, count_bytes: int):
+
+        # a single part larger than the budget is still allowed to go
+        async with self.condition:
+            await self.condition.wait_for(
+                lambda: self.bytes_in_flight == 0
+                or self.bytes_in_flight + count_bytes <= self.max_bytes
+            )
+            self.bytes_in_flight += count_bytes
+
+    async def release(self, count_bytes: int):
+
+        async with self.condition:
+            self.bytes_in_flight -= count_bytes
+            self.condition.notify_all()
+
+
+class UploadClient(Client):
+    """pyrogram Client with resumable, parallel uploads of large files"""
+
+    def __init__(self, *args, **kwargs):
+
+        super().__init__(*args, **kwargs)
+        self.list_media_session = []
+        self.lock_media_session = None
+        self.bytes_budget = None
+
+    async def save_file(
+        self,
+        path,
+        file_id: int = None,
+        file_part: int = 0,
+        progress=None,
+        progress_args: tuple = (),
+    ):
+
+        if (
+            file_id is not None
+            or not isinstance(path, (str, PurePath))
+            or os.path.getsize(path) <= BIG_FILE_SIZE
+        ):
+            return await super().save_file(
+                path, file_id, file_part, progress, progress_args
+            )
+
+        async with self.save_file_semaphore:
+            return await save_big_file(self, path, progress, progress_args)
+
+    async def get_media_sessions(self, count: int) -> list:
+        """Returns started connections to the media DC, opening the
+        missing ones. Connections are kept for the next files.
+
+        Args:
+            count (int): number of connections
+
+        Returns:
+            list[Session]: started media sessions
+        """
+
+        if self.lock_media_session is None:
+            self.lock_media_session = asyncio.Lock()
+        async with self.lock_media_session:
+            while len(self.list_media_session) < count:
+                session = Session(
+                    self,
+                    await self.storage.dc_id(),
+                    await self.storage.auth_key(),
+                    await self.storage.test_mode(),
+                    is_media=True,
+                )
+                await session.start()
+                self.list_media_session.append(session)
+        return self.list_media_session[:count]
+
+    async def stop_media_sessions(self):
+
+        list_media_session, self.list_media_session = (
+            self.list_media_session,
+            [],
+        )
+        for session in list_media_session:
+            await session.stop()
+
+    def get_bytes_budget(self, max_bytes: int) -> BytesBudget:
+
+        if (
+            self.bytes_budget is None
+            or self.bytes_budget.max_bytes != max_bytes
+        ):
+            self.bytes_budget = BytesBudget(max_bytes)
+        return self.bytes_budget
+
+    async def stop(self, *args, **kwargs):
+
+        await self.stop_media_sessions()
+        return await super().stop(*args, **kwargs)
+
+
+# usable from sync code, as the pyrogram.Client methods they override
+async_to_sync(UploadClient, "save_file")
+async_to_sync(UploadClient, "stop")
+
+
+async def call_progress(app, progress, current, total, progress_args):
+    """Call a progress callback as pyrogram does"""
+
+    if progress is None:
+        return
+    func_ = functools.partial(progress, current, total, *progress_args)
+    if inspect.iscoroutinefunction(progress):
+        await func_()
+    else:
+        await app.loop.run_in_executor(app.executor, func_)
+
+
+def open_checkpoint(app, path) -> UploadCheckpoint:
+    """Checkpoint of the upload. Kept only in memory if resume is off"""
+
+    settings = get_upload_settings()
+    if settings.folder_path_checkpoint is None:
+        return UploadCheckpoint(None, {"file_id": app.rnd_id()})
+    return UploadCheckpoint.open(
+        settings.folder_path_checkpoint,
+        path,
+        PART_SIZE,
+        app.name,
+        app.rnd_id,
+        settings.checkpoint_ttl,
+    )
+
+
+async def save_big_file(app, path, progress=None, progress_args=()):
+    """Upload the parts of a big file still missing in its checkpoint
+
+    Args:
+        app (UploadClient): started client
+        path (str | Path): file path
+        progress (Callable, optional): pyrogram progress callback
+        progress_args (tuple, optional): progress extra arguments
+
+    Returns:
+        raw.types.InputFileBig: uploaded file
+    """
+
+    settings = get_upload_settings()
+    file_size = os.path.getsize(path)
+    file_size_limit_mib = 4000 if app.me.is_premium else 2000
+    if file_size > file_size_limit_mib * 1024 * 1024:
+        raise ValueError(
+            f"Can't upload files bigger than {file_size_limit_mib} MiB"
+        )
+
+    checkpoint = open_checkpoint(app, path)
+    file_total_parts = int(math.ceil(file_size / PART_SIZE))
+    queue_part = asyncio.Queue()
+    for file_part in range(file_total_parts):
+        if file_part not in checkpoint.set_part:
+            queue_part.put_nowait(file_part)
+    count_done = file_total_parts - queue_part.qsize()
+    if count_done:
+        await call_progress(
+            app,
+            progress,
+            min(count_done * PART_SIZE, file_size),
+            file_size,
+            progress_args,
+        )
+
+    if queue_part.qsize():
+        list_session = await app.get_media_sessions(settings.media_sessions)
+        bytes_budget = app.get_bytes_budget(settings.max_bytes_in_flight)
+        fp = open(path, "rb")
+        lock_progress = asyncio.Lock()
+
+        async def worker(session):
+
+            nonlocal count_done
+            while True:
+                try:
+                    file_part = queue_part.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await bytes_budget.acquire(PART_SIZE)
+                try:
+                    fp.seek(file_part * PART_SIZE)
+                    chunk = fp.read(PART_SIZE)
+                    await session.invoke(
+                        raw.functions.upload.SaveBigFilePart(
+                            file_id=checkpoint.file_id,
+                            file_part=file_part,
+                            file_total_parts=file_total_parts,
+                            bytes=chunk,
+                        )
+                    )
+                finally:
+                    await bytes_budget.release(PART_SIZE)
+                checkpoint.add_part(file_part)
+                async with lock_progress:
+                    count_done += 1
+                    await call_progress(
+                        app,
+                        progress,
+                        min(count_done * PART_SIZE, file_size),
+                        file_size,
+                        progress_args,
+                    )
+
+        list_task = [
+            asyncio.create_task(
+                worker(list_session[index % len(list_session)])
+            )
+            for index in range(max(1, settings.part_workers))
+        ]
+        try:
+            # a part that fails fails the upload. The checkpoint is kept
+            await asyncio.gather(*list_task)
+        except BaseException:
+            # connections may be broken. Next upload opens new ones
+            await app.stop_media_sessions()
+            raise
+        finally:
+            for task in list_task:
+                task.cancel()
+            await asyncio.gather(*list_task, return_exceptions=True)
+            fp.close()
+
+    return raw.types.InputFileBig(
+        id=checkpoint.file_id,
+        parts=file_total_parts,
+        name=os.path.basename(path),
+    )
@@ -1 +1,6 @@
-from .ffprobe_micro import *
\ No newline at end of file
+from .ffprobe_micro import *
+from .probe_cache import *
+from .preflight import *
+from .thumb_cache import *
+from .fast_probe import *
+from .faststart import *
@@ -0,0 +1,391 @@
+"""
+In-process reader of MP4 and MP3 headers.
+
+Width, height and duration of MP4 files come from the moov/mvhd and
+moov/trak/tkhd boxes, and duration, performer and title of MP3 files from
+the ID3v2 tag and the first frame header, with its Xing, Info or VBRI
+header. Only a few KB are read, without spawning ffprobe. Durations are in
+microseconds. Files the reader does not understand return None, to be
+probed by ffprobe.
+"""
+
+from __future__ import annotations
+
+import os
+import struct
+
+MP4_EXTENSIONS = [".mp4", ".m4v", ".mov"]
+MP3_EXTENSIONS = [".mp3"]
+MP4_MAX_BOX_READ = 64 * 1024
+
+# kbps by (mpeg version, layer). MPEG 2.5 uses the tables of MPEG 2.
+# Index 0 is free format
+# fmt: off
+MP3_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224,
+             256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112,
+             128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96,
+             112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112,
+             128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56,
+             64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56,
+             64, 80, 96, 112, 128, 144, 160],
+}
+# fmt: on
+MP3_SAMPLE_RATES = {
+    "1": [44100, 48000, 32000],
+    "2": [22050, 24000, 16000],
+    "2.5": [11025, 12000, 8000],
+}
+ID3_TEXT_ENCODINGS = ["latin-1", "utf-16", "utf-16-be", "utf-8"]
+ID3_TEXT_FRAMES = {
+    b"TPE1": "performer",
+    b"TIT2": "title",
+    b"TP1": "performer",
+    b"TT2": "title",
+}
+
+
+def iter_mp4_boxes(file, start: int, end: int):
+    """Yields boxes between start and end, reading only their headers
+
+    Args:
+        file (BinaryIO): mp4 file
+        start (int): offset of first box
+        end (int): offset after the last box
+
+    Yields:
+        tuple[bytes, int, int]: box type, payload offset and payload end
+    """
+
+    offset = start
+    while offset + 8 <= end:
+        file.seek(offset)
+        header = file.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack(">I4s", header)
+        payload = offset + 8
+        if size == 1:
+            size = struct.unpack(">Q", file.read(8))[0]
+            payload += 8
+        elif size == 0:
+            # box up to the end of the file
+            size = end - offset
+        if size < payload - offset or offset + size > end:
+            return
+        yield box_type, payload, offset + size
+        offset += size
+
+
+def read_box(file, payload: int, box_end: int) -> bytes:
+
+    file.seek(payload)
+    return file.read(min(box_end - payload, MP4_MAX_BOX_READ))
+
+
+def parse_mvhd(data: bytes):
+    """Returns the movie duration in microseconds. None if unknown, as
+    0 or all ones, written by recorders and fragmented files"""
+
+    version = data[0]
+    if version == 1:
+        timescale, duration = struct.unpack(">IQ", data[20:32])
+        duration_unknown = 0xFFFFFFFFFFFFFFFF
+    else:
+        timescale, duration = struct.unpack(">II", data[12:20])
+        duration_unknown = 0xFFFFFFFF
+    if timescale == 0 or duration in [0, duration_unknown]:
+        return None
+    return duration * 1_000_000 // timescale
+
+
+def parse_tkhd(data: bytes):
+    """Returns track width and height, from 16.16 fixed point values"""
+
+    if len(data) < 84:
+        return None
+    width, height = struct.unpack(">II", data[-8:])
+    return width >> 16, height >> 16
+
+
+def probe_mp4(file_path):
+    """Width, height and duration of the video track of a MP4 file
+
+    Args:
+        file_path (Path): mp4 file path
+
+    Returns:
+        dict | None: width, height and duration_us. None if not found,
+            or for fragmented files, whose mvhd duration leaves out the
+            fragments
+    """
+
+    file_size = os.path.getsize(file_path)
+    with open(file_path, "rb") as file:
+        moov = None
+        for box_type, payload, box_end in iter_mp4_boxes(file, 0, file_size):
+            if box_type == b"moov":
+                moov = (payload, box_end)
+                break
+        if moov is None:
+            return None
+
+        duration_us = None
+        dimension = None
+        for box_type, payload, box_end in iter_mp4_boxes(file, *moov):
+            if box_type == b"mvhd":
+                duration_us = parse_mvhd(read_box(file, payload, box_end))
+            elif box_type == b"trak" and dimension is None:
+                dimension = get_video_track_dimension(file, payload, box_end)
+            elif box_type == b"mvex":
+                return None
+    if duration_us is None or not dimension or 0 in dimension:
+        return None
+    return {
+        "width": dimension[0],
+        "height": dimension[1],
+        "duration_us": duration_us,
+    }
+
+
+def is_faststart(file_path):
+    """True if the moov box of a MP4 file comes before its media data, so
+    players start before the whole file downloads
+
+    Args:
+        file_path (Path): mp4 file path
+
+    Returns:
+        bool | None: None for files that are not MP4, or can't be read
+    """
+
+    if os.path.splitext(str(file_path))[1].lower() not in MP4_EXTENSIONS:
+        return None
+    try:
+        file_size = os.path.getsize(file_path)
+        with open(file_path, "rb") as file:
+            for box_type, _, _ in iter_mp4_boxes(file, 0, file_size):
+                if box_type == b"moov":
+                    return True
+                if box_type == b"mdat":
+                    return False
+    except (OSError, struct.error):
+        return None
+    return None
+
+
+def get_video_track_dimension(file, start: int, end: int):
+    """Returns width and height of a trak box, if it is a video track"""
+
+    dimension = None
+    handler_type = None
+    for box_type, payload, box_end in iter_mp4_boxes(file, start, end):
+        if box_type == b"tkhd":
+            dimension = parse_tkhd(read_box(file, payload, box_end))
+        elif box_type == b"mdia":
+            for sub_type, sub_payload, sub_end in iter_mp4_boxes(
+                file, payload, box_end
+            ):
+                if sub_type == b"hdlr":
+                    data = read_box(file, sub_payload, sub_end)
+                    handler_type = data[8:12]
+    if handler_type != b"vide":
+        return None
+    return dimension
+
+
+def get_syncsafe_int(data: bytes) -> int:
+
+    value = 0
+    for byte in data:
+        value = (value << 7) | (byte & 0x7F)
+    return value
+
+
+def decode_id3_text(data: bytes):
+
+    if not data or data[0] >= len(ID3_TEXT_ENCODINGS):
+        return None
+    text = data[1:].decode(ID3_TEXT_ENCODINGS[data[0]], "replace")
+    # multiple values are separated by null
+    text = text.split("\x00")[0].strip()
+    return text or None
+
+
+def parse_id3_tags(tag: bytes, major_version: int) -> dict:
+    """Returns performer and title of the frames of an ID3v2 tag"""
+
+    dict_tag = {}
+    id_size = 3 if major_version == 2 else 4
+    header_size = 6 if major_version == 2 else 10
+    offset = 0
+    while offset + header_size <= len(tag):
+        frame_id = tag[offset : offset + id_size]
+        if not frame_id.strip(b"\x00"):
+            # padding
+            break
+        size_bytes = tag[offset + id_size : offset + id_size * 2]
+        if major_version == 2:
+            frame_size = int.from_bytes(size_bytes, "big")
+        elif major_version == 4:
+            frame_size = get_syncsafe_int(size_bytes)
+        else:
+            frame_size = int.from_bytes(size_bytes, "big")
+        data = tag[offset + header_size : offset + header_size + frame_size]
+        key = ID3_TEXT_FRAMES.get(frame_id)
+        if key is not None and key not in dict_tag:
+            text = decode_id3_text(data)
+            if text:
+                dict_tag[key] = text
+        offset += header_size + frame_size
+    return dict_tag
+
+
+def parse_mp3_frame_header(header: bytes):
+    """Returns version, layer, bitrate, sample rate and channel mode of
+    a MPEG audio frame header. None if not a valid header"""
+
+    if len(header) < 4:
+        return None
+    value = int.from_bytes(header[:4], "big")
+    if value >> 21 != 0x7FF:
+        return None
+    version = {0: "2.5", 2: "2", 3: "1"}.get((value >> 19) & 0x3)
+    layer = {1: 3, 2: 2, 3: 1}.get((value >> 17) & 0x3)
+    bitrate_index = (value >> 12) & 0xF
+    sample_rate_index = (value >> 10) & 0x3
+    if (
+        version is None
+        or layer is None
+        or bitrate_index in [0, 15]
+        or sample_rate_index == 3
+    ):
+        return None
+    bitrate = MP3_BITRATES[(1 if version == "1" else 2, layer)][bitrate_index]
+    return {
+        "version": version,
+        "layer": layer,
+        "bitrate": bitrate * 1000,
+        "sample_rate": MP3_SAMPLE_RATES[version][sample_rate_index],
+        "is_mono": (value >> 6) & 0x3 == 3,
+    }
+
+
+def get_mp3_samples_per_frame(frame: dict) -> int:
+
+    if frame["layer"] == 1:
+        return 384
+    if frame["layer"] == 3 and frame["version"] != "1":
+        return 576
+    return 1152
+
+
+def get_mp3_vbr_frames(data: bytes, frame: dict):
+    """Number of frames in the Xing, Info or VBRI header of the first
+    frame. None for files without them, as most constant bitrate files"""
+
+    if frame["version"] == "1":
+        side_info_size = 17 if frame["is_mono"] else 32
+    else:
+        side_info_size = 9 if frame["is_mono"] else 17
+    offset = 4 + side_info_size
+    if data[offset : offset + 4] in [b"Xing", b"Info"]:
+        flags = int.from_bytes(data[offset + 4 : offset + 8], "big")
+        if flags & 0x1:
+            return int.from_bytes(data[offset + 8 : offset + 12], "big")
+        return None
+    if data[36:40] == b"VBRI":
+        return int.from_bytes(data[50:54], "big")
+    return None
+
+
+def probe_mp3(file_path):
+    """Duration, performer and title of a MP3 file
+
+    Args:
+        file_path (Path): mp3 file path
+
+    Returns:
+        dict | None: duration_us and, if tagged, performer and title.
+            None if no audio frame is found
+    """
+
+    file_size = os.path.getsize(file_path)
+    dict_metadata = {}
+    with open(file_path, "rb") as file:
+        audio_start = 0
+        header = file.read(10)
+        if header[:3] == b"ID3" and len(header) == 10:
+            major_version, flags = header[3], header[5]
+            tag_size = get_syncsafe_int(header[6:10])
+            dict_metadata.update(
+                parse_id3_tags(file.read(tag_size), major_version)
+            )
+            # footer
+            audio_start = 10 + tag_size + (10 if flags & 0x10 else 0)
+
+        # first frame, after padding or junk left by editors
+        file.seek(audio_start)
+        data = file.read(16 * 1024)
+        frame = None
+        for offset in range(max(0, len(data) - 4)):
+            if data[offset] == 0xFF:
+                frame = parse_mp3_frame_header(data[offset : offset + 4])
+                if frame is not None:
+                    break
+        if frame is None:
+            return None
+        audio_start += offset
+        data = data[offset:]
+        if len(data) < 200:
+            file.seek(audio_start)
+            data = file.read(200)
+
+        audio_end = file_size
+        if file_size - audio_start >= 128:
+            file.seek(file_size - 128)
+            if file.read(3) == b"TAG":
+                # ID3v1 tag at the end, not audio
+                audio_end -= 128
+
+    count_frames = get_mp3_vbr_frames(data, frame)
+    if count_frames:
+        duration_us = (
+            count_frames
+            * get_mp3_samples_per_frame(frame)
+            * 1_000_000
+            // frame["sample_rate"]
+        )
+    else:
+        # constant bitrate
+        audio_size = audio_end - audio_start
+        duration_us = audio_size * 8 * 1_000_000 // frame["bitrate"]
+    dict_metadata["duration_us"] = duration_us
+    return dict_metadata
+
+
+def fast_probe(file_path):
+    """Read metadata of MP4 and MP3 files without ffprobe
+
+    Args:
+        file_path (Path): media file path
+
+    Returns:
+        dict | None: see probe_mp4 and probe_mp3. None for other
+            containers, or files the reader does not understand
+    """
+
+    file_extension = os.path.splitext(str(file_path))[1].lower()
+    try:
+        if file_extension in MP4_EXTENSIONS:
+            return probe_mp4(file_path)
+        if file_extension in MP3_EXTENSIONS:
+            return probe_mp3(file_path)
+    except (OSError, struct.error, IndexError, KeyError):
+        return None
+    return None
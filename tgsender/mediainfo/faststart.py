@@ -0,0 +1,166 @@
+"""
+Faststart remux of MP4 videos.
+
+Videos with the moov box after the media data can't be played by telegram
+clients until most of the file is downloaded. They are remuxed by ffmpeg,
+without encoding, into a scratch folder, with moov first. The source is not
+changed and the copy has about the same size.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import threading
+from pathlib import Path
+
+from .fast_probe import is_faststart
+from .probe_cache import get_cache_folder
+
+_faststart_settings = {"enabled": False, "folder_path": None}
+_faststart_semaphore = threading.BoundedSemaphore(1)
+
+
+def get_default_faststart_folder() -> Path:
+    """User wide scratch folder. e.g.: ~/.cache/tgsender/faststart"""
+
+    return get_cache_folder() / "faststart"
+
+
+def configure_faststart(
+    enabled: bool = False, folder_path: Path = None, workers: int = 1
+):
+    """Set the faststart stage
+
+    Args:
+        enabled (bool, optional): True to remux videos with moov at the
+            end. Defaults to False.
+        folder_path (Path, optional): scratch folder of remuxed videos.
+            Defaults to None, for the user wide folder.
+        workers (int, optional): remuxes running at a time.
+            Defaults to 1.
+    """
+
+    global _faststart_semaphore
+    _faststart_settings.update(enabled=enabled, folder_path=folder_path)
+    _faststart_semaphore = threading.BoundedSemaphore(max(1, int(workers)))
+
+
+def configure_faststart_from_config(
+    dict_config: dict, folder_path_project: Path = None
+):
+    """Set the faststart stage from config keys faststart and
+    faststart_workers. Remuxed videos are kept in the project folder"""
+
+    folder_path = None
+    if folder_path_project is not None:
+        folder_path = Path(folder_path_project) / "faststart"
+    configure_faststart(
+        bool(int(dict_config.get("faststart") or 0)),
+        folder_path,
+        int(dict_config.get("faststart_workers") or 1),
+    )
+
+
+def get_faststart_path(file_path, folder_path: Path = None) -> Path:
+    """Path of the remuxed video. It keeps the name of the source, shown
+    by telegram, in a folder by source path"""
+
+    folder_path = Path(folder_path or get_default_faststart_folder())
+    key = str(Path(file_path).absolute()).encode("utf-8")
+    name = hashlib.sha1(key).hexdigest()[:16]
+    return folder_path / name / Path(file_path).name
+
+
+def remux_faststart(file_path, file_path_output: Path) -> Path:
+    """Copy the streams of a video with moov first, without encoding
+
+    Args:
+        file_path (Path): source video
+        file_path_output (Path): remuxed video
+
+    Raises:
+        ValueError: if ffmpeg fails
+
+    Returns:
+        Path: remuxed video
+    """
+
+    file_path_output = Path(file_path_output)
+    file_path_output.parent.mkdir(parents=True, exist_ok=True)
+    file_path_tmp = file_path_output.with_name(
+        f"tmp_{threading.get_ident()}_{file_path_output.name}"
+    )
+    command_array = [
+        "ffmpeg",
+        "-v",
+        "error",
+        "-y",
+        "-i",
+        str(file_path),
+        "-map",
+        "0",
+        "-c",
+        "copy",
+        "-movflags",
+        "+faststart",
+        str(file_path_tmp),
+    ]
+    result = subprocess.run(
+        command_array, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    if result.returncode != 0:
+        if file_path_tmp.exists():
+            os.remove(file_path_tmp)
+        raise ValueError(
+            f"ffmpeg failed to remux {file_path}: "
+            f"{result.stderr.decode('utf-8', 'replace').strip()}"
+        )
+    os.replace(file_path_tmp, file_path_output)
+    return file_path_output
+
+
+def get_faststart_file(file_path):
+    """Faststart copy of a video with moov at the end, if the stage is
+    enabled. The copy is removed by discard_faststart_file
+
+    Args:
+        file_path (Path): video file path
+
+    Returns:
+        str | None: remuxed video path. None if the source can be sent
+            as it is, or the remux failed
+    """
+
+    if not _faststart_settings["enabled"]:
+        return None
+    if is_faststart(file_path) is not False:
+        return None
+    file_path_output = get_faststart_path(
+        file_path, _faststart_settings["folder_path"]
+    )
+    if (
+        file_path_output.exists()
+        and file_path_output.stat().st_mtime_ns
+        >= os.stat(file_path).st_mtime_ns
+    ):
+        # left by an interrupted run
+        return str(file_path_output)
+    with _faststart_semaphore:
+        try:
+            logging.warning(f"Remuxing to faststart: {file_path}")
+            return str(remux_faststart(file_path, file_path_output))
+        except (OSError, ValueError) as e:
+            logging.warning(f"Video sent without faststart. {e}")
+            return None
+
+
+def discard_faststart_file(file_path_output):
+    """Remove a remuxed video, after its upload"""
+
+    if file_path_output is None:
+        return
+    shutil.rmtree(Path(file_path_output).parent, ignore_errors=True)
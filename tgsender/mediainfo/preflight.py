@@ -0,0 +1,257 @@
+"""
+Preflight of the upload plan.
+
+Before the upload, all files of the plan are checked and probed by a pool of
+processes. Columns type, size, mtime, width, height, duration and valid are
+saved into upload_plan.csv, so missing or corrupt files are found at once,
+not hours into the run, and the upload does not probe the files again.
+Invalid files, and files changed since their preflight, are checked again
+by the next run.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from .probe_cache import (
+    get_probe_cache_settings,
+    get_video_metadata,
+    init_probe_cache_process,
+)
+
+PREFLIGHT_COLUMNS = [
+    "type",
+    "size",
+    "mtime",
+    "width",
+    "height",
+    "duration",
+    "valid",
+    "preflight_error",
+]
+# files probed by process, at a time
+PREFLIGHT_CHUNKSIZE = 16
+# seconds of difference of mtime, read back from csv, seen as a change
+MTIME_TOLERANCE = 0.001
+
+
+def get_type_file(file_path) -> str:
+    """Returns the kind of telegram message used to send the file
+
+    Args:
+        file_path (str): file path
+
+    Returns:
+        str: 'video', 'audio', 'photo' or 'document'
+    """
+
+    file_extension = Path(file_path).suffix.lower()
+    if file_extension == ".mp4":
+        return "video"
+    elif file_extension in [".mp3", ".aac"]:
+        return "audio"
+    elif file_extension in [".png", ".jpg", ".jpeg", ".gif"]:
+        return "photo"
+    else:
+        return "document"
+
+
+def probe_file(file_path) -> dict:
+    """Check a file of the plan. Videos are probed for their metadata
+
+    Args:
+        file_path (str): file path
+
+    Returns:
+        dict: preflight columns. valid is 0 for missing, empty or
+            unreadable files, with the reason in preflight_error
+    """
+
+    type_file = get_type_file(file_path)
+    dict_preflight = {"type": type_file, "valid": 0}
+    try:
+        stat = os.stat(file_path)
+    except OSError as e:
+        dict_preflight["preflight_error"] = f"{type(e).__name__}: {e}"
+        return dict_preflight
+    size = stat.st_size
+    dict_preflight["size"] = size
+    dict_preflight["mtime"] = round(stat.st_mtime, 6)
+    if size == 0:
+        dict_preflight["preflight_error"] = "Empty file"
+        return dict_preflight
+    if type_file == "video":
+        try:
+            dict_preflight.update(get_video_metadata(file_path))
+        except Exception as e:
+            dict_preflight["preflight_error"] = f"Invalid video: {e}"
+            return dict_preflight
+    dict_preflight["valid"] = 1
+    return dict_preflight
+
+
+def is_preflight_done(record) -> bool:
+
+    return record.get("valid") in [0, 1, 0.0, 1.0, "0", "1"]
+
+
+def is_changed(record) -> bool:
+    """True if the file of an item is not the one checked by the
+    preflight, by its size and mtime, as when it was replaced or removed"""
+
+    try:
+        stat = os.stat(record.get("file_output"))
+        return (
+            int(float(record["size"])) != stat.st_size
+            or abs(float(record["mtime"]) - stat.st_mtime) > MTIME_TOLERANCE
+        )
+    except (KeyError, TypeError, ValueError, OSError):
+        return True
+
+
+def needs_preflight(record, force: bool = False) -> bool:
+    """True if an item not sent must be checked. Items never checked,
+    found invalid, or changed since their check
+
+    Args:
+        record (dict | PlanRow): upload plan item
+        force (bool, optional): True to check all items not sent.
+            Defaults to False.
+    """
+
+    if int(record.get("sent") or 0) != 0:
+        return False
+    return (
+        force
+        or not is_preflight_done(record)
+        or is_invalid(record)
+        or is_changed(record)
+    )
+
+
+def is_invalid(record) -> bool:
+    """True if the preflight found the file can't be sent"""
+
+    return is_preflight_done(record) and int(float(record["valid"])) == 0
+
+
+def get_plan_video_metadata(record):
+    """Video metadata saved in the plan by the preflight
+
+    Args:
+        record (dict | PlanRow): upload plan item
+
+    Returns:
+        dict | None: width, height and duration. None if not in the plan
+    """
+
+    try:
+        return {
+            key: int(float(record[key]))
+            for key in ["width", "height", "duration"]
+        }
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def preflight_upload_plan(
+    file_path_upload_plan: Path, workers: int = None, force: bool = False
+) -> int:
+    """Probe the files of the plan and save the preflight columns.
+    Files already sent, or already checked and not changed since, are
+    skipped. The plan is not rewritten if no file needs a check.
+
+    Args:
+        file_path_upload_plan (Path): path of upload_plan.csv
+        workers (int, optional): processes probing files.
+            Defaults to None, for the number of CPUs.
+        force (bool, optional): True to check all files again.
+            Defaults to False.
+
+    Returns:
+        int: number of invalid files in the plan
+    """
+
+    from ..plan.rows import (
+        CHUNKSIZE,
+        get_csv_columns,
+        iter_upload_plan,
+        write_rows_atomic,
+    )
+
+    # a first pass, by stat only, to not rewrite a plan already checked
+    count_invalid = 0
+    for row in iter_upload_plan(file_path_upload_plan):
+        if needs_preflight(row, force):
+            break
+        count_invalid += is_invalid(row)
+    else:
+        logging.warning(f"Preflight: 0 files checked, {count_invalid} invalid")
+        return count_invalid
+
+    list_columns = get_csv_columns(file_path_upload_plan)
+    list_columns += [
+        column for column in PREFLIGHT_COLUMNS if column not in list_columns
+    ]
+    count_probed = 0
+    count_invalid = 0
+
+    def iter_rows(executor):
+
+        list_row = []
+        for row in iter_upload_plan(file_path_upload_plan):
+            list_row.append(row)
+            if len(list_row) == CHUNKSIZE:
+                yield from probe_rows(executor, list_row)
+                list_row = []
+        yield from probe_rows(executor, list_row)
+
+    def probe_rows(executor, list_row):
+
+        nonlocal count_probed, count_invalid
+        list_row_probe = [
+            row for row in list_row if needs_preflight(row, force)
+        ]
+        iter_preflight = executor.map(
+            probe_file,
+            [row.file_output for row in list_row_probe],
+            chunksize=PREFLIGHT_CHUNKSIZE,
+        )
+        for row, dict_preflight in zip(list_row_probe, iter_preflight):
+            was_invalid = is_invalid(row)
+            # drop columns of a previous preflight
+            for column in PREFLIGHT_COLUMNS:
+                if row.extra is not None:
+                    row.extra.pop(column, None)
+            row.update(dict_preflight)
+            count_probed += 1
+            if was_invalid and dict_preflight["valid"] == 1:
+                # fixed file, marked failed by a previous run. Sent again
+                for column in ["status", "error"]:
+                    if row.extra is not None:
+                        row.extra.pop(column, None)
+            if dict_preflight["valid"] == 0:
+                logging.error(
+                    f"Preflight: {row.file_output}. "
+                    f"{dict_preflight['preflight_error']}"
+                )
+        for row in list_row:
+            if is_invalid(row):
+                count_invalid += 1
+        return list_row
+
+    with ProcessPoolExecutor(
+        workers or None,
+        initializer=init_probe_cache_process,
+        initargs=(get_probe_cache_settings(),),
+    ) as executor:
+        write_rows_atomic(
+            file_path_upload_plan, list_columns, iter_rows(executor)
+        )
+    logging.warning(
+        f"Preflight: {count_probed} files checked, {count_invalid} invalid"
+    )
+    return count_invalid
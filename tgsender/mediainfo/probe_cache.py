@@ -0,0 +1,367 @@
+"""
+Persistent cache of ffprobe results.
+
+Results are kept in a sqlite database, by file path and ffprobe format,
+valid while the file keeps its size and modification time. The least
+recently used results are pruned above a maximum of entries. By default the
+cache is user wide, so a library sent again to another channel, or a plan
+run again, is not probed again.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from .fast_probe import fast_probe
+from .ffprobe_micro import FFProbeResult, ffprobe
+
+PROBE_CACHE_MAX_ENTRIES = 100000
+
+SQL_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS probe (
+    path TEXT NOT NULL,
+    format TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    output TEXT NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (path, format)
+);
+CREATE INDEX IF NOT EXISTS idx_probe_last_used ON probe (last_used);
+"""
+
+
+def get_cache_folder() -> Path:
+    """User wide cache folder. e.g.: ~/.cache/tgsender"""
+
+    folder_path_cache = os.environ.get("XDG_CACHE_HOME") or (
+        Path.home() / ".cache"
+    )
+    return Path(folder_path_cache) / "tgsender"
+
+
+def get_default_cache_path() -> Path:
+    """User wide cache database. e.g.: ~/.cache/tgsender/ffprobe.sqlite"""
+
+    return get_cache_folder() / "ffprobe.sqlite"
+
+
+class ProbeCache:
+    """ffprobe results by file path, size and modification time.
+    Safe to share between threads. Many processes may use the same file.
+
+    Args:
+        database_path (Path, optional): sqlite file.
+            Defaults to None, to use get_default_cache_path.
+        max_entries (int, optional): maximum results kept.
+            Defaults to PROBE_CACHE_MAX_ENTRIES.
+    """
+
+    def __init__(
+        self,
+        database_path: Path = None,
+        max_entries: int = PROBE_CACHE_MAX_ENTRIES,
+    ):
+
+        self.database_path = Path(database_path or get_default_cache_path())
+        self.max_entries = max_entries
+        self.count_put = 0
+        self.lock = threading.Lock()
+        self.database_path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(
+            self.database_path, timeout=30, check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SQL_CREATE_TABLE)
+        self.connection.commit()
+
+    @staticmethod
+    def get_key(file_path) -> tuple[str, int, int]:
+
+        file_path = Path(file_path).absolute()
+        stat = os.stat(file_path)
+        return str(file_path), stat.st_size, stat.st_mtime_ns
+
+    def get(self, file_path, ffprobe_format: str = "json"):
+        """Returns the cached ffprobe output of a file
+
+        Args:
+            file_path (Path): media file path
+            ffprobe_format (str, optional): json or flat.
+                Defaults to "json".
+
+        Returns:
+            str | None: ffprobe output. None if missing or out of date
+        """
+
+        path, size, mtime_ns = self.get_key(file_path)
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT size, mtime_ns, output FROM probe "
+                "WHERE path = ? AND format = ?",
+                (path, ffprobe_format),
+            ).fetchone()
+            if row is None:
+                return None
+            if (row[0], row[1]) != (size, mtime_ns):
+                # file changed since probed
+                self.connection.execute(
+                    "DELETE FROM probe WHERE path = ? AND format = ?",
+                    (path, ffprobe_format),
+                )
+                self.connection.commit()
+                return None
+            self.connection.execute(
+                "UPDATE probe SET last_used = ? "
+                "WHERE path = ? AND format = ?",
+                (time.time(), path, ffprobe_format),
+            )
+            self.connection.commit()
+            return row[2]
+
+    def put(self, file_path, ffprobe_format: str, output: str):
+        """Save the ffprobe output of a file"""
+
+        path, size, mtime_ns = self.get_key(file_path)
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO probe "
+                "(path, format, size, mtime_ns, output, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (path, ffprobe_format, size, mtime_ns, output, time.time()),
+            )
+            self.connection.commit()
+            self.count_put += 1
+            if self.count_put % 1000 == 0:
+                self.prune()
+
+    def prune(self):
+        """Remove the least recently used results above max_entries"""
+
+        count = self.connection.execute(
+            "SELECT COUNT(*) FROM probe"
+        ).fetchone()[0]
+        if count <= self.max_entries:
+            return
+        self.connection.execute(
+            "DELETE FROM probe WHERE rowid IN (SELECT rowid FROM probe "
+            "ORDER BY last_used LIMIT ?)",
+            (count - self.max_entries,),
+        )
+        self.connection.commit()
+
+    def invalidate(self, file_path=None):
+        """Remove the results of a file, or all results if file is None"""
+
+        with self.lock:
+            if file_path is None:
+                self.connection.execute("DELETE FROM probe")
+            else:
+                self.connection.execute(
+                    "DELETE FROM probe WHERE path = ?",
+                    (str(Path(file_path).absolute()),),
+                )
+            self.connection.commit()
+
+    def close(self):
+
+        with self.lock:
+            self.connection.close()
+
+
+_probe_cache = None
+_probe_cache_settings = {"enabled": True, "database_path": None}
+
+
+def configure_probe_cache(
+    enabled: bool = True,
+    database_path: Path = None,
+    max_entries: int = PROBE_CACHE_MAX_ENTRIES,
+):
+    """Set the cache used by ffprobe_cached
+
+    Args:
+        enabled (bool, optional): False to always run ffprobe.
+            Defaults to True.
+        database_path (Path, optional): sqlite file. e.g.: a file in the
+            project folder. Defaults to None, for the user wide cache.
+        max_entries (int, optional): maximum results kept.
+            Defaults to PROBE_CACHE_MAX_ENTRIES.
+    """
+
+    global _probe_cache
+    if _probe_cache is not None:
+        _probe_cache.close()
+        _probe_cache = None
+    _probe_cache_settings.update(
+        enabled=enabled, database_path=database_path, max_entries=max_entries
+    )
+
+
+def configure_probe_cache_from_config(
+    dict_config: dict, folder_path_project: Path = None
+):
+    """Set the probe cache from config keys probe_cache and
+    probe_cache_max_entries
+
+    Args:
+        dict_config (dict): configuration data. probe_cache is user, for
+            the user wide cache, project, for a cache in the project
+            folder, or off.
+        folder_path_project (Path, optional): project folder.
+            Defaults to None.
+    """
+
+    scope = str(dict_config.get("probe_cache") or "user").strip().lower()
+    max_entries = int(
+        dict_config.get("probe_cache_max_entries") or PROBE_CACHE_MAX_ENTRIES
+    )
+    database_path = None
+    if scope == "project" and folder_path_project is not None:
+        database_path = Path(folder_path_project) / "probe_cache.sqlite"
+    configure_probe_cache(scope != "off", database_path, max_entries)
+
+
+def get_probe_cache_settings() -> dict:
+
+    return dict(_probe_cache_settings)
+
+
+def init_probe_cache_process(dict_settings: dict):
+    """Initializer of worker processes. The connection of the parent,
+    copied by fork, is dropped without closing it"""
+
+    global _probe_cache
+    _probe_cache = None
+    _probe_cache_settings.update(dict_settings)
+
+
+def get_probe_cache():
+    """Returns the shared probe cache. None if disabled or unavailable"""
+
+    global _probe_cache
+    if not _probe_cache_settings["enabled"]:
+        return None
+    if _probe_cache is None:
+        try:
+            _probe_cache = ProbeCache(
+                _probe_cache_settings["database_path"],
+                _probe_cache_settings.get(
+                    "max_entries", PROBE_CACHE_MAX_ENTRIES
+                ),
+            )
+        except (OSError, sqlite3.Error) as e:
+            logging.warning(f"ffprobe cache disabled. {e}")
+            _probe_cache_settings["enabled"] = False
+            return None
+    return _probe_cache
+
+
+def ffprobe_cached(file_path, ffprobe_format: str = "json") -> FFProbeResult:
+    """Same as ffprobe, reusing results of files not changed since probed.
+    Only successful results are cached.
+
+    Args:
+        file_path (Path): media file path
+        ffprobe_format (str, optional): json or flat. Defaults to "json".
+
+    Returns:
+        FFProbeResult: ffprobe result
+    """
+
+    probe_cache = get_probe_cache()
+    if probe_cache is not None:
+        output = probe_cache.get(file_path, ffprobe_format)
+        if output is not None:
+            return FFProbeResult(
+                return_code=0, output=output, format=ffprobe_format
+            )
+
+    result = ffprobe(file_path, ffprobe_format)
+    if probe_cache is not None and result.return_code == 0:
+        probe_cache.put(file_path, ffprobe_format, result.output)
+    return result
+
+
+def get_video_metadata(file_path) -> dict:
+    """Dimensions and duration of a video. MP4 headers are read in
+    process. Other containers are probed once through the cache
+
+    Args:
+        file_path (Path): video file path
+
+    Raises:
+        ValueError: if ffprobe fails or the file has no video stream
+
+    Returns:
+        dict: width, height and duration, in seconds
+    """
+
+    dict_fast = fast_probe(file_path)
+    if dict_fast is not None and "width" in dict_fast:
+        return {
+            "width": dict_fast["width"],
+            "height": dict_fast["height"],
+            "duration": dict_fast["duration_us"] // 1_000_000,
+        }
+
+    result = ffprobe_cached(file_path)
+    try:
+        metadata = result.get_output_as_dict()
+        video_metadata = next(
+            stream for stream in metadata["streams"] if "width" in stream
+        )
+        return {
+            "width": video_metadata["width"],
+            "height": video_metadata["height"],
+            "duration": int(float(metadata["format"]["duration"])),
+        }
+    except Exception as e:
+        logging.error(f"File Error: {file_path}. {result.error}")
+        raise ValueError(e)
+
+
+def get_audio_metadata(file_path) -> dict:
+    """Duration, performer and title of an audio file. MP3 headers are
+    read in process. Other containers are probed once through the cache
+
+    Args:
+        file_path (Path): audio file path
+
+    Returns:
+        dict: duration, in seconds, performer and title, as found.
+            Empty if the file can't be probed
+    """
+
+    dict_fast = fast_probe(file_path)
+    if dict_fast is not None:
+        dict_audio = {
+            key: dict_fast[key]
+            for key in ["performer", "title"]
+            if key in dict_fast
+        }
+        dict_audio["duration"] = dict_fast["duration_us"] // 1_000_000
+        return dict_audio
+
+    result = ffprobe_cached(file_path)
+    try:
+        metadata_format = result.get_output_as_dict()["format"]
+    except Exception as e:
+        logging.warning(f"Audio sent without metadata: {file_path}. {e}")
+        return {}
+    dict_audio = {}
+    if "duration" in metadata_format:
+        dict_audio["duration"] = int(float(metadata_format["duration"]))
+    dict_tags = {
+        key.lower(): value
+        for key, value in metadata_format.get("tags", {}).items()
+    }
+    for key, tag in [("performer", "artist"), ("title", "title")]:
+        if dict_tags.get(tag):
+            dict_audio[key] = dict_tags[tag]
+    return dict_audio
@@ -0,0 +1,327 @@
+"""
+Cache of video thumbnails.
+
+Thumbnails are made by ffmpeg from a keyframe near the start of the video,
+scaled to the 320px limit of telegram, and read from a pipe. They are kept
+in a scratch folder, by a hash of the video content, so nothing is written
+next to the videos and repeated runs do not decode them again. Without the
+cache, thumbnails are kept only in memory.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import logging
+import os
+import subprocess
+import threading
+from pathlib import Path
+
+from .probe_cache import get_cache_folder
+
+# telegram limit for thumbnails side
+THUMB_MAX_SIDE = 320
+# bytes read from start and end of the video to build its key
+THUMB_KEY_SAMPLE = 64 * 1024
+THUMB_CACHE_MAX_MIB = 512
+
+
+def get_default_thumb_folder() -> Path:
+    """User wide thumbnail folder. e.g.: ~/.cache/tgsender/thumb"""
+
+    return get_cache_folder() / "thumb"
+
+
+def get_thumb_key(file_path) -> str:
+    """Key of a video by its content. The same video in another folder,
+    or another mount, shares the thumbnail.
+
+    Args:
+        file_path (Path): video file path
+
+    Returns:
+        str: sha1 of size, first and last bytes of the video
+    """
+
+    size = os.path.getsize(file_path)
+    hash_ = hashlib.sha1(f"{size}:{THUMB_MAX_SIDE}:".encode("utf-8"))
+    with open(file_path, "rb") as file:
+        hash_.update(file.read(THUMB_KEY_SAMPLE))
+        if size > 2 * THUMB_KEY_SAMPLE:
+            file.seek(-THUMB_KEY_SAMPLE, os.SEEK_END)
+            hash_.update(file.read(THUMB_KEY_SAMPLE))
+    return hash_.hexdigest()
+
+
+def get_thumb_seek(duration=None) -> float:
+    """Seconds of the frame used as thumbnail. Past the black first
+    frames, when the duration is known"""
+
+    if not duration:
+        return 0
+    return min(float(duration) / 10, 30)
+
+
+def render_thumb(file_path, seek_seconds: float = 0) -> bytes:
+    """Make a jpeg thumbnail with ffmpeg, read from a pipe
+
+    Args:
+        file_path (Path): video file path
+        seek_seconds (float, optional): position of the frame.
+            ffmpeg seeks to the keyframe before it. Defaults to 0.
+
+    Raises:
+        ValueError: if ffmpeg returns no image
+
+    Returns:
+        bytes: jpeg image
+    """
+
+    scale = (
+        f"scale='min({THUMB_MAX_SIDE},iw)':'min({THUMB_MAX_SIDE},ih)'"
+        ":force_original_aspect_ratio=decrease"
+    )
+    command_array = [
+        "ffmpeg",
+        "-v",
+        "error",
+        "-ss",
+        f"{seek_seconds:.3f}",
+        "-noaccurate_seek",
+        "-i",
+        str(file_path),
+        "-frames:v",
+        "1",
+        "-vf",
+        scale,
+        "-q:v",
+        "4",
+        "-f",
+        "image2",
+        "-c:v",
+        "mjpeg",
+        "pipe:1",
+    ]
+    result = subprocess.run(
+        command_array, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    if result.returncode != 0 or not result.stdout:
+        raise ValueError(
+            f"ffmpeg made no thumbnail of {file_path}: "
+            f"{result.stderr.decode('utf-8', 'replace').strip()}"
+        )
+    return result.stdout
+
+
+def make_thumb(file_path, duration=None) -> bytes:
+    """Thumbnail of a video, from a keyframe near its start.
+    If the seek fails, as in videos shorter than their metadata says,
+    the first frame is used."""
+
+    seek_seconds = get_thumb_seek(duration)
+    try:
+        return render_thumb(file_path, seek_seconds)
+    except ValueError:
+        if seek_seconds == 0:
+            raise
+    return render_thumb(file_path, 0)
+
+
+class ThumbCache:
+    """Thumbnails by video content, in a scratch folder.
+    The least recently used are removed above max_bytes.
+
+    Args:
+        folder_path (Path, optional): thumbnail folder.
+            Defaults to None, to use get_default_thumb_folder.
+        max_bytes (int, optional): maximum size of the folder.
+            Defaults to THUMB_CACHE_MAX_MIB.
+    """
+
+    def __init__(
+        self,
+        folder_path: Path = None,
+        max_bytes: int = THUMB_CACHE_MAX_MIB * 1024 * 1024,
+    ):
+
+        self.folder_path = Path(folder_path or get_default_thumb_folder())
+        self.max_bytes = max_bytes
+        self.count_put = 0
+        self.lock = threading.Lock()
+        self.folder_path.mkdir(parents=True, exist_ok=True)
+
+    def get_path(self, key: str) -> Path:
+
+        return self.folder_path / key[:2] / f"{key}.jpg"
+
+    def get(self, key: str):
+        """Returns the thumbnail path. None if not cached"""
+
+        thumb_path = self.get_path(key)
+        try:
+            # last use, for pruning
+            os.utime(thumb_path)
+        except OSError:
+            return None
+        return thumb_path
+
+    def put(self, key: str, thumb: bytes) -> Path:
+        """Save a thumbnail, atomically, and returns its path"""
+
+        thumb_path = self.get_path(key)
+        thumb_path.parent.mkdir(parents=True, exist_ok=True)
+        thumb_path_tmp = thumb_path.with_name(
+            f"{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        with open(thumb_path_tmp, "wb") as file:
+            file.write(thumb)
+        os.replace(thumb_path_tmp, thumb_path)
+        with self.lock:
+            self.count_put += 1
+            if self.count_put % 100 == 0:
+                self.prune()
+        return thumb_path
+
+    def prune(self):
+        """Remove the least recently used thumbnails above max_bytes"""
+
+        list_entry = []
+        total_bytes = 0
+        for thumb_path in self.folder_path.glob("*/*.jpg"):
+            try:
+                stat = thumb_path.stat()
+            except OSError:
+                continue
+            list_entry.append((stat.st_mtime, stat.st_size, thumb_path))
+            total_bytes += stat.st_size
+        list_entry.sort()
+        for _, size, thumb_path in list_entry:
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(thumb_path)
+            except OSError:
+                continue
+            total_bytes -= size
+
+
+_thumb_cache = None
+_thumb_cache_settings = {
+    "enabled": True,
+    "folder_path": None,
+    "max_bytes": THUMB_CACHE_MAX_MIB * 1024 * 1024,
+    "in_memory": False,
+}
+
+
+def configure_thumb_cache(
+    enabled: bool = True,
+    folder_path: Path = None,
+    max_mib: float = THUMB_CACHE_MAX_MIB,
+    in_memory: bool = False,
+):
+    """Set the cache used by get_thumb
+
+    Args:
+        enabled (bool, optional): False to not keep thumbnails on disk.
+            Defaults to True.
+        folder_path (Path, optional): thumbnail folder. e.g.: a folder in
+            the project. Defaults to None, for the user wide folder.
+        max_mib (float, optional): maximum size of the folder.
+            Defaults to THUMB_CACHE_MAX_MIB.
+        in_memory (bool, optional): True to return thumbnails as bytes,
+            also when cached. Defaults to False.
+    """
+
+    global _thumb_cache
+    _thumb_cache = None
+    _thumb_cache_settings.update(
+        enabled=enabled,
+        folder_path=folder_path,
+        max_bytes=int(float(max_mib) * 1024 * 1024),
+        in_memory=in_memory,
+    )
+
+
+def configure_thumb_cache_from_config(
+    dict_config: dict, folder_path_project: Path = None
+):
+    """Set the thumbnail cache from config keys thumb_cache,
+    thumb_cache_max_mib and thumb_in_memory
+
+    Args:
+        dict_config (dict): configuration data. thumb_cache is user, for
+            the user wide cache, project, for a cache in the project
+            folder, or off, to keep thumbnails only in memory.
+        folder_path_project (Path, optional): project folder.
+            Defaults to None.
+    """
+
+    scope = str(dict_config.get("thumb_cache") or "user").strip().lower()
+    folder_path = None
+    if scope == "project" and folder_path_project is not None:
+        folder_path = Path(folder_path_project) / "thumb_cache"
+    configure_thumb_cache(
+        scope != "off",
+        folder_path,
+        float(dict_config.get("thumb_cache_max_mib") or THUMB_CACHE_MAX_MIB),
+        bool(int(dict_config.get("thumb_in_memory") or 0)),
+    )
+
+
+def get_thumb_cache():
+    """Returns the shared thumbnail cache. None if disabled or unavailable"""
+
+    global _thumb_cache
+    if not _thumb_cache_settings["enabled"]:
+        return None
+    if _thumb_cache is None:
+        try:
+            _thumb_cache = ThumbCache(
+                _thumb_cache_settings["folder_path"],
+                _thumb_cache_settings["max_bytes"],
+            )
+        except OSError as e:
+            logging.warning(f"Thumbnail cache disabled. {e}")
+            _thumb_cache_settings["enabled"] = False
+            return None
+    return _thumb_cache
+
+
+def to_thumb_file(thumb: bytes):
+    """File object of a thumbnail in memory, as accepted by pyrogram"""
+
+    file = io.BytesIO(thumb)
+    file.name = "thumb.jpg"
+    return file
+
+
+def get_thumb(file_path, duration=None):
+    """Thumbnail of a video, from the cache or made by ffmpeg
+
+    Args:
+        file_path (Path): video file path
+        duration (float, optional): video seconds, to seek past the
+            first frames. Defaults to None.
+
+    Returns:
+        str | io.BytesIO | None: thumbnail path in the cache, or
+            thumbnail in memory. None if ffmpeg fails
+    """
+
+    thumb_cache = get_thumb_cache()
+    try:
+        key = get_thumb_key(file_path)
+        thumb_path = thumb_cache and thumb_cache.get(key)
+        if thumb_path is None:
+            thumb = make_thumb(file_path, duration)
+            if thumb_cache is None:
+                return to_thumb_file(thumb)
+            thumb_path = thumb_cache.put(key, thumb)
+        if _thumb_cache_settings["in_memory"]:
+            return to_thumb_file(thumb_path.read_bytes())
+        return str(thumb_path)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Video sent without thumbnail. {e}")
+        return None
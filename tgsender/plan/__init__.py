@@ -0,0 +1,5 @@
+from .backend import *
+from .journal import *
+from .rows import *
+from .store_sqlite import *
+from .upload_plan import *
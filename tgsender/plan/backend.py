@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from .store_sqlite import SqliteUploadPlan
+from .upload_plan import UploadPlan
+
+PLAN_BACKENDS = ["csv", "sqlite"]
+
+
+def open_upload_plan(
+    file_path_upload_plan: Path, backend: str = "csv", compact_every=500
+):
+    """Open the upload plan with the chosen storage
+
+    Args:
+        file_path_upload_plan (Path): path of upload_plan.csv
+        backend (str, optional): 'csv' or 'sqlite'. Defaults to "csv".
+        compact_every (int, optional): number of sent marks that triggers
+            the save of the csv plan. Defaults to 500.
+
+    Returns:
+        UploadPlan | SqliteUploadPlan: upload plan
+    """
+
+    if backend not in PLAN_BACKENDS:
+        raise ValueError(f"plan_backend must be one of {PLAN_BACKENDS}")
+    if backend == "sqlite":
+        return SqliteUploadPlan(file_path_upload_plan)
+    return UploadPlan(file_path_upload_plan, compact_every=compact_every)
@@ -0,0 +1,166 @@
+"""
+Append-only journal of the upload plan state.
+
+Each completed item is recorded as one small fsync'd json line next to
+upload_plan.csv. The loader replays the journal over the csv and, from time
+to time, the journal is compacted back into the csv with an atomic replace.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+from pathlib import Path
+
+
+def get_journal_path(file_path_upload_plan: Path) -> Path:
+    """get path of the journal file of an upload plan
+
+    Args:
+        file_path_upload_plan (Path): path of upload_plan.csv
+
+    Returns:
+        Path: path of journal file. e.g.: upload_plan.csv.journal
+    """
+
+    file_path_upload_plan = Path(file_path_upload_plan)
+    return file_path_upload_plan.with_name(
+        file_path_upload_plan.name + ".journal"
+    )
+
+
+def write_csv_atomic(df, file_path: Path):
+    """Save a dataframe as csv without the risk of a torn file.
+    The content is written to a temporary file that replaces the target.
+
+    Args:
+        df (pd.DataFrame): data to save
+        file_path (Path): csv file path
+    """
+
+    file_path = Path(file_path)
+    file_path_tmp = file_path.with_name(file_path.name + ".tmp")
+    with open(file_path_tmp, "w", encoding="utf-8", newline="") as file:
+        df.to_csv(file, index=False)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(file_path_tmp, file_path)
+
+
+class SentJournal:
+    """Write-ahead journal of the items already processed in an upload plan
+
+    Args:
+        file_path_upload_plan (Path): path of upload_plan.csv
+        compact_every (int, optional): number of records that triggers
+            the compaction of the journal into the csv. Defaults to 500.
+    """
+
+    def __init__(self, file_path_upload_plan: Path, compact_every: int = 500):
+
+        self.file_path_upload_plan = Path(file_path_upload_plan)
+        self.journal_path = get_journal_path(self.file_path_upload_plan)
+        self.compact_every = compact_every
+        self.count_records = len(self.read())
+
+    def append(self, file_output, **fields) -> dict:
+        """Record the item as sent. The record is flushed to disk before return
+
+        Args:
+            file_output (str): value of column file_output of the item
+            fields: other columns to update. Defaults to sent=1
+
+        Returns:
+            dict: the record saved
+        """
+
+        record = {"file_output": str(file_output), "sent": 1}
+        record.update(fields)
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with open(self.journal_path, "a", encoding="utf-8") as file:
+            file.write(line)
+            file.flush()
+            os.fsync(file.fileno())
+        self.count_records += 1
+
+        if self.compact_every and self.count_records >= self.compact_every:
+            self.compact()
+        return record
+
+    def read(self) -> list[dict]:
+        """Returns all records of the journal.
+        A torn last line, from a process killed while writing, is ignored.
+
+        Returns:
+            list[dict]: journal records, in writing order
+        """
+
+        if not self.journal_path.exists():
+            return []
+
+        list_record = []
+        with open(self.journal_path, "r", encoding="utf-8") as file:
+            for line in file:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    list_record.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logging.warning("Ignoring torn journal line: %s", line)
+        return list_record
+
+    def replay(self, df):
+        """Apply the journal records over the upload plan data
+
+        Args:
+            df (pd.DataFrame): upload plan data
+
+        Returns:
+            pd.DataFrame: upload plan data updated
+        """
+
+        list_record = self.read()
+        if len(list_record) == 0:
+            return df
+
+        dict_index = {}
+        for index, file_output in zip(df.index, df["file_output"]):
+            dict_index.setdefault(str(file_output), []).append(index)
+
+        for record in list_record:
+            list_index = dict_index.get(record["file_output"])
+            if list_index is None:
+                logging.warning(
+                    "Journal record not found in plan: %s",
+                    record["file_output"],
+                )
+                continue
+            for key, value in record.items():
+                if key == "file_output":
+                    continue
+                if key not in df.columns:
+                    df[key] = None
+                for index in list_index:
+                    df.at[index, key] = value
+        return df
+
+    def compact(self):
+        """Merge the journal into the upload plan csv and clear the journal"""
+
+        import pandas as pd
+
+        df = pd.read_csv(self.file_path_upload_plan)
+        df = self.replay(df)
+        write_csv_atomic(df, self.file_path_upload_plan)
+        # Records are idempotent, so a crash before this point
+        # just replays them again on next load
+        self.clear()
+
+    def clear(self):
+        """Remove the journal. Use only after its records were saved"""
+
+        if self.journal_path.exists():
+            os.remove(self.journal_path)
+        self.count_records = 0
@@ -0,0 +1,266 @@
+"""
+Streaming access to the upload plan.
+
+Rows are read in chunks and kept as compact PlanRow objects, so plans with
+millions of files can be created and sent with bounded memory.
+"""
+
+from __future__ import annotations
+
+import csv
+import math
+import os
+from pathlib import Path
+
+CHUNKSIZE = 10000
+
+
+def is_missing(value) -> bool:
+    """True for empty csv cells, read as None or NaN"""
+
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+class PlanRow:
+    """One item of the upload plan.
+    Supports the dict interface used by the send functions.
+
+    Args:
+        file_output (str): file path
+        description (str, optional): file caption. Defaults to None.
+        sent (int, optional): 1 if file was sent. Defaults to 0.
+        extra (dict, optional): other columns. Defaults to None.
+    """
+
+    __slots__ = ("file_output", "description", "sent", "extra")
+
+    FIELDS = ("file_output", "description", "sent")
+
+    def __init__(self, file_output, description=None, sent=0, extra=None):
+
+        self.file_output = file_output
+        self.description = description
+        self.sent = sent
+        self.extra = extra
+
+    def __repr__(self):
+
+        return f"PlanRow({self.to_dict()!r})"
+
+    def __eq__(self, other):
+
+        if isinstance(other, PlanRow):
+            return self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    @property
+    def path(self) -> Path:
+        """file_output as Path. Resolved on access, not kept in memory"""
+
+        return Path(self.file_output)
+
+    def __getitem__(self, key):
+
+        if key in self.FIELDS:
+            return getattr(self, key)
+        if self.extra is None:
+            raise KeyError(key)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+
+        if key in self.FIELDS:
+            setattr(self, key, value)
+            return
+        if self.extra is None:
+            self.extra = {}
+        self.extra[key] = value
+
+    def __contains__(self, key):
+
+        return key in self.FIELDS or (
+            self.extra is not None and key in self.extra
+        )
+
+    def get(self, key, default=None):
+
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+
+        list_key = list(self.FIELDS)
+        if self.extra is not None:
+            list_key.extend(self.extra)
+        return list_key
+
+    def update(self, fields: dict):
+
+        for key, value in fields.items():
+            self[key] = value
+
+    def to_dict(self) -> dict:
+
+        return {key: self[key] for key in self.keys()}
+
+
+def to_plan_row(record: dict) -> PlanRow:
+    """Build a PlanRow from a dict. Empty values of extra columns are
+    dropped to keep the row small
+
+    Args:
+        record (dict): upload plan line
+
+    Returns:
+        PlanRow: upload plan row
+    """
+
+    extra = {
+        key: value
+        for key, value in record.items()
+        if key not in PlanRow.FIELDS and not is_missing(value)
+    }
+    sent = record.get("sent", 0)
+    if is_missing(sent):
+        sent = 0
+    return PlanRow(
+        file_output=str(record["file_output"]),
+        description=record.get("description"),
+        sent=int(sent),
+        extra=extra or None,
+    )
+
+
+def iter_csv_records(file_path_csv: Path, chunksize: int = CHUNKSIZE):
+    """Read a csv in chunks, yielding one dict per line
+
+    Args:
+        file_path_csv (Path): csv file path
+        chunksize (int, optional): lines per chunk. Defaults to CHUNKSIZE.
+
+    Yields:
+        dict: csv line
+    """
+
+    import pandas as pd
+
+    with pd.read_csv(file_path_csv, chunksize=chunksize) as reader:
+        for df_chunk in reader:
+            for record in df_chunk.to_dict("records"):
+                yield record
+
+
+def iter_upload_plan(file_path_upload_plan: Path, chunksize: int = CHUNKSIZE):
+    """Read the upload plan in chunks, yielding one PlanRow per item
+
+    Args:
+        file_path_upload_plan (Path): path of upload_plan.csv
+        chunksize (int, optional): lines per chunk. Defaults to CHUNKSIZE.
+
+    Yields:
+        PlanRow: upload plan row
+    """
+
+    for record in iter_csv_records(file_path_upload_plan, chunksize):
+        yield to_plan_row(record)
+
+
+def get_csv_columns(file_path_csv: Path) -> list[str]:
+    """Returns the header of a csv, without reading its lines"""
+
+    with open(file_path_csv, "r", encoding="utf-8", newline="") as file:
+        return next(csv.reader(file), [])
+
+
+def write_rows_atomic(file_path: Path, list_columns: list[str], iter_rows):
+    """Save rows as csv, streaming, without the risk of a torn file.
+    The content is written to a temporary file that replaces the target.
+
+    Args:
+        file_path (Path): csv file path
+        list_columns (list[str]): csv header
+        iter_rows (Iterable[dict | PlanRow]): rows to save
+    """
+
+    file_path = Path(file_path)
+    file_path_tmp = file_path.with_name(file_path.name + ".tmp")
+    with open(file_path_tmp, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(list_columns)
+        for row in iter_rows:
+            list_value = []
+            for column in list_columns:
+                value = row.get(column)
+                if is_missing(value):
+                    value = ""
+                list_value.append(value)
+            writer.writerow(list_value)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(file_path_tmp, file_path)
+
+
+def write_upload_plan(file_path_upload_plan: Path, iter_file_path):
+    """Create the upload plan from file paths, streaming.
+    Description of each file is its name.
+
+    Args:
+        file_path_upload_plan (Path): path of upload_plan.csv
+        iter_file_path (Iterable[Path]): file paths, in sending order
+    """
+
+    iter_rows = (
+        {"file_output": str(file_path), "description": Path(file_path).name}
+        for file_path in iter_file_path
+    )
+    write_rows_atomic(
+        file_path_upload_plan, ["file_output", "description"], iter_rows
+    )
+
+
+def append_upload_plan(file_path_upload_plan: Path, iter_file_path):
+    """Append files to the end of the upload plan, without rewriting it.
+    Description of each file is its name. Other columns are left empty.
+
+    Args:
+        file_path_upload_plan (Path): path of upload_plan.csv
+        iter_file_path (Iterable[Path]): file paths, in sending order
+
+    Returns:
+        list[dict]: rows appended
+    """
+
+    list_row = [
+        {"file_output": str(file_path), "description": Path(file_path).name}
+        for file_path in iter_file_path
+    ]
+    file_path_upload_plan = Path(file_path_upload_plan)
+    if not file_path_upload_plan.exists():
+        write_rows_atomic(
+            file_path_upload_plan, ["file_output", "description"], list_row
+        )
+        return list_row
+
+    list_columns = get_csv_columns(file_path_upload_plan)
+    with open(file_path_upload_plan, "rb") as file:
+        file.seek(0, os.SEEK_END)
+        # a plan edited by hand may not end with a line break
+        ends_with_newline = file.tell() == 0
+        if not ends_with_newline:
+            file.seek(-1, os.SEEK_END)
+            ends_with_newline = file.read(1) in [b"\n", b"\r"]
+    with open(
+        file_path_upload_plan, "a", encoding="utf-8", newline=""
+    ) as file:
+        if not ends_with_newline:
+            file.write("\r\n")
+        writer = csv.writer(file)
+        for row in list_row:
+            writer.writerow([row.get(column, "") for column in list_columns])
+        file.flush()
+        os.fsync(file.fileno())
+    return list_row
@@ -0,0 +1,551 @@
+"""
+Upload plan stored in a SQLite database.
+
+Alternative to the csv plan for long uploads. Each item keeps its status
+(pending, in_flight, sent, failed), number of attempts, message id and time
+of last update, changed in small transactions. The upload_plan.csv remains
+the interface with the user: it is imported when changed on disk and can be
+exported at any time.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from .rows import (
+    append_upload_plan,
+    get_csv_columns,
+    is_missing,
+    iter_csv_records,
+    write_rows_atomic,
+)
+from .upload_plan import (
+    STATUS_FAILED,
+    STATUS_IN_FLIGHT,
+    STATUS_PENDING,
+    STATUS_SENT,
+)
+
+# columns with their own field in table. Others are kept in 'extra'
+PLAN_STATE_COLUMNS = [
+    "status",
+    "attempts",
+    "message_id",
+    "error",
+    "updated_at",
+]
+
+
+def get_valid(record: dict):
+    """Value of the valid column of the preflight. None if not checked"""
+
+    value = record.get("valid")
+    if is_missing(value) or value == "":
+        return None
+    return int(float(value))
+
+
+SQL_CREATE = """
+CREATE TABLE IF NOT EXISTS upload_plan (
+    position INTEGER PRIMARY KEY,
+    file_output TEXT NOT NULL,
+    description TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    message_id INTEGER,
+    error TEXT,
+    updated_at REAL,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_upload_plan_file_output
+    ON upload_plan (file_output);
+CREATE INDEX IF NOT EXISTS ix_upload_plan_status
+    ON upload_plan (status, position);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def get_database_path(file_path_upload_plan: Path) -> Path:
+    """get path of the database of an upload plan
+
+    Args:
+        file_path_upload_plan (Path): path of upload_plan.csv
+
+    Returns:
+        Path: path of database. e.g.: upload_plan.sqlite
+    """
+
+    return Path(file_path_upload_plan).with_suffix(".sqlite")
+
+
+class SqliteUploadPlan:
+    """Upload plan stored in SQLite, with the same interface of UploadPlan
+
+    Args:
+        file_path_upload_plan (Path): path of upload_plan.csv
+        database_path (Path, optional): path of database.
+            Defaults to None, to use upload_plan.sqlite next to the csv.
+    """
+
+    def __init__(self, file_path_upload_plan: Path, database_path=None):
+
+        self.file_path_upload_plan = Path(file_path_upload_plan)
+        if database_path is None:
+            database_path = get_database_path(self.file_path_upload_plan)
+        self.database_path = Path(database_path)
+        self.connection = sqlite3.connect(self.database_path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SQL_CREATE)
+        self.list_columns = json.loads(
+            self.get_meta("list_columns") or '["file_output", "description"]'
+        )
+        self.reload_if_changed()
+
+    def __len__(self):
+
+        cursor = self.connection.execute("SELECT COUNT(*) FROM upload_plan")
+        return cursor.fetchone()[0]
+
+    def close(self):
+
+        self.connection.close()
+
+    def get_meta(self, key):
+
+        cursor = self.connection.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        )
+        row = cursor.fetchone()
+        return None if row is None else row[0]
+
+    def set_meta(self, key, value):
+
+        self.connection.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            (key, str(value)),
+        )
+
+    def get_csv_mtime_ns(self):
+
+        if not self.file_path_upload_plan.exists():
+            return None
+        return os.stat(self.file_path_upload_plan).st_mtime_ns
+
+    def reload_if_changed(self) -> bool:
+        """Import upload_plan.csv if it was changed on disk since last
+        import or export
+
+        Returns:
+            bool: True if the csv was imported
+        """
+
+        csv_mtime_ns = self.get_csv_mtime_ns()
+        if csv_mtime_ns is None:
+            return False
+        if str(csv_mtime_ns) == self.get_meta("csv_mtime_ns"):
+            return False
+        self.import_csv()
+        return True
+
+    def import_csv(self, file_path_csv=None):
+        """Import items from a upload plan csv.
+        Items already in database keep their state, except failed items
+        of a file that the preflight found invalid and now valid.
+        Items with sent=1 in the csv are imported as sent.
+
+        Args:
+            file_path_csv (Path, optional): path of csv.
+                Defaults to None, to use the upload_plan.csv of the plan.
+        """
+
+        if file_path_csv is None:
+            file_path_csv = self.file_path_upload_plan
+        logging.warning("Importing upload plan: %s", file_path_csv)
+
+        list_columns = [
+            column
+            for column in get_csv_columns(file_path_csv)
+            if column not in PLAN_STATE_COLUMNS
+        ]
+        if "sent" not in list_columns:
+            list_columns.append("sent")
+
+        # only items that left the initial state need to be kept
+        dict_state = {
+            row["file_output"]: row
+            for row in self.connection.execute(
+                "SELECT file_output, status, attempts, message_id, error, "
+                "updated_at, extra FROM upload_plan "
+                "WHERE status != ? OR attempts > 0",
+                (STATUS_PENDING,),
+            )
+        }
+
+        def iter_row():
+            for position, record in enumerate(iter_csv_records(file_path_csv)):
+                file_output = str(record["file_output"])
+                state = dict_state.get(file_output)
+                if state is not None:
+                    status = state["status"]
+                    attempts = state["attempts"]
+                    message_id = state["message_id"]
+                    error = state["error"]
+                    updated_at = state["updated_at"]
+                    extra_state = json.loads(state["extra"] or "{}")
+                    if (
+                        status == STATUS_FAILED
+                        and get_valid(extra_state) == 0
+                        and get_valid(record) == 1
+                    ):
+                        # file fixed since the run that failed it
+                        status, error = STATUS_PENDING, None
+                else:
+                    status = (
+                        STATUS_SENT
+                        if record.get("sent") == 1
+                        else STATUS_PENDING
+                    )
+                    attempts, message_id, error = 0, None, None
+                    updated_at = None
+                extra = {
+                    key: value
+                    for key, value in record.items()
+                    if key not in ["file_output", "description", "sent"]
+                    and key not in PLAN_STATE_COLUMNS
+                    and not is_missing(value)
+                }
+                yield (
+                    position,
+                    file_output,
+                    record.get("description"),
+                    status,
+                    attempts,
+                    message_id,
+                    error,
+                    updated_at,
+                    json.dumps(extra, ensure_ascii=False, default=str),
+                )
+
+        with self.connection:
+            self.connection.execute("DELETE FROM upload_plan")
+            self.connection.executemany(
+                "INSERT INTO upload_plan (position, file_output, "
+                "description, status, attempts, message_id, error, "
+                "updated_at, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                iter_row(),
+            )
+            self.list_columns = list_columns
+            self.set_meta("list_columns", json.dumps(list_columns))
+            if Path(file_path_csv) == self.file_path_upload_plan:
+                self.set_meta("csv_mtime_ns", self.get_csv_mtime_ns())
+
+    def export_csv(self, file_path_csv=None):
+        """Save the plan, with its state, as a upload plan csv
+
+        Args:
+            file_path_csv (Path, optional): path of csv.
+                Defaults to None, to use the upload_plan.csv of the plan.
+        """
+
+        if file_path_csv is None:
+            file_path_csv = self.file_path_upload_plan
+
+        list_columns = self.list_columns + [
+            column
+            for column in PLAN_STATE_COLUMNS
+            if column not in self.list_columns
+        ]
+        write_rows_atomic(file_path_csv, list_columns, self.iter_records())
+        if Path(file_path_csv) == self.file_path_upload_plan:
+            with self.connection:
+                self.set_meta("csv_mtime_ns", self.get_csv_mtime_ns())
+
+    def compact(self):
+        """Keep the upload_plan.csv in sync with the database"""
+
+        self.reload_if_changed()
+        self.export_csv()
+
+    def row_to_record(self, row) -> dict:
+
+        record = {
+            "file_output": row["file_output"],
+            "description": row["description"],
+        }
+        record.update(json.loads(row["extra"] or "{}"))
+        record["sent"] = 1 if row["status"] == STATUS_SENT else 0
+        for column in PLAN_STATE_COLUMNS:
+            record[column] = row[column]
+        return record
+
+    def iter_records(self, status=None):
+        """Yields items of plan, in plan order, without loading all of them
+
+        Args:
+            status (str, optional): filter by status. Defaults to None.
+
+        Yields:
+            dict: item data
+        """
+
+        if status is None:
+            cursor = self.connection.execute(
+                "SELECT * FROM upload_plan ORDER BY position"
+            )
+        else:
+            cursor = self.connection.execute(
+                "SELECT * FROM upload_plan WHERE status = ? "
+                "ORDER BY position",
+                (status,),
+            )
+        for row in cursor:
+            yield self.row_to_record(row)
+
+    def get_records(self, status=None) -> list[dict]:
+        """Returns items of plan, in plan order
+
+        Args:
+            status (str, optional): filter by status. Defaults to None.
+
+        Returns:
+            list[dict]: items data
+        """
+
+        return list(self.iter_records(status))
+
+    def get_next(self):
+        """Returns the first item not sent yet.
+        Items left in_flight by an interrupted run are sent again.
+
+        Returns:
+            tuple[int, dict | bool]: index of item and item data.
+                (0, False) if all items were sent.
+        """
+
+        self.reload_if_changed()
+        cursor = self.connection.execute(
+            "SELECT * FROM upload_plan WHERE status IN (?, ?) "
+            "ORDER BY position LIMIT 1",
+            (STATUS_PENDING, STATUS_IN_FLIGHT),
+        )
+        row = cursor.fetchone()
+        if row is None:
+            return 0, False
+        return row["position"], self.row_to_record(row)
+
+    def iter_pending(self, page_size: int = 1000):
+        """Yields items not sent yet, in plan order, a page at a time,
+        so items can be updated while iterating
+
+        Args:
+            page_size (int, optional): items read by query.
+                Defaults to 1000.
+
+        Yields:
+            tuple[int, dict]: index of item and item data
+        """
+
+        self.reload_if_changed()
+        last_position = -1
+        while True:
+            list_row = self.connection.execute(
+                "SELECT * FROM upload_plan WHERE status IN (?, ?) "
+                "AND position > ? ORDER BY position LIMIT ?",
+                (STATUS_PENDING, STATUS_IN_FLIGHT, last_position, page_size),
+            ).fetchall()
+            if len(list_row) == 0:
+                return
+            for row in list_row:
+                yield row["position"], self.row_to_record(row)
+            last_position = list_row[-1]["position"]
+
+    def append_files(self, iter_file_path) -> list[dict]:
+        """Add files to the end of the plan, in database and in the csv.
+        Files already in the plan are skipped.
+
+        Args:
+            iter_file_path (Iterable[Path]): file paths, in sending order
+
+        Returns:
+            list[dict]: items added
+        """
+
+        self.reload_if_changed()
+        list_file_path = [
+            file_path
+            for file_path in dict.fromkeys(map(str, iter_file_path))
+            if self.connection.execute(
+                "SELECT 1 FROM upload_plan WHERE file_output = ?",
+                (file_path,),
+            ).fetchone()
+            is None
+        ]
+        list_row = append_upload_plan(
+            self.file_path_upload_plan, list_file_path
+        )
+        position = self.connection.execute(
+            "SELECT COALESCE(MAX(position), -1) FROM upload_plan"
+        ).fetchone()[0]
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO upload_plan (position, file_output, "
+                "description, extra) VALUES (?, ?, ?, '{}')",
+                [
+                    (
+                        position + 1 + index,
+                        row["file_output"],
+                        row["description"],
+                    )
+                    for index, row in enumerate(list_row)
+                ],
+            )
+            self.set_meta("csv_mtime_ns", self.get_csv_mtime_ns())
+        return [self.get_record(row["file_output"]) for row in list_row]
+
+    def get_failed(self) -> list[dict]:
+        """Returns items marked as failed, the dead letters of the plan"""
+
+        return self.get_records(STATUS_FAILED)
+
+    def get_record(self, file_output) -> dict:
+        """Returns the item of a file_output
+
+        Args:
+            file_output (str): value of column file_output
+
+        Returns:
+            dict: item data
+        """
+
+        list_row = self.connection.execute(
+            "SELECT * FROM upload_plan WHERE file_output = ?",
+            (str(file_output),),
+        ).fetchall()
+        len_list_row = len(list_row)
+        if len_list_row != 1:
+            print(f"Find {len_list_row} line for file: {file_output}")
+            sys.exit()
+        return self.row_to_record(list_row[0])
+
+    def update(self, file_output, **fields) -> dict:
+        """Update state of an item in one transaction
+
+        Args:
+            file_output (str): value of column file_output
+            fields: columns to update. 'sent' is translated to status
+
+        Returns:
+            dict: item data updated
+        """
+
+        record = self.get_record(file_output)
+        sent = fields.pop("sent", None)
+        if sent is not None and "status" not in fields:
+            fields["status"] = STATUS_SENT if sent == 1 else STATUS_PENDING
+
+        dict_state = {
+            key: value
+            for key, value in fields.items()
+            if key in PLAN_STATE_COLUMNS
+        }
+        dict_extra = {
+            key: value
+            for key, value in fields.items()
+            if key not in PLAN_STATE_COLUMNS
+        }
+        dict_state["updated_at"] = time.time()
+
+        with self.connection:
+            sql_set = ", ".join(f"{key} = ?" for key in dict_state)
+            self.connection.execute(
+                f"UPDATE upload_plan SET {sql_set} WHERE file_output = ?",
+                (*dict_state.values(), str(file_output)),
+            )
+            if dict_extra:
+                extra = json.loads(
+                    self.connection.execute(
+                        "SELECT extra FROM upload_plan WHERE file_output = ?",
+                        (str(file_output),),
+                    ).fetchone()[0]
+                    or "{}"
+                )
+                extra.update(dict_extra)
+                self.connection.execute(
+                    "UPDATE upload_plan SET extra = ? WHERE file_output = ?",
+                    (
+                        json.dumps(extra, ensure_ascii=False, default=str),
+                        str(file_output),
+                    ),
+                )
+                for key in dict_extra:
+                    if key not in self.list_columns:
+                        self.list_columns.append(key)
+                self.set_meta("list_columns", json.dumps(self.list_columns))
+
+        record.update(fields)
+        record.update(dict_state)
+        if sent is not None:
+            record["sent"] = sent
+        return record
+
+    def mark_in_flight(self, file_output) -> dict:
+        """Mark item as being sent and count one more attempt
+
+        Args:
+            file_output (str): value of column file_output
+
+        Returns:
+            dict: item data updated
+        """
+
+        with self.connection:
+            self.connection.execute(
+                "UPDATE upload_plan SET attempts = attempts + 1 "
+                "WHERE file_output = ?",
+                (str(file_output),),
+            )
+        return self.update(file_output, status=STATUS_IN_FLIGHT)
+
+    def mark_sent(self, file_output, message_id=None) -> dict:
+        """Mark item as sent
+
+        Args:
+            file_output (str): value of column file_output
+            message_id (int, optional): id of the message sent.
+                Defaults to None.
+
+        Returns:
+            dict: item data updated
+        """
+
+        return self.update(
+            file_output, status=STATUS_SENT, message_id=message_id, error=None
+        )
+
+    def mark_failed(self, file_output, error=None) -> dict:
+        """Mark item as failed. Failed items are skipped by get_next
+
+        Args:
+            file_output (str): value of column file_output
+            error (str, optional): error description. Defaults to None.
+
+        Returns:
+            dict: item data updated
+        """
+
+        return self.update(
+            file_output,
+            status=STATUS_FAILED,
+            error=None if error is None else str(error),
+        )
@@ -0,0 +1,294 @@
+"""
+In-memory upload plan.
+
+The upload_plan.csv is parsed once and kept in memory, with an index by
+file_output and a cursor on the first pending item. The file is parsed again
+only when it is changed on disk, so manual edits during a run are respected.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sys
+from pathlib import Path
+
+from .journal import SentJournal
+from .rows import (
+    PlanRow,
+    append_upload_plan,
+    get_csv_columns,
+    iter_upload_plan,
+    to_plan_row,
+    write_rows_atomic,
+)
+
+STATUS_PENDING = "pending"
+STATUS_IN_FLIGHT = "in_flight"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+
+
+class UploadPlan:
+    """Upload plan loaded in memory
+
+    Args:
+        file_path_upload_plan (Path): path of upload_plan.csv
+        compact_every (int, optional): number of sent marks that triggers
+            the save of the plan into the csv. Defaults to 500.
+    """
+
+    def __init__(self, file_path_upload_plan: Path, compact_every: int = 500):
+
+        self.file_path_upload_plan = Path(file_path_upload_plan)
+        self.compact_every = compact_every
+        # compaction is made from memory, by the plan itself
+        self.journal = SentJournal(self.file_path_upload_plan, compact_every=0)
+        self.list_columns = []
+        self.list_record = []
+        self.dict_index = {}
+        self.dict_duplicate = {}
+        self.cursor = 0
+        self.mtime_ns = None
+        self.load()
+
+    def __len__(self):
+
+        return len(self.list_record)
+
+    def load(self):
+        """Read the csv, in chunks, and apply the journal records"""
+
+        self.list_columns = get_csv_columns(self.file_path_upload_plan)
+        if "sent" not in self.list_columns:
+            self.list_columns.append("sent")
+        self.list_record = []
+        # one int by file. Lists only for the rare duplicated file_output
+        self.dict_index = {}
+        self.dict_duplicate = {}
+        for position, row in enumerate(
+            iter_upload_plan(self.file_path_upload_plan)
+        ):
+            self.list_record.append(row)
+            first_position = self.dict_index.setdefault(
+                row.file_output, position
+            )
+            if first_position != position:
+                self.dict_duplicate.setdefault(
+                    row.file_output, [first_position]
+                ).append(position)
+
+        for record in self.journal.read():
+            list_position = self.get_positions(record["file_output"])
+            if len(list_position) == 0:
+                logging.warning(
+                    "Journal record not found in plan: %s",
+                    record["file_output"],
+                )
+                continue
+            fields = {
+                key: value
+                for key, value in record.items()
+                if key != "file_output"
+            }
+            self.add_columns(fields)
+            for position in list_position:
+                self.list_record[position].update(fields)
+
+        self.cursor = 0
+        self.mtime_ns = self.get_mtime_ns()
+
+    def get_positions(self, file_output) -> list[int]:
+
+        file_output = str(file_output)
+        if file_output in self.dict_duplicate:
+            return self.dict_duplicate[file_output]
+        position = self.dict_index.get(file_output)
+        return [] if position is None else [position]
+
+    def add_columns(self, fields: dict):
+
+        for key in fields:
+            if key not in self.list_columns:
+                self.list_columns.append(key)
+
+    def get_mtime_ns(self):
+
+        return os.stat(self.file_path_upload_plan).st_mtime_ns
+
+    def reload_if_changed(self) -> bool:
+        """Reload the plan if upload_plan.csv was changed on disk
+
+        Returns:
+            bool: True if the plan was reloaded
+        """
+
+        if self.get_mtime_ns() == self.mtime_ns:
+            return False
+        logging.warning("Upload plan changed on disk. Reloading...")
+        self.load()
+        return True
+
+    def get_next(self):
+        """Returns the first item not sent yet
+
+        Returns:
+            tuple[int, PlanRow | bool]: index of item and item data.
+                (0, False) if all items were sent.
+        """
+
+        self.reload_if_changed()
+        len_list_record = len(self.list_record)
+        while self.cursor < len_list_record:
+            record = self.list_record[self.cursor]
+            if record.sent == 0 and record.get("status") != STATUS_FAILED:
+                return self.cursor, record
+            self.cursor += 1
+        return 0, False
+
+    def iter_pending(self):
+        """Yields items not sent yet, in plan order
+
+        Yields:
+            tuple[int, PlanRow]: index of item and item data
+        """
+
+        self.reload_if_changed()
+        for index in range(self.cursor, len(self.list_record)):
+            record = self.list_record[index]
+            if record.sent == 0 and record.get("status") != STATUS_FAILED:
+                yield index, record
+
+    def append_files(self, iter_file_path) -> list[PlanRow]:
+        """Add files to the end of the plan, in memory and in the csv.
+        Files already in the plan are skipped.
+
+        Args:
+            iter_file_path (Iterable[Path]): file paths, in sending order
+
+        Returns:
+            list[PlanRow]: items added
+        """
+
+        self.reload_if_changed()
+        list_file_path = []
+        for file_path in dict.fromkeys(map(str, iter_file_path)):
+            if len(self.get_positions(file_path)) == 0:
+                list_file_path.append(file_path)
+        list_record = []
+        for row in append_upload_plan(
+            self.file_path_upload_plan, list_file_path
+        ):
+            record = to_plan_row(row)
+            self.dict_index[record.file_output] = len(self.list_record)
+            self.list_record.append(record)
+            list_record.append(record)
+        self.mtime_ns = self.get_mtime_ns()
+        return list_record
+
+    def get_failed(self) -> list[PlanRow]:
+        """Returns items marked as failed, the dead letters of the plan"""
+
+        return [
+            record
+            for record in self.list_record
+            if record.get("status") == STATUS_FAILED
+        ]
+
+    def get_record(self, file_output) -> PlanRow:
+        """Returns the item of a file_output
+
+        Args:
+            file_output (str): value of column file_output
+
+        Returns:
+            PlanRow: item data
+        """
+
+        list_position = self.get_positions(file_output)
+        len_list_position = len(list_position)
+        if len_list_position != 1:
+            print(f"Find {len_list_position} line for file: {file_output}")
+            sys.exit()
+        return self.list_record[list_position[0]]
+
+    def update(self, file_output, **fields) -> PlanRow:
+        """Update columns of an item and save it in the journal
+
+        Args:
+            file_output (str): value of column file_output
+            fields: columns to update
+
+        Returns:
+            PlanRow: item data updated
+        """
+
+        record = self.get_record(file_output)
+        record.update(fields)
+        self.add_columns(fields)
+        # the journal records items as sent, unless told otherwise
+        self.journal.append(file_output, **{**fields, "sent": record.sent})
+
+        if (
+            self.compact_every
+            and self.journal.count_records >= self.compact_every
+        ):
+            self.compact()
+        return record
+
+    def mark_in_flight(self, file_output) -> PlanRow:
+        """Mark item as being sent.
+        The csv plan keeps only final states, so nothing is saved.
+
+        Args:
+            file_output (str): value of column file_output
+
+        Returns:
+            PlanRow: item data
+        """
+
+        return self.get_record(file_output)
+
+    def mark_sent(self, file_output, message_id=None) -> PlanRow:
+        """Mark item as sent
+
+        Args:
+            file_output (str): value of column file_output
+            message_id (int, optional): id of the message sent.
+                Defaults to None.
+
+        Returns:
+            PlanRow: item data updated
+        """
+
+        if message_id is None:
+            return self.update(file_output, sent=1)
+        return self.update(file_output, sent=1, message_id=message_id)
+
+    def mark_failed(self, file_output, error=None) -> PlanRow:
+        """Mark item as failed. Failed items are skipped by get_next
+
+        Args:
+            file_output (str): value of column file_output
+            error (str, optional): error description. Defaults to None.
+
+        Returns:
+            PlanRow: item data updated
+        """
+
+        return self.update(
+            file_output,
+            status=STATUS_FAILED,
+            error=None if error is None else str(error),
+        )
+
+    def compact(self):
+        """Save the plan into upload_plan.csv and clear the journal"""
+
+        # keep manual edits. The journal is replayed over them
+        self.reload_if_changed()
+        write_rows_atomic(
+            self.file_path_upload_plan, self.list_columns, self.list_record
+        )
+        self.journal.clear()
+        self.mtime_ns = self.get_mtime_ns()
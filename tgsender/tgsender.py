@@ -1,18 +1,25 @@
 from __future__ import annotations
 
-import asyncio
+import itertools
 import logging
 import os
-import sys
 import time
 from configparser import ConfigParser
 from pathlib import Path
 
-import pandas as pd
-import pyautogui as pag
-import pyperclip
+from . import client, mediainfo, plan, utils
 
-from . import api, api_async, utils
+# files and folders made by tgsender in the project folder
+PROJECT_FILE_NAMES = [
+    "upload_plan*",
+    "channel_metadata",
+    "log_sent",
+    "log-*",
+    "thumb_cache",
+    "faststart",
+    "upload_checkpoint",
+    "probe_cache*",
+]
 
 
 def get_config_data(path_file_config):
@@ -28,19 +35,7 @@ def get_config_data(path_file_config):
     return default_config
 
 
-def gen_data_frame(list_file_path: list[Path]):
-
-    list_dict = [
-        {"description": file_path.name, "file_output": file_path}
-        for file_path in list_file_path
-    ]
-    df = pd.DataFrame(list_dict)
-    list_columns = ["file_output", "description"]
-    df = df.reindex(list_columns, axis=1)
-    return df
-
-
-def create_report_descriptions(upload_plan_path):
+def create_report_descriptions(upload_plan_path, scan_workers=1):
 
     str_msg_paste_folder = "Paste the path folder with your files"
     str_msg_paste_here = "Paste here: "
@@ -48,18 +43,21 @@ def create_report_descriptions(upload_plan_path):
     while True:
         path_folder = input(str_msg_paste_here)
         if Path(path_folder).exists():
-            all_file_path = utils.get_all_file_path(Path(path_folder))
+            all_file_path = utils.get_all_file_path(
+                Path(path_folder), workers=scan_workers
+            )
             break
         else:
             logging.error("Folder not exist. Try again.")
 
     list_file_path = all_file_path["content"]
-    df = gen_data_frame(list_file_path)
-    df.to_csv(upload_plan_path, index=False)
+    plan.write_upload_plan(upload_plan_path, list_file_path)
 
 
 def pag_hotkey(key_1, key_2):
 
+    import pyautogui as pag
+
     pag.keyDown(key_1)
     pag.keyDown(key_2)
     pag.keyUp(key_1)
@@ -72,6 +70,8 @@ def set_win_positions():
     and telegram windows in back
     """
 
+    import pyautogui as pag
+
     pag_hotkey("alt", "tab")
     time.sleep(1)
     pag.keyDown("alt")
@@ -88,65 +88,78 @@ def change_between_telegram_winexplorer():
     time.sleep(2)
 
 
-def get_next_video_to_send(path_file_upload_plan: Path):
+def get_next_video_to_send(path_file_upload_plan: Path, backend="csv"):
 
     try:
-        df = pd.read_csv(path_file_upload_plan)
+        upload_plan = plan.open_upload_plan(
+            path_file_upload_plan, backend, compact_every=0
+        )
     except Exception as e:
         print(f"Can't open file: {path_file_upload_plan}")
         print(e)
+        raise
 
-    mask_df_to_send = df["sent"].isin([0])
-    df_to_send = df.loc[mask_df_to_send, :]
-    count_files_to_send = df_to_send.shape[0]
-    if count_files_to_send == 0:
-        return 0, False
-    else:
-        file_index = df_to_send.index[0]
-        df_to_send = df_to_send.reset_index(drop=True)
-        dict_first_line = df_to_send.loc[0, :]
-        return file_index, dict_first_line
+    return upload_plan.get_next()
 
 
-def update_description_file_sent(path_file_description, dict_file_data):
+def update_description_file_sent(
+    path_file_description, dict_file_data, upload_plan=None
+):
+    """Mark file as sent in upload plan.
+    The mark is appended to the plan journal, that is compacted
+    into the upload_plan.csv from time to time.
 
-    try:
-        df = pd.read_csv(path_file_description)
-    except Exception as e:
-        print(f"Can't open file: {path_file_description}")
-        print(e)
+    Args:
+        path_file_description (Path): path of upload_plan.csv
+        dict_file_data (dict): upload plan line. Necessary key: file_output
+        upload_plan (plan.UploadPlan, optional): upload plan in memory.
+            Defaults to None, to only append the mark to the journal.
+    """
 
     file_path = dict_file_data["file_output"]
-    mask_file_path = df["file_output"].isin([file_path])
-    df_filter = df.loc[mask_file_path, :]
-    len_df_filter = len(df_filter)
-    if len_df_filter != 1:
-        print(f"Find {len_df_filter} line for file: {file_path}")
-        sys.exit()
-    index_video = df_filter.index
-    # update df
-    df.loc[index_video, "sent"] = 1
-    df.to_csv(path_file_description, index=False)
-
+    if upload_plan is None:
+        plan.SentJournal(path_file_description).append(file_path, sent=1)
+    else:
+        upload_plan.mark_sent(file_path)
 
-def ensure_existence_sent_column(df_list, file_path_descriptions):
 
-    description_columns = df_list.columns
-    if "sent" not in description_columns:
-        df_list["sent"] = 0
-        df_list.to_csv(file_path_descriptions, index=False)
+def iter_data_upload_plan(upload_plan_path_folder: Path, backend="csv"):
+    """Yields the items of upload plan, reading it in chunks
 
+    Args:
+        upload_plan_path_folder (Path): folder with upload_plan.csv
+        backend (str, optional): 'csv' or 'sqlite'. Defaults to "csv".
 
-def get_data_upload_plan(upload_plan_path_folder: Path) -> list[dict]:
+    Yields:
+        plan.PlanRow | dict: upload plan item
+    """
 
     file_path_upload_plan = upload_plan_path_folder / "upload_plan.csv"
-    df_upload_plan = pd.read_csv(file_path_upload_plan)
-    data_upload_plan = df_upload_plan.to_dict("records")
-    return data_upload_plan
+    if backend == "sqlite":
+        upload_plan = plan.SqliteUploadPlan(file_path_upload_plan)
+        try:
+            yield from upload_plan.iter_records()
+        finally:
+            upload_plan.close()
+        return
+    yield from plan.iter_upload_plan(file_path_upload_plan)
+
+
+def get_data_upload_plan(
+    upload_plan_path_folder: Path, backend="csv"
+) -> list[dict]:
+
+    return [
+        dict(record) if isinstance(record, dict) else record.to_dict()
+        for record in iter_data_upload_plan(upload_plan_path_folder, backend)
+    ]
 
 
 def paste_on_telegram_app(desc):
 
+    import pyautogui as pag
+    import pyperclip
+
     time.sleep(2)
     pag_hotkey("ctrl", "v")
     pyperclip.copy(desc)
@@ -161,10 +174,12 @@ def ask_send_app_or_api():
 
     str_msg_1 = "How do you intend to send the files?"
     str_msg_2 = "1-By telegram desktop app"
-    str_msg_3 = "2-By telegram api (default)\n"
+    str_msg_3 = "2-By telegram api (default)"
+    str_msg_4 = "3-Repost files already sent to another channel, by api"
+    str_msg_5 = "4-Watch a folder and send new files, by api\n"
     str_msg_answer = "Type the number: "
 
-    print("\n".join([str_msg_1, str_msg_2, str_msg_3]))
+    print("\n".join([str_msg_1, str_msg_2, str_msg_3, str_msg_4, str_msg_5]))
 
     answer = input(str_msg_answer)
 
@@ -176,6 +191,8 @@ def ask_send_app_or_api():
 
 def send_via_telegram_app(data_upload_plan):
 
+    import pyautogui as pag
+
     set_win_positions()
     qt_files = len(data_upload_plan)
     print(f"Send {qt_files} files")
@@ -200,6 +217,8 @@ def send_via_telegram_app(data_upload_plan):
 
 async def process_create_channel(folder_path_descriptions):
 
+    from . import api_async
+
     # TODO: The channel title must be the name of the original project folder
     title = api_async.get_channel_title(folder_path_descriptions)
     description = "channel description"
@@ -214,6 +233,8 @@ async def config_channel(
     chat_id, chat_invite_link, list_adms, folder_path_descriptions
 ):
 
+    from . import api_async
+
     description = api_async.get_channel_description(
         chat_invite_link, folder_path_descriptions
     )
@@ -228,6 +249,38 @@ async def config_channel(
         )
 
 
+def open_checked_upload_plan(folder_path_upload_plan: Path, dict_config):
+    """Open the upload plan of a run, after its preflight
+
+    Args:
+        folder_path_upload_plan (Path): Path folder with "upload_plan.csv"
+        dict_config (dict): configuration data. Optional keys:
+            plan_backend, journal_compact_every, preflight and
+            preflight_workers
+
+    Returns:
+        UploadPlan | SqliteUploadPlan: plan opened
+    """
+
+    file_path_upload_plan = folder_path_upload_plan / "upload_plan.csv"
+    upload_plan = plan.open_upload_plan(
+        file_path_upload_plan,
+        backend=dict_config.get("plan_backend", "csv"),
+        compact_every=int(dict_config.get("journal_compact_every", 500)),
+    )
+    # save 'sent' column and marks left by a previous interrupted run,
+    # so the preflight sees files failed by previous runs
+    upload_plan.compact()
+    if int(dict_config.get("preflight", 1)):
+        # missing and corrupt files are found before the upload. The plan
+        # is reloaded from its csv when changed
+        mediainfo.preflight_upload_plan(
+            file_path_upload_plan,
+            workers=int(dict_config.get("preflight_workers") or 0) or None,
+        )
+    return upload_plan
+
+
 def send_via_telegram_api(folder_path_upload_plan: Path, dict_config: dict):
     """send files via_telegram by api
 
@@ -240,46 +293,668 @@ def send_via_telegram_api(folder_path_upload_plan: Path, dict_config: dict):
             configuration data.
             template: [chat_id:negative int,
                        channel_adms:
-                       create_new_channel: optional: [0 , 1]]
+                       create_new_channel: optional: [0 , 1],
+                       plan_backend: optional: [csv, sqlite]]
     """
 
-    file_path_upload_plan = folder_path_upload_plan / "upload_plan.csv"
-    df_list = pd.read_csv(file_path_upload_plan)
+    from . import api
 
-    ensure_existence_sent_column(df_list, file_path_upload_plan)
+    configure_send_via_telegram_api(folder_path_upload_plan, dict_config)
+    upload_plan = open_checked_upload_plan(
+        folder_path_upload_plan, dict_config
+    )
 
     api.ensure_connection()
 
-    chat_id = asyncio.run(
+    # channel setup shares the client of the upload
+    chat_id = client.run_in_client_loop(
         process_to_send_telegram(folder_path_upload_plan, dict_config)
     )
     time_limit = int(dict_config["time_limit"])
+    retry_policy = utils.RetryPolicy.from_config(dict_config)
+    stall_timeout = float(dict_config.get("stall_timeout", 120))
 
-    # Connection test to avoid infinite loop of asynchronous attempts
-    # to send files without pause to fill connection pool
+    list_session_file = client.get_list_session_file(
+        dict_config.get("session_files", "")
+    )
+    if len(list_session_file) > 1:
+        if get_album_settings(dict_config)[1] > 1:
+            logging.warning("Albums are not sent by many accounts")
+        send_sharded_via_telegram_api(
+            folder_path_upload_plan,
+            upload_plan,
+            chat_id,
+            list_session_file,
+            staging=dict_config.get("shard_staging", "me"),
+            retry_policy=retry_policy,
+            prefetch_workers=int(dict_config.get("prefetch_workers", 2)),
+            prefetch_lookahead=int(dict_config.get("prefetch_lookahead", 4)),
+            stall_timeout=stall_timeout,
+            min_deadline=time_limit * 60,
+        )
+        upload_plan.compact()
+        log_failed(upload_plan)
+        return
 
-    files_count = df_list.shape[0]
-    while True:
-        index, dict_file_data = get_next_video_to_send(file_path_upload_plan)
-        # mark file as sent
-        if dict_file_data is False:
-            break
+    send_pending_via_telegram_api(
+        folder_path_upload_plan, upload_plan, chat_id, dict_config
+    )
+    upload_plan.compact()
+    log_failed(upload_plan)
+
+
+def configure_send_via_telegram_api(
+    folder_path_upload_plan: Path, dict_config: dict
+):
+    """Set rate limits, upload, file index, caches and faststart stage
+    from configuration data, before sending files"""
+
+    utils.configure_rate_limiter(dict_config)
+    client.configure_upload_from_config(dict_config, folder_path_upload_plan)
+    client.configure_file_index_from_config(dict_config)
+    file_index = client.get_file_index()
+    if file_index is not None:
+        # messages sent by runs before the index existed
+        file_index.index_log_sent(folder_path_upload_plan / "log_sent")
+    mediainfo.configure_probe_cache_from_config(
+        dict_config, folder_path_upload_plan
+    )
+    mediainfo.configure_thumb_cache_from_config(
+        dict_config, folder_path_upload_plan
+    )
+    mediainfo.configure_faststart_from_config(
+        dict_config, folder_path_upload_plan
+    )
+
+
+def send_pending_via_telegram_api(
+    folder_path_upload_plan: Path, upload_plan, chat_id: int, dict_config: dict
+):
+    """send items of the plan not sent yet, by the account of the api
+
+    Args:
+        folder_path_upload_plan (Path): Path folder with "upload_plan.csv"
+        upload_plan (UploadPlan | SqliteUploadPlan): plan opened
+        chat_id (int): destination chat
+        dict_config (dict): configuration data
+    """
+
+    from . import api, api_async
+
+    file_path_upload_plan = folder_path_upload_plan / "upload_plan.csv"
+    time_limit = int(dict_config["time_limit"])
+    retry_policy = utils.RetryPolicy.from_config(dict_config)
+    stall_timeout = float(dict_config.get("stall_timeout", 120))
+    album_column, album_max_items = get_album_settings(dict_config)
+    concurrent_files = client.get_upload_settings().concurrent_files
+
+    files_count = len(upload_plan)
+    # next videos are probed and thumbnailed while a file uploads
+    prefetcher = api_async.Prefetcher(
+        iter_pending_valid(upload_plan),
+        workers=int(dict_config.get("prefetch_workers", 2)),
+        lookahead=max(
+            int(dict_config.get("prefetch_lookahead", 4)), concurrent_files
+        ),
+    )
+    if concurrent_files > 1:
+        if album_max_items > 1:
+            logging.warning("Albums are not sent concurrently")
         else:
+            with prefetcher:
+                send_concurrent_via_telegram_api(
+                    folder_path_upload_plan,
+                    upload_plan,
+                    prefetcher,
+                    chat_id,
+                    dict_config,
+                    concurrent_files,
+                )
+            return
+
+    with prefetcher:
+        for list_item in api_async.iter_albums(
+            prefetcher, album_column, album_max_items
+        ):
+            if len(list_item) > 1:
+                send_album_via_telegram_api(
+                    folder_path_upload_plan,
+                    upload_plan,
+                    list_item,
+                    chat_id,
+                    time_limit,
+                    retry_policy,
+                    files_count,
+                )
+                continue
+
+            index, dict_file_data = list_item[0]
             file_path = dict_file_data["file_output"]
             log_file_path = utils.get_log_file_path(
                 folder_path_upload_plan, Path(file_path), index
             )
             logging.warning(f"{index+1}/{files_count} Uploading: {file_path}")
+            upload_plan.mark_in_flight(file_path)
 
             try:
-                api.send_file(
-                    dict_file_data, chat_id, time_limit, log_file_path
+                retry_policy.call(
+                    api.send_file,
+                    dict_file_data,
+                    chat_id,
+                    time_limit,
+                    log_file_path,
+                    stall_timeout,
+                    label=f"{index+1}/{files_count}",
+                )
+            except utils.RetryError as e:
+                # dead letter. Kept in plan, with the error, and skipped
+                logging.error(f"{index+1}/{files_count} Failed: {e}")
+                upload_plan.mark_failed(file_path, e)
+                continue
+            finally:
+                api_async.discard_prepared(dict_file_data)
+
+            update_description_file_sent(
+                file_path_upload_plan, dict_file_data, upload_plan
+            )
+
+
+def send_concurrent_via_telegram_api(
+    folder_path_upload_plan: Path,
+    upload_plan,
+    iterable,
+    chat_id: int,
+    dict_config: dict,
+    concurrent_files: int,
+):
+    """send items of the plan with many uploads in flight, by the account
+    of the api. Items are sent in batches by api_async.send_files, staged
+    in Saved Messages and copied to the chat in plan order.
+
+    Args:
+        folder_path_upload_plan (Path): Path folder with "upload_plan.csv"
+        upload_plan (UploadPlan | SqliteUploadPlan): plan opened
+        iterable (Iterable[tuple[int, dict]]): index and data of items
+        chat_id (int): destination chat
+        dict_config (dict): configuration data. Optional key:
+            upload_type_limit. e.g.: video:1
+        concurrent_files (int): maximum uploads in flight
+    """
+
+    from . import api_async
+
+    dict_type_limit = api_async.parse_type_limit(
+        dict_config.get("upload_type_limit")
+    )
+    iterator = iter(iterable)
+    while True:
+        list_item = list(itertools.islice(iterator, 4 * concurrent_files))
+        if len(list_item) == 0:
+            return
+        list_dict_file_data = [
+            dict_file_data for _, dict_file_data in list_item
+        ]
+        for dict_file_data in list_dict_file_data:
+            upload_plan.mark_in_flight(dict_file_data["file_output"])
+        try:
+            list_message = client.run_in_client_loop(
+                api_async.send_files(
+                    list_dict_file_data,
+                    chat_id,
+                    time_limit=int(dict_config["time_limit"]),
+                    max_concurrent=concurrent_files,
+                    dict_type_limit=dict_type_limit,
+                    retry_policy=utils.RetryPolicy.from_config(dict_config),
+                    stall_timeout=float(dict_config.get("stall_timeout", 120)),
                 )
-            except Exception as e:
-                logging.error("pyrogram error. %s", e)
-                logging.warning("Trying again send file...")
+            )
+        finally:
+            for dict_file_data in list_dict_file_data:
+                api_async.discard_prepared(dict_file_data)
+
+        for (index, dict_file_data), message in zip(list_item, list_message):
+            file_path = dict_file_data["file_output"]
+            if message is None and not Path(file_path).exists():
+                upload_plan.mark_failed(file_path, "File not found")
+                continue
+            if message is None:
+                # dead letter. The error is in the log
+                upload_plan.mark_failed(file_path, "Upload failed")
+                continue
+            utils.log_send_return(
+                str(message),
+                file_path,
+                utils.get_log_file_path(
+                    folder_path_upload_plan, Path(file_path), index
+                ),
+            )
+            upload_plan.mark_sent(file_path, message_id=message.id)
+
+
+def repost_via_telegram_api(folder_path_upload_plan: Path, dict_config: dict):
+    """Post the files of a plan, already sent, to another chat by their
+    file_id, without upload. Files are found in the index of sent messages,
+    updated from the log_sent folder of the project. Files already posted
+    to the chat, as in an interrupted repost, are skipped.
+
+    Args:
+        folder_path_upload_plan (Path):
+            Path folder with "upload_plan.csv" file and "log_sent" folder.
+        dict_config (dict):
+            configuration data. Necessary key: repost_chat_id.
+            Optional key: file_index_path
+    """
+
+    from . import api
+
+    repost_chat = {"chat_id": dict_config.get("repost_chat_id")}
+    if not repost_chat["chat_id"] or not test_chat_id(repost_chat):
+        logging.error("Set repost_chat_id in config.ini. Negative integer")
+        return
+    chat_id = int(repost_chat["chat_id"])
+
+    utils.configure_rate_limiter(dict_config)
+    file_index = client.FileIndex(dict_config.get("file_index_path") or None)
+    count_log = file_index.index_log_sent(folder_path_upload_plan / "log_sent")
+    logging.warning(f"{count_log} messages indexed from log_sent")
+    retry_policy = utils.RetryPolicy.from_config(dict_config)
+    api.ensure_connection()
+
+    count_posted = 0
+    list_not_sent = []
+    file_path_upload_plan = folder_path_upload_plan / "upload_plan.csv"
+    for index, record in enumerate(
+        plan.iter_upload_plan(file_path_upload_plan)
+    ):
+        file_path = record.file_output
+        if file_index.find_sent(file_path=file_path, chat_id=chat_id):
+            continue
+        list_sent = [
+            dict_sent
+            for dict_sent in file_index.find_sent(file_path=file_path)
+            if dict_sent["file_id"]
+        ]
+        if len(list_sent) == 0:
+            list_not_sent.append(file_path)
+            continue
+        try:
+            message, file_id = repost_file(
+                list_sent[0],
+                chat_id,
+                record.description,
+                retry_policy,
+                label=f"{index+1}",
+            )
+        except utils.RetryError as e:
+            logging.error(f"{index+1} Repost failed: {file_path}. {e}")
+            continue
+        file_index.add_sent(
+            file_path, chat_id, message.id, file_id, date=message.date
+        )
+        count_posted += 1
+    file_index.close()
+
+    logging.warning(f"{count_posted} files reposted to {chat_id}")
+    if list_not_sent:
+        logging.error(
+            f"{len(list_not_sent)} files were never sent, "
+            "so they can't be reposted:"
+        )
+        for file_path in list_not_sent:
+            logging.error(file_path)
+
+
+def get_project_ignore_patterns(folder_path_project: Path) -> list[str]:
+    """Glob patterns of files made by tgsender in the project folder,
+    as the plan, logs and caches, to not be uploaded by the watch mode"""
+
+    list_pattern = []
+    for name in PROJECT_FILE_NAMES:
+        list_pattern.append(str(folder_path_project / name))
+        list_pattern.append(str(folder_path_project / name / "*"))
+    return list_pattern
 
-            update_description_file_sent(file_path_upload_plan, dict_file_data)
+
+def get_watch_folder(dict_config: dict) -> Path:
+    """Folder to watch, from config key watch_folder, or asked"""
+
+    if dict_config.get("watch_folder"):
+        return Path(dict_config["watch_folder"]).absolute()
+    print("Paste the path folder to watch for new files")
+    while True:
+        folder_path = Path(input("Paste here: "))
+        if folder_path.is_dir():
+            return folder_path.absolute()
+        logging.error("Folder not exist. Try again.")
+
+
+def watch_via_telegram_api(
+    folder_path_upload_plan: Path, dict_config: dict, folder_path_watch=None
+):
+    """Watch a folder and send files as they are added, until interrupted.
+    Each file is sent once its size stops changing. It is appended to
+    upload_plan.csv, so an interrupted watch resumes as a normal upload.
+    Files already in the folder, but not in the plan, are sent too.
+
+    Args:
+        folder_path_upload_plan (Path):
+            Path folder with "upload_plan.csv" file.
+        dict_config (dict):
+            configuration data. Optional keys: watch_folder,
+            watch_stable_seconds, watch_poll_interval, watch_events
+        folder_path_watch (Path, optional): folder to watch. Defaults to
+            None, to use watch_folder of config or ask it.
+    """
+
+    from . import api
+
+    if folder_path_watch is None:
+        folder_path_watch = get_watch_folder(dict_config)
+    configure_send_via_telegram_api(folder_path_upload_plan, dict_config)
+    file_path_upload_plan = folder_path_upload_plan / "upload_plan.csv"
+    if not file_path_upload_plan.exists():
+        plan.write_upload_plan(file_path_upload_plan, [])
+    upload_plan = plan.open_upload_plan(
+        file_path_upload_plan,
+        backend=dict_config.get("plan_backend", "csv"),
+        compact_every=int(dict_config.get("journal_compact_every", 500)),
+    )
+    upload_plan.compact()
+
+    api.ensure_connection()
+    chat_id = client.run_in_client_loop(
+        process_to_send_telegram(folder_path_upload_plan, dict_config)
+    )
+    if (
+        len(client.get_list_session_file(dict_config.get("session_files", "")))
+        > 1
+    ):
+        logging.warning("Watch mode sends by the account of the api only")
+
+    watcher = utils.FolderWatcher(
+        folder_path_watch,
+        stable_seconds=float(dict_config.get("watch_stable_seconds") or 5),
+        poll_interval=float(dict_config.get("watch_poll_interval") or 2),
+        set_known={
+            record.file_output
+            for record in plan.iter_upload_plan(file_path_upload_plan)
+        },
+        list_ignore_pattern=get_project_ignore_patterns(
+            folder_path_upload_plan.absolute()
+        ),
+        use_events=bool(int(dict_config.get("watch_events", 1))),
+        workers=int(dict_config.get("scan_workers") or 1),
+    )
+    logging.warning(f"Watching {folder_path_watch}. Press Ctrl+C to stop")
+    try:
+        with watcher:
+            # left by a previous run
+            send_pending_via_telegram_api(
+                folder_path_upload_plan, upload_plan, chat_id, dict_config
+            )
+            for list_file_path in watcher.iter_stable():
+                list_record = upload_plan.append_files(list_file_path)
+                if len(list_record) == 0:
+                    continue
+                logging.warning(f"{len(list_record)} new files in plan")
+                send_pending_via_telegram_api(
+                    folder_path_upload_plan, upload_plan, chat_id, dict_config
+                )
+    except KeyboardInterrupt:
+        logging.warning("Watch stopped")
+    finally:
+        upload_plan.compact()
+        log_failed(upload_plan)
+
+
+def repost_file(dict_sent, chat_id, caption, retry_policy, label=""):
+    """Post a file again by the file_id of a message sent before.
+    If the file_id is refused, as when its file reference expired, a new
+    one is taken from the message sent before.
+
+    Args:
+        dict_sent (dict): message sent, from FileIndex.find_sent
+        chat_id (int): destination chat
+        caption (str): message caption
+        retry_policy (utils.RetryPolicy): retry policy of requests
+        label (str, optional): request description, for log.
+
+    Raises:
+        utils.RetryError: if the file can't be posted
+
+    Returns:
+        tuple[pyrogram.types.Message, str]: message and file_id posted
+    """
+
+    from . import api
+
+    file_id = dict_sent["file_id"]
+    try:
+        message = retry_policy.call(
+            api.send_cached_file, chat_id, file_id, caption, label=label
+        )
+        return message, file_id
+    except utils.RetryError as e:
+        if e.error_class != utils.ERROR_PERMANENT:
+            raise
+        error = e
+    file_id = retry_policy.call(
+        api.get_message_file_id,
+        dict_sent["chat_id"],
+        dict_sent["message_id"],
+        label=label,
+    )
+    if file_id is None:
+        raise error
+    message = retry_policy.call(
+        api.send_cached_file, chat_id, file_id, caption, label=label
+    )
+    return message, file_id
+
+
+def get_album_settings(dict_config):
+    """Grouping column and maximum items by album, from config keys album,
+    album_column and album_max_items. Without album mode, files are sent
+    one by message
+
+    Returns:
+        tuple[str, int]: column of upload_plan.csv and maximum items
+    """
+
+    if not int(dict_config.get("album") or 0):
+        return None, 1
+    return (
+        str(dict_config.get("album_column") or "album").strip(),
+        int(dict_config.get("album_max_items") or 10),
+    )
+
+
+def send_album_via_telegram_api(
+    folder_path_upload_plan: Path,
+    upload_plan,
+    list_item: list,
+    chat_id: int,
+    time_limit: int,
+    retry_policy,
+    files_count: int,
+):
+    """Send consecutive items of the plan as one album
+
+    Args:
+        folder_path_upload_plan (Path): Path folder with "upload_plan.csv"
+        upload_plan (UploadPlan | SqliteUploadPlan): plan opened
+        list_item (list[tuple[int, dict]]): index and data of items
+        chat_id (int): destination chat
+        time_limit (int): minimum minutes of the deadline of the album
+        retry_policy (utils.RetryPolicy): retry of the whole album
+        files_count (int): items of the plan, for log
+    """
+
+    from . import api, api_async
+
+    label = f"{list_item[0][0]+1}-{list_item[-1][0]+1}/{files_count}"
+    list_dict_file_data = [dict_file_data for _, dict_file_data in list_item]
+    list_log_file_path = [
+        utils.get_log_file_path(
+            folder_path_upload_plan, Path(dict_file_data["file_output"]), index
+        )
+        for index, dict_file_data in list_item
+    ]
+    logging.warning(f"{label} Uploading album of {len(list_item)} files")
+    for dict_file_data in list_dict_file_data:
+        upload_plan.mark_in_flight(dict_file_data["file_output"])
+
+    try:
+        list_message = retry_policy.call(
+            api.send_album,
+            list_dict_file_data,
+            chat_id,
+            time_limit,
+            list_log_file_path,
+            label=label,
+        )
+    except utils.RetryError as e:
+        # dead letter. Kept in plan, with the error, and skipped
+        logging.error(f"{label} Failed: {e}")
+        for dict_file_data in list_dict_file_data:
+            upload_plan.mark_failed(dict_file_data["file_output"], e)
+        return
+    finally:
+        for dict_file_data in list_dict_file_data:
+            api_async.discard_prepared(dict_file_data)
+
+    for dict_file_data, message in zip(list_dict_file_data, list_message):
+        upload_plan.mark_sent(
+            dict_file_data["file_output"], message_id=message.id
+        )
+
+
+def iter_pending_valid(upload_plan):
+    """Yields items not sent yet, in plan order. Files found invalid by
+    the preflight are marked as failed and skipped
+
+    Yields:
+        tuple[int, PlanRow | dict]: index of item and item data
+    """
+
+    for index, dict_file_data in upload_plan.iter_pending():
+        if mediainfo.is_invalid(dict_file_data):
+            upload_plan.mark_failed(
+                dict_file_data["file_output"],
+                dict_file_data.get("preflight_error"),
+            )
+            continue
+        yield index, dict_file_data
+
+
+def log_failed(upload_plan):
+    """Report files of the plan that failed to be sent"""
+
+    list_failed = upload_plan.get_failed()
+    if len(list_failed) == 0:
+        return
+    logging.error(
+        f"{len(list_failed)} files failed. "
+        "See columns 'status' and 'error' of upload_plan"
+    )
+    for dict_file_data in list_failed:
+        logging.error(
+            f"{dict_file_data['file_output']}: {dict_file_data.get('error')}"
+        )
+
+
+def send_sharded_via_telegram_api(
+    folder_path_upload_plan: Path,
+    upload_plan,
+    chat_id: int,
+    list_session_file: list[Path],
+    staging: str = "me",
+    retry_policy=None,
+    stall_timeout: float = 120,
+    min_deadline: float = None,
+    prefetch_workers: int = 2,
+    prefetch_lookahead: int = 4,
+):
+    """send files via telegram api, sharing the upload among many accounts
+
+    Args:
+        folder_path_upload_plan (Path): Path folder with "upload_plan.csv"
+        upload_plan (UploadPlan | SqliteUploadPlan): plan opened
+        chat_id (int): destination chat
+        list_session_file (list[Path]): authorized session file of each
+            account. Accounts must be members of the chat, able to post.
+        staging (str, optional): 'me' or 'channel'. Defaults to "me".
+        retry_policy (utils.RetryPolicy, optional): Defaults to None.
+        stall_timeout (float, optional): seconds without upload progress
+            to abort an upload. Defaults to 120.
+        min_deadline (float, optional): minimum seconds of the overall
+            deadline of each upload. Defaults to None.
+        prefetch_workers (int, optional): threads probing and
+            thumbnailing next videos. Defaults to 2.
+        prefetch_lookahead (int, optional): items prepared ahead.
+            Defaults to 4.
+    """
+
+    from . import api_async
+
+    file_index = client.get_file_index()
+
+    def on_published(index, dict_file_data, message, session_name):
+
+        file_path = dict_file_data["file_output"]
+        log_file_path = utils.get_log_file_path(
+            folder_path_upload_plan, Path(file_path), index
+        )
+        utils.log_send_return(
+            str(message),
+            file_path,
+            log_file_path,
+            {"session_name": session_name},
+        )
+        upload_plan.mark_sent(file_path, message_id=message.id)
+        if file_index is not None:
+            api_async.add_file_index(
+                file_index, dict_file_data, message, session_name
+            )
+        api_async.discard_prepared(dict_file_data)
+
+    def on_failed(index, dict_file_data, error):
+
+        upload_plan.mark_failed(dict_file_data["file_output"], error)
+        api_async.discard_prepared(dict_file_data)
+
+    def iter_item():
+
+        for index, dict_file_data in iter_pending_valid(upload_plan):
+            upload_plan.mark_in_flight(dict_file_data["file_output"])
+            yield index, dict_file_data
+
+    async def send_sharded():
+
+        prefetcher = api_async.Prefetcher(
+            iter_item(),
+            workers=prefetch_workers,
+            # every account has its next file ready
+            lookahead=prefetch_lookahead + len(list_session_file),
+        )
+        with prefetcher:
+            async with client.AccountPool(list_session_file) as account_pool:
+                return await api_async.send_files_sharded(
+                    prefetcher,
+                    chat_id,
+                    account_pool.dict_app,
+                    staging=staging,
+                    on_published=on_published,
+                    on_failed=on_failed,
+                    retry_policy=retry_policy,
+                    stall_timeout=stall_timeout,
+                    min_deadline=min_deadline,
+                )
+
+    count_published = client.run_in_client_loop(send_sharded())
+    logging.warning(
+        f"{count_published} files sent by {len(list_session_file)} accounts"
+    )
 
 
 def test_chat_id(dict_config):
@@ -319,6 +994,8 @@ async def process_to_send_telegram(folder_path_descriptions, dict_config):
         int: chat_id. negative integer
     """
 
+    from . import api_async
+
     # check if there is necessary to continue upload
     file_path_metadata = os.path.realpath(
         os.path.join(folder_path_descriptions, "channel_metadata")
@@ -363,7 +1040,7 @@ async def process_to_send_telegram(folder_path_descriptions, dict_config):
     return chat_id
 
 
-def ask_create_or_use(upload_plan_path):
+def ask_create_or_use(upload_plan_path, scan_workers=1):
 
     str_msg_create_or_use_1 = "About the upload_plan.csv report"
     str_msg_create_or_use_2 = "1-Use existing (default)"
@@ -376,7 +1053,7 @@ def ask_create_or_use(upload_plan_path):
 
     create_or_use_answer = input(str_msg_answer)
     if create_or_use_answer == "2":
-        create_report_descriptions(upload_plan_path)
+        create_report_descriptions(upload_plan_path, scan_workers)
         input("Report Created. Press a key to continue.")
     else:
         pass
@@ -398,16 +1075,24 @@ def main():
     dict_config = get_config_data(path_config_file)
 
     upload_plan_path = Path("upload_plan.csv").absolute()
-    ask_create_or_use(upload_plan_path)
+    ask_create_or_use(
+        upload_plan_path, int(dict_config.get("scan_workers") or 1)
+    )
 
     upload_plan_path_folder = upload_plan_path.parent
-    data_upload_plan = get_data_upload_plan(upload_plan_path_folder)
     send_mode = ask_send_app_or_api()
 
     if send_mode == 1:
+        data_upload_plan = get_data_upload_plan(
+            upload_plan_path_folder, dict_config.get("plan_backend", "csv")
+        )
         send_via_telegram_app(data_upload_plan)
     elif send_mode == 2:
         send_via_telegram_api(upload_plan_path_folder, dict_config)
+    elif send_mode == 3:
+        repost_via_telegram_api(upload_plan_path_folder, dict_config)
+    elif send_mode == 4:
+        watch_via_telegram_api(upload_plan_path_folder, dict_config)
 
 
 if __name__ == "__main__":
@@ -1,2 +1,5 @@
-from .time_out import time_out
+from .folder_watch import *
+from .rate_limit import *
+from .retry import *
 from .utils import *
+from .watchdog import *
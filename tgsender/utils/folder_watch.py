@@ -0,0 +1,201 @@
+"""
+Watch of a folder for new files.
+
+New files are found by inotify (or the native events of each system), with
+the optional watchdog library, or by listing the folder at each poll when
+it is not installed. A file is reported only once it is stable: its size and
+modification time did not change for some seconds, so files still being
+copied or recorded are not uploaded half written.
+"""
+
+from __future__ import annotations
+
+import fnmatch
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from .utils import iter_file_path, natsort_path
+
+# partial downloads, editor and system files
+WATCH_IGNORE_PATTERNS = [
+    "*/.*",
+    "*.part",
+    "*.partial",
+    "*.tmp",
+    "*.crdownload",
+    "*~",
+]
+
+
+class FolderWatcher:
+    """Report files added to a folder, recursively, once they are stable
+
+    Args:
+        folder_path (Path): folder to watch
+        stable_seconds (float, optional): seconds without change of size
+            and modification time to consider a file complete.
+            Defaults to 5.
+        poll_interval (float, optional): seconds between checks.
+            Defaults to 2.
+        set_known (set[str], optional): file paths already handled,
+            as in the upload plan. Defaults to None.
+        list_ignore_pattern (list[str], optional): glob patterns of file
+            paths to ignore, in addition to WATCH_IGNORE_PATTERNS.
+            Defaults to None.
+        use_events (bool, optional): False to poll even with watchdog
+            installed. Defaults to True.
+        workers (int, optional): folders listed at a time, by polls.
+            Defaults to 1.
+    """
+
+    def __init__(
+        self,
+        folder_path: Path,
+        stable_seconds: float = 5,
+        poll_interval: float = 2,
+        set_known: set = None,
+        list_ignore_pattern: list = None,
+        use_events: bool = True,
+        workers: int = 1,
+    ):
+
+        self.folder_path = Path(folder_path).absolute()
+        self.stable_seconds = stable_seconds
+        self.poll_interval = poll_interval
+        self.set_known = set(set_known or [])
+        self.list_ignore_pattern = WATCH_IGNORE_PATTERNS + list(
+            list_ignore_pattern or []
+        )
+        self.use_events = use_events
+        self.workers = workers
+        # file path: (size, mtime_ns, time of last change)
+        self.dict_pending = {}
+        self.set_event_path = set()
+        self.lock = threading.Lock()
+        self.observer = None
+        self.scan_all = True
+
+    def __enter__(self):
+
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+
+        self.stop()
+
+    def start(self):
+        """Start the watch by events, if watchdog is installed"""
+
+        if not self.use_events:
+            return
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            logging.warning(
+                "watchdog not installed. Polling folder every "
+                f"{self.poll_interval}s. pip install watchdog for events"
+            )
+            return
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+
+                if event.is_directory:
+                    # files moved in with their folder have no own event
+                    if event.event_type in ["created", "moved"]:
+                        watcher.scan_all = True
+                    return
+                file_path = getattr(event, "dest_path", "") or event.src_path
+                with watcher.lock:
+                    watcher.set_event_path.add(file_path)
+
+        self.observer = Observer()
+        self.observer.schedule(
+            Handler(), str(self.folder_path), recursive=True
+        )
+        self.observer.start()
+
+    def stop(self):
+
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+            self.observer = None
+
+    def is_ignored(self, file_path: str) -> bool:
+
+        return any(
+            fnmatch.fnmatch(file_path, pattern)
+            for pattern in self.list_ignore_pattern
+        )
+
+    def get_candidates(self) -> list[str]:
+        """Paths to check: new files of a folder listing, when polling or
+        after a folder event, or files of events"""
+
+        with self.lock:
+            set_candidate = self.set_event_path
+            self.set_event_path = set()
+        if self.scan_all or self.observer is None:
+            self.scan_all = False
+            set_candidate.update(
+                str(file_path)
+                for file_path in iter_file_path(
+                    self.folder_path, workers=self.workers
+                )
+            )
+        set_candidate.update(self.dict_pending)
+        return [
+            file_path
+            for file_path in set_candidate
+            if file_path not in self.set_known
+            and not self.is_ignored(file_path)
+        ]
+
+    def poll(self) -> list[Path]:
+        """Check new files once
+
+        Returns:
+            list[Path]: files that became stable, sorted naturally
+        """
+
+        now = time.monotonic()
+        list_stable = []
+        for file_path in self.get_candidates():
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                # removed or renamed before it was stable
+                self.dict_pending.pop(file_path, None)
+                continue
+            state = (stat.st_size, stat.st_mtime_ns)
+            pending = self.dict_pending.get(file_path)
+            if pending is None or pending[:2] != state:
+                self.dict_pending[file_path] = (*state, now)
+                continue
+            if now - pending[2] >= self.stable_seconds:
+                del self.dict_pending[file_path]
+                self.set_known.add(file_path)
+                list_stable.append(Path(file_path))
+        return natsort_path(list_stable) if list_stable else []
+
+    def iter_stable(self):
+        """Yields files as they become stable, until interrupted
+
+        Yields:
+            list[Path]: files that became stable in a poll
+        """
+
+        while True:
+            list_stable = self.poll()
+            if list_stable:
+                yield list_stable
+            else:
+                time.sleep(self.poll_interval)
@@ -0,0 +1,268 @@
+"""
+Rate limiter for telegram requests.
+
+Requests are paced by one token bucket per method class (uploads, messages
+and admin actions), to stay below telegram limits. When telegram still
+answers with a FloodWait, the whole class waits exactly the time asked.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+
+from .watchdog import watchdog_paused
+
+METHOD_CLASSES = ["upload", "message", "admin"]
+
+# method class: (requests per minute, burst)
+DEFAULT_RATE_LIMITS = {
+    "upload": (20, 3),
+    "message": (20, 5),
+    "admin": (10, 2),
+}
+
+
+def get_flood_wait_seconds(error: Exception):
+    """Returns the wait asked by telegram in a flood error
+
+    Args:
+        error (Exception): error raised by a pyrogram request
+
+    Returns:
+        int | None: seconds to wait. None if error is not a flood wait
+    """
+
+    from pyrogram.errors import Flood, SlowmodeWait
+
+    if isinstance(error, (Flood, SlowmodeWait)) and isinstance(
+        getattr(error, "value", None), int
+    ):
+        return error.value
+    return None
+
+
+class TokenBucket:
+    """Token bucket, safe to share between threads and asyncio tasks.
+    Each request reserves one token, waiting while the bucket is in debt.
+
+    Args:
+        rate_per_minute (float): tokens added by minute
+        burst (int, optional): maximum of tokens stored. Defaults to 1.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int = 1):
+
+        self.rate = rate_per_minute / 60
+        self.burst = max(1, int(burst))
+        self.tokens = float(self.burst)
+        self.time_refill = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def refill(self, now: float):
+
+        if now <= self.time_refill:
+            return
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.time_refill) * self.rate
+        )
+        self.time_refill = now
+
+    def reserve(self, tokens: int = 1) -> float:
+        """Take tokens, even if not available yet
+
+        Returns:
+            float: seconds to wait before the request
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            self.refill(now)
+            self.tokens -= tokens
+            wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+            return max(wait, self.blocked_until - now)
+
+    def get_blocked_seconds(self) -> float:
+
+        return max(0.0, self.blocked_until - time.monotonic())
+
+    def block(self, seconds: float):
+        """Stop the bucket for some seconds. Refill restarts at the end,
+        so waiting requests are released at the bucket pace
+
+        Args:
+            seconds (float): seconds to wait
+        """
+
+        with self.lock:
+            blocked_until = time.monotonic() + seconds
+            if blocked_until <= self.blocked_until:
+                return
+            self.blocked_until = blocked_until
+            self.tokens = min(self.tokens, 0.0)
+            self.time_refill = blocked_until
+
+    def acquire(self):
+
+        wait = self.reserve()
+        while wait > 0:
+            time.sleep(wait)
+            wait = self.get_blocked_seconds()
+
+    async def acquire_async(self):
+
+        wait = self.reserve()
+        if wait <= 0:
+            return
+        # not upload time, for the watchdog of the upload
+        with watchdog_paused():
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = self.get_blocked_seconds()
+
+
+class RateLimiter:
+    """Token buckets by method class, aware of telegram FloodWait
+
+    Args:
+        dict_rate_limit (dict[str, tuple[float, int]], optional):
+            method class: (requests per minute, burst).
+            Defaults to None, to use DEFAULT_RATE_LIMITS.
+    """
+
+    def __init__(self, dict_rate_limit: dict = None):
+
+        self.dict_rate_limit = dict(DEFAULT_RATE_LIMITS)
+        self.dict_rate_limit.update(dict_rate_limit or {})
+        self.dict_bucket = {
+            method_class: TokenBucket(rate_per_minute, burst)
+            for method_class, (
+                rate_per_minute,
+                burst,
+            ) in self.dict_rate_limit.items()
+        }
+
+    def get_bucket(self, method_class: str) -> TokenBucket:
+
+        if method_class not in self.dict_bucket:
+            raise ValueError(f"Unknown method class: {method_class}")
+        return self.dict_bucket[method_class]
+
+    def acquire(self, method_class: str):
+
+        self.get_bucket(method_class).acquire()
+
+    async def acquire_async(self, method_class: str):
+
+        await self.get_bucket(method_class).acquire_async()
+
+    def on_flood_wait(self, method_class: str, seconds: float):
+
+        logging.warning(
+            f"FloodWait of {seconds}s in '{method_class}' requests. Waiting..."
+        )
+        self.get_bucket(method_class).block(seconds)
+
+    def handle_error(self, method_class: str, error: Exception) -> bool:
+        """Block the method class if error is a flood wait
+
+        Returns:
+            bool: True if error was a flood wait, to repeat the request
+        """
+
+        seconds = get_flood_wait_seconds(error)
+        if seconds is None:
+            return False
+        self.on_flood_wait(method_class, seconds)
+        return True
+
+    def call(self, method_class: str, func_, *args, **kwargs):
+        """Run a request at the pace of its method class.
+        The request is repeated after each FloodWait.
+
+        Args:
+            method_class (str): upload, message or admin
+            func_ (function): pyrogram sync method
+
+        Returns:
+            type undefined: func_ return
+        """
+
+        while True:
+            self.acquire(method_class)
+            try:
+                return func_(*args, **kwargs)
+            except Exception as e:
+                if not self.handle_error(method_class, e):
+                    raise
+
+    async def call_async(self, method_class: str, func_, *args, **kwargs):
+        """Run a request at the pace of its method class.
+        The request is repeated after each FloodWait.
+
+        Args:
+            method_class (str): upload, message or admin
+            func_ (function): pyrogram async method
+
+        Returns:
+            type undefined: func_ return
+        """
+
+        while True:
+            await self.acquire_async(method_class)
+            try:
+                return await func_(*args, **kwargs)
+            except Exception as e:
+                if not self.handle_error(method_class, e):
+                    raise
+
+
+def get_dict_rate_limit(dict_config: dict) -> dict:
+    """Read rate limits from config. e.g.: rate_limit_upload = 20
+
+    Args:
+        dict_config (dict): configuration data
+
+    Returns:
+        dict[str, tuple[float, int]]: method class: (per minute, burst)
+    """
+
+    dict_rate_limit = {}
+    for method_class, (rate, burst) in DEFAULT_RATE_LIMITS.items():
+        value = dict_config.get(f"rate_limit_{method_class}")
+        if value:
+            dict_rate_limit[method_class] = (float(value), burst)
+    return dict_rate_limit
+
+
+# limits are by account. One rate limiter by session name
+_dict_rate_limit = {}
+_dict_rate_limiter = {}
+
+
+def configure_rate_limiter(dict_config: dict):
+    """Set the limits of the shared rate limiters from config"""
+
+    global _dict_rate_limit
+    _dict_rate_limit = get_dict_rate_limit(dict_config)
+    _dict_rate_limiter.clear()
+
+
+def get_rate_limiter(account: str = None) -> RateLimiter:
+    """Returns the rate limiter of an account, shared by the sync and
+    async api
+
+    Args:
+        account (str, optional): session name of the account.
+            Defaults to None.
+
+    Returns:
+        RateLimiter: rate limiter of the account
+    """
+
+    if account not in _dict_rate_limiter:
+        _dict_rate_limiter[account] = RateLimiter(_dict_rate_limit)
+    return _dict_rate_limiter[account]
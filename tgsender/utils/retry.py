@@ -0,0 +1,227 @@
+"""
+Retry policy for telegram requests.
+
+Errors are classified as rate limit, transient, permanent or fatal.
+Rate limits wait the time asked by telegram, transient errors are retried
+with exponential backoff and jitter up to a maximum of attempts, permanent
+errors fail at once and fatal errors stop the run. Items that fail are left
+to the caller, to be recorded as dead letters in the upload plan.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+
+from .rate_limit import get_flood_wait_seconds
+
+ERROR_RATE_LIMIT = "rate_limit"
+ERROR_TRANSIENT = "transient"
+ERROR_PERMANENT = "permanent"
+ERROR_FATAL = "fatal"
+
+# bad requests raised by a broken upload, that a new upload can fix
+TRANSIENT_BAD_REQUESTS = [
+    "FilePartMissing",
+    "FilePart0Missing",
+    "FilePartEmpty",
+    "FilePartInvalid",
+    "FilePartSizeChanged",
+]
+
+
+def is_broken_upload(error: Exception) -> bool:
+    """True if telegram lost parts of the upload. Parts in the resume
+    checkpoint must be uploaded again"""
+
+    return type(error).__name__ in TRANSIENT_BAD_REQUESTS
+
+
+class RetryError(Exception):
+    """Request failed with a permanent error or out of attempts
+
+    Args:
+        error (Exception): last error of the request
+        error_class (str): permanent or transient
+        attempts (int): number of attempts made
+    """
+
+    def __init__(self, error: Exception, error_class: str, attempts: int):
+
+        super().__init__(f"{error_class} error after {attempts} attempts")
+        self.error = error
+        self.error_class = error_class
+        self.attempts = attempts
+
+    def __reduce__(self):
+
+        return (type(self), (self.error, self.error_class, self.attempts))
+
+    def __str__(self):
+
+        return (
+            f"{type(self.error).__name__}: {self.error} "
+            f"({self.error_class}, {self.attempts} attempts)"
+        )
+
+
+def classify_error(error: Exception) -> str:
+    """Classify an error raised by a telegram request
+
+    Args:
+        error (Exception): error raised
+
+    Returns:
+        str: rate_limit, transient, permanent or fatal
+    """
+
+    if get_flood_wait_seconds(error) is not None:
+        return ERROR_RATE_LIMIT
+
+    from pyrogram import errors
+
+    if isinstance(error, errors.Unauthorized):
+        return ERROR_FATAL
+    if is_broken_upload(error):
+        return ERROR_TRANSIENT
+    if isinstance(
+        error, (errors.BadRequest, errors.Forbidden, errors.NotAcceptable)
+    ):
+        return ERROR_PERMANENT
+    # missing file or media without valid metadata
+    if isinstance(error, (FileNotFoundError, ValueError)):
+        return ERROR_PERMANENT
+    return ERROR_TRANSIENT
+
+
+class RetryPolicy:
+    """Retry requests by error class, with exponential backoff and jitter
+
+    Args:
+        max_attempts (int, optional): attempts for transient errors.
+            Defaults to 5.
+        base_delay (float, optional): seconds before the second attempt.
+            Defaults to 5.
+        max_delay (float, optional): maximum seconds between attempts.
+            Defaults to 300.
+        jitter (float, optional): fraction of the delay drawn at random,
+            to not retry many uploads at once. Defaults to 0.5.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 5,
+        base_delay: float = 5,
+        max_delay: float = 300,
+        jitter: float = 0.5,
+    ):
+
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+        self.jitter = min(1.0, max(0.0, float(jitter)))
+
+    @classmethod
+    def from_config(cls, dict_config: dict) -> RetryPolicy:
+        """Read policy from config. Keys: retry_max_attempts,
+        retry_base_delay and retry_max_delay"""
+
+        dict_param = {}
+        for key in ["max_attempts", "base_delay", "max_delay"]:
+            value = dict_config.get(f"retry_{key}")
+            if value:
+                dict_param[key] = float(value)
+        return cls(**dict_param)
+
+    def get_delay(self, attempt: int) -> float:
+        """Seconds to wait after a failed attempt
+
+        Args:
+            attempt (int): number of the failed attempt, from 1
+
+        Returns:
+            float: seconds to wait
+        """
+
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay * (1 - self.jitter * random.random())
+
+    def get_wait(self, error: Exception, attempt: int, label: str = ""):
+        """Decide what to do after a failed attempt
+
+        Args:
+            error (Exception): error raised by the attempt
+            attempt (int): number of transient attempts made, from 1
+            label (str, optional): request description, for log.
+
+        Raises:
+            RetryError: on permanent error or when attempts are over
+            Exception: the error itself, if fatal
+
+        Returns:
+            tuple[float, bool]: seconds to wait and True if the attempt
+                counts in the budget
+        """
+
+        error_class = classify_error(error)
+        if error_class == ERROR_RATE_LIMIT:
+            return get_flood_wait_seconds(error), False
+        if error_class == ERROR_FATAL:
+            raise error
+        if error_class == ERROR_PERMANENT or attempt >= self.max_attempts:
+            raise RetryError(error, error_class, attempt) from error
+        delay = self.get_delay(attempt)
+        logging.warning(
+            f"{label} {type(error).__name__}: {error}. "
+            f"Attempt {attempt}/{self.max_attempts}. "
+            f"Trying again in {delay:.0f}s..."
+        )
+        return delay, True
+
+    def call(self, func_, *args, label: str = "", **kwargs):
+        """Run a sync function, retrying it by the policy
+
+        Args:
+            func_ (function): function to run
+            label (str, optional): request description, for log.
+
+        Raises:
+            RetryError: on permanent error or when attempts are over
+
+        Returns:
+            type undefined: func_ return
+        """
+
+        attempt = 1
+        while True:
+            try:
+                return func_(*args, **kwargs)
+            except Exception as e:
+                delay, counts = self.get_wait(e, attempt, label)
+            time.sleep(delay)
+            attempt += counts
+
+    async def call_async(self, func_, *args, label: str = "", **kwargs):
+        """Run an async function, retrying it by the policy
+
+        Args:
+            func_ (function): async function to run
+            label (str, optional): request description, for log.
+
+        Raises:
+            RetryError: on permanent error or when attempts are over
+
+        Returns:
+            type undefined: func_ return
+        """
+
+        attempt = 1
+        while True:
+            try:
+                return await func_(*args, **kwargs)
+            except Exception as e:
+                delay, counts = self.get_wait(e, attempt, label)
+            await asyncio.sleep(delay)
+            attempt += counts
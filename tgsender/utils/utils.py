@@ -6,33 +6,6 @@ import os
 from hashlib import md5
 from pathlib import Path
 
-import natsort
-import unidecode
-
-
-def create_thumb(file_path):
-    """Create thumbnail from video file path using ffmpeg CLI
-
-    Args:
-        file_path (str): video file path
-
-    Returns:
-        str: created thumbnail file path
-    """
-
-    path_dir = os.path.split(file_path)[0]
-    file_name = os.path.basename(file_path)
-    file_name_without_extension = os.path.splitext(file_name)[0]
-    file_name_output = file_name_without_extension + ".jpg"
-    file_path_output = os.path.join(path_dir, file_name_output)
-    if os.path.exists(file_path_output):
-        os.remove(file_path_output)
-    # create thumb
-    os.system(
-        f'ffmpeg -v quiet -stats -y -i "{file_path}" -vframes 1 "{file_path_output}"'
-    )
-    return file_path_output
-
 
 def create_txt(file_path, stringa):
 
@@ -97,7 +70,10 @@ def get_log_file_path(
 
 
 def log_send_return(
-    return_message: str, file_path: Path, log_file_path: Path
+    return_message: str,
+    file_path: Path,
+    log_file_path: Path,
+    dict_extra: dict = None,
 ) -> bool:
     """Save json file of pyrogram message return from send_file method
     with additional key 'file_origin', that is the path of file that was sent
@@ -106,19 +82,127 @@ def log_send_return(
         return_message (str): pyrogram message return
         file_path (Path): path of file that was sent
         log_file_path (Path): json file of sent log
+        dict_extra (dict, optional): additional keys to save.
+            e.g.: {"session_name": "user"}. Defaults to None.
     Return:
         bool: True If log_file was successfully saved
     """
 
     dict_return = json.loads(return_message)
     dict_return["file_origin"] = str(file_path)
+    if dict_extra:
+        dict_return.update(dict_extra)
     json.dump(
         dict_return, open(log_file_path, "w", encoding="utf-8"), indent=2
     )
     return log_file_path.exists()
 
 
-def get_all_file_path(folder_path: Path, sort=True) -> dict[str, list[Path]]:
+def scan_folder(folder_path) -> tuple[list[str], list[str], list[str]]:
+    """List one folder by os.scandir. The type of each entry comes from
+    the folder listing, without a stat by file, except for symlinks.
+
+    Args:
+        folder_path (str): folder path
+
+    Returns:
+        tuple[list[str], list[str], list[str]]: file paths, sub folder
+            paths and paths that could not be read
+    """
+
+    list_file_path, list_folder_path, list_error = [], [], []
+    try:
+        with os.scandir(folder_path) as iterator:
+            for entry in iterator:
+                try:
+                    if entry.is_symlink() and not os.path.exists(entry.path):
+                        logging.error("broken_link: %s", entry.path)
+                        list_error.append(entry.path)
+                    elif entry.is_dir():
+                        list_folder_path.append(entry.path)
+                    else:
+                        list_file_path.append(entry.path)
+                except OSError:
+                    logging.error("path_too_long: %s", entry.path)
+                    list_error.append(entry.path)
+    except OSError as e:
+        logging.error("Folder not readable: %s. %s", folder_path, e)
+        list_error.append(str(folder_path))
+    return list_file_path, list_folder_path, list_error
+
+
+def iter_file_path(folder_path: Path, list_error: list = None, workers=1):
+    """Yields all file paths inside a folder, recursively, as they are
+    found. Iterative, so deep trees do not hit the recursion limit.
+
+    Args:
+        folder_path (Path): folder path
+        list_error (list, optional): receives paths that could not be
+            read. Defaults to None.
+        workers (int, optional): folders listed at a time. More than 1
+            speeds up network filesystems, where each listing waits for
+            the server, and yields files out of folder order.
+            Defaults to 1.
+
+    Yields:
+        Path: file path
+    """
+
+    if list_error is None:
+        list_error = []
+    if workers <= 1:
+        list_folder_path = [str(folder_path)]
+        while list_folder_path:
+            list_file_path, list_sub_folder_path, list_error_folder = (
+                scan_folder(list_folder_path.pop())
+            )
+            list_error.extend(Path(x) for x in list_error_folder)
+            # keep folder order, popping from the end
+            list_folder_path.extend(reversed(list_sub_folder_path))
+            for file_path in list_file_path:
+                yield Path(file_path)
+        return
+
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        set_future = {executor.submit(scan_folder, str(folder_path))}
+        while set_future:
+            set_done, set_future = wait(
+                set_future, return_when=FIRST_COMPLETED
+            )
+            for future in set_done:
+                list_file_path, list_sub_folder_path, list_error_folder = (
+                    future.result()
+                )
+                list_error.extend(Path(x) for x in list_error_folder)
+                for sub_folder_path in list_sub_folder_path:
+                    set_future.add(
+                        executor.submit(scan_folder, sub_folder_path)
+                    )
+                for file_path in list_file_path:
+                    yield Path(file_path)
+
+
+def natsort_path(list_path: list[Path]) -> list[Path]:
+    """Sort paths naturally, ignoring case and accents.
+    The key of each path is computed once, before sorting."""
+
+    import natsort
+    import unidecode
+
+    natsort_key = natsort.natsort_keygen()
+    list_key = [
+        natsort_key(unidecode.unidecode(str(path).lower()))
+        for path in list_path
+    ]
+    list_order = sorted(range(len(list_path)), key=list_key.__getitem__)
+    return [list_path[index] for index in list_order]
+
+
+def get_all_file_path(
+    folder_path: Path, sort=True, workers=1
+) -> dict[str, list[Path]]:
     """Returns List of all file paths inside a folder, recursively.
     Option to Sort naturally.
 
@@ -126,41 +210,25 @@ def get_all_file_path(folder_path: Path, sort=True) -> dict[str, list[Path]]:
     -----
         folder_path (Path): folder path
         sort (bool, optional): Return classified. Defaults to True.
+        workers (int, optional): folders listed at a time, for network
+            filesystems. See iter_file_path. Defaults to 1.
 
     Returns:
     --------
         dict[str, list[Path]]: keys: ['content', 'errors']. values: list[Path]
     """
 
-    def iter_folder(
-        sub_folder,
-        list_file_path: list[Path] = [],
-        list_error: list[Path] = [],
-    ) -> tuple[list[Path], list[Path]]:
-
-        for x in sub_folder.iterdir():
-            if not x.exists():
-                logging.error("path_too_long: %s", x)
-                list_error.append(x)
-                continue
-            if x.is_dir():
-                iter_folder(x, list_file_path, list_error)
-            else:
-                list_file_path.append(x)
-        return list_file_path, list_error
-
     if not folder_path.exists():
         logging.error("Folder not exists: %s", folder_path)
         raise FileNotFoundError(f"Folder not exists: {folder_path}")
 
-    list_file_path, list_error = iter_folder(folder_path)
+    list_error = []
+    list_file_path = list(
+        iter_file_path(folder_path, list_error, workers=workers)
+    )
 
     if sort:
-        list_file_path = natsort.natsorted(
-            list_file_path, lambda x: unidecode.unidecode(str(x).lower())
-        )
-        list_error = natsort.natsorted(
-            list_error, lambda x: unidecode.unidecode(str(x).lower())
-        )
+        list_file_path = natsort_path(list_file_path)
+        list_error = natsort_path(list_error)
 
     return {"content": list_file_path, "errors": list_error}
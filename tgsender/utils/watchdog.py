@@ -0,0 +1,278 @@
+"""
+In-process watchdog of uploads, fed by the pyrogram progress callback.
+
+An upload is aborted only when no bytes moved for a while (stall), or when
+it takes much longer than expected for its size, at the throughput measured
+on previous uploads (deadline). No process is spawned by file.
+
+The clocks are paused while the upload waits on the rate limiter, as in a
+FloodWait, or probes its media, so only time spent uploading is counted.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+
+# watchdog of the upload running in the current task
+_current_watchdog = contextvars.ContextVar("upload_watchdog", default=None)
+
+
+class UploadStalled(TimeoutError):
+    """Upload aborted by the watchdog"""
+
+
+class ThroughputMeter:
+    """Moving average of upload throughput, in bytes per second
+
+    Args:
+        alpha (float, optional): weight of the last upload.
+            Defaults to 0.3.
+    """
+
+    def __init__(self, alpha: float = 0.3):
+
+        self.alpha = alpha
+        self.bytes_per_second = None
+        self.lock = threading.Lock()
+
+    def add(self, count_bytes: int, seconds: float):
+
+        if count_bytes <= 0 or seconds <= 0:
+            return
+        bytes_per_second = count_bytes / seconds
+        with self.lock:
+            if self.bytes_per_second is None:
+                self.bytes_per_second = bytes_per_second
+            else:
+                self.bytes_per_second = (
+                    self.alpha * bytes_per_second
+                    + (1 - self.alpha) * self.bytes_per_second
+                )
+
+    def get_expected_seconds(self, count_bytes: int):
+        """Seconds expected to upload count_bytes. None if not measured"""
+
+        if self.bytes_per_second is None:
+            return None
+        return count_bytes / self.bytes_per_second
+
+
+throughput_meter = ThroughputMeter()
+
+
+class UploadWatchdog:
+    """Abort an upload that stalls or that overruns its deadline
+
+    Args:
+        stall_seconds (float, optional): maximum seconds without progress.
+            Defaults to 120.
+        min_deadline (float, optional): minimum seconds of the overall
+            deadline. Defaults to None, for no overall deadline.
+        deadline_factor (float, optional): overall deadline as a multiple
+            of the time expected by the measured throughput. Defaults to 3.
+        meter (ThroughputMeter, optional): Defaults to None, to use the
+            meter shared by the process.
+    """
+
+    def __init__(
+        self,
+        stall_seconds: float = 120,
+        min_deadline: float = None,
+        deadline_factor: float = 3,
+        meter: ThroughputMeter = None,
+    ):
+
+        self.stall_seconds = stall_seconds
+        self.min_deadline = min_deadline
+        self.deadline_factor = deadline_factor
+        self.meter = meter or throughput_meter
+        self.time_start = None
+        self.time_progress = None
+        self.time_first_progress = None
+        self.bytes_first_progress = 0
+        self.bytes_current = 0
+        self.count_pause = 0
+        self.time_pause = None
+
+    def start(self):
+
+        self.time_start = time.monotonic()
+        self.time_progress = self.time_start
+        self.time_first_progress = None
+        self.bytes_first_progress = 0
+        self.bytes_current = 0
+        self.count_pause = 0
+        self.time_pause = None
+
+    def pause(self):
+        """Stop the clocks, while the upload waits for something else
+        than the network. Pauses may be nested"""
+
+        if self.count_pause == 0:
+            self.time_pause = time.monotonic()
+        self.count_pause += 1
+
+    def resume(self):
+
+        self.count_pause -= 1
+        if self.count_pause > 0:
+            return
+        seconds_paused = time.monotonic() - self.time_pause
+        self.time_start += seconds_paused
+        self.time_progress += seconds_paused
+        self.time_pause = None
+
+    def progress(self, current: int, total: int):
+        """Progress callback. Pyrogram may call it from a thread"""
+
+        now = time.monotonic()
+        if self.time_first_progress is None:
+            # the stall clock starts with the upload itself
+            self.time_first_progress = now
+            self.bytes_first_progress = current
+            self.time_progress = now
+        if current > self.bytes_current:
+            self.bytes_current = current
+            self.time_progress = now
+
+    def wrap_progress(self, progress=None):
+        """Returns a progress callback that feeds the watchdog
+
+        Args:
+            progress (function, optional): progress callback to keep.
+                Defaults to None.
+        """
+
+        def progress_watched(current, total, *args):
+
+            self.progress(current, total)
+            if progress is not None:
+                progress(current, total, *args)
+
+        return progress_watched
+
+    def get_deadline_seconds(self, file_size: int):
+        """Overall deadline for the upload of file_size bytes
+
+        Returns:
+            float | None: seconds. None while throughput is not measured
+        """
+
+        expected_seconds = self.meter.get_expected_seconds(file_size)
+        if expected_seconds is None or self.min_deadline is None:
+            return None
+        return max(self.min_deadline, self.deadline_factor * expected_seconds)
+
+    def check(self, deadline_seconds=None):
+        """Raise UploadStalled if upload stalled or is over deadline"""
+
+        if self.count_pause:
+            return
+        now = time.monotonic()
+        seconds_stalled = now - self.time_progress
+        if seconds_stalled > self.stall_seconds:
+            raise UploadStalled(
+                f"No upload progress for {seconds_stalled:.0f}s, "
+                f"at {self.bytes_current} bytes"
+            )
+        seconds_elapsed = now - self.time_start
+        if deadline_seconds is not None and seconds_elapsed > deadline_seconds:
+            raise UploadStalled(
+                f"Upload took more than {deadline_seconds:.0f}s, "
+                f"at {self.bytes_current} bytes"
+            )
+
+    def measure(self):
+        """Add the throughput of the finished upload to the meter"""
+
+        if self.time_first_progress is None:
+            return
+        self.meter.add(
+            self.bytes_current - self.bytes_first_progress,
+            self.time_progress - self.time_first_progress,
+        )
+
+    async def run(
+        self,
+        coroutine,
+        file_size: int,
+        check_interval: float = 1,
+        cancel_timeout: float = 10,
+    ):
+        """Run an upload under the watchdog
+
+        Args:
+            coroutine (Coroutine): upload, with progress from
+                wrap_progress
+            file_size (int): bytes to upload
+            check_interval (float, optional): seconds between checks.
+                Defaults to 1.
+            cancel_timeout (float, optional): seconds to wait for the
+                upload to stop, after cancelled. Defaults to 10.
+
+        Raises:
+            UploadStalled: if upload was aborted
+
+        Returns:
+            type undefined: coroutine return
+        """
+
+        self.start()
+        deadline_seconds = self.get_deadline_seconds(file_size)
+        # the task sees this watchdog, to pause it while waiting
+        token = _current_watchdog.set(self)
+        try:
+            task = asyncio.ensure_future(coroutine)
+        finally:
+            _current_watchdog.reset(token)
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=check_interval)
+                if done:
+                    result = task.result()
+                    self.measure()
+                    return result
+                self.check(deadline_seconds)
+        except UploadStalled as e:
+            logging.warning(f"Upload aborted. {e}")
+            await cancel_task(task, cancel_timeout)
+            raise
+        except BaseException:
+            await cancel_task(task, cancel_timeout)
+            raise
+
+
+@contextlib.contextmanager
+def watchdog_paused():
+    """Pause the watchdog of the current upload, if any, while waiting
+    the rate limiter or probing media"""
+
+    watchdog = _current_watchdog.get()
+    if watchdog is None:
+        yield
+        return
+    watchdog.pause()
+    try:
+        yield
+    finally:
+        watchdog.resume()
+
+
+async def cancel_task(task, timeout: float = 10, max_cancel: int = 3):
+    """Cancel a task and wait for it to stop.
+    Cancel is repeated, as an upload may be waiting its parts to finish."""
+
+    for _ in range(max_cancel):
+        if task.done():
+            break
+        task.cancel()
+        await asyncio.wait({task}, timeout=timeout)
+    if not task.done():
+        logging.error("Upload task did not stop after cancel")
+    elif not task.cancelled() and task.exception() is not None:
+        logging.warning(f"Upload stopped with error: {task.exception()}")